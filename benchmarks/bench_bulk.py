@@ -0,0 +1,67 @@
+"""
+Benchmark: vectorized bulk geolocation (ip_bulk.lookup_many) versus a per-IP loop.
+
+Builds a synthetic IPv4 range table, resolves a batch of random addresses both
+ways and prints lookups per second for each.
+
+    python benchmarks/bench_bulk.py --ranges 200000 --ips 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from ip_bulk import lookup_many
+from ip_ranges import RangeTable
+
+
+def synthetic_table(count, seed=1):
+    """Split the IPv4 space into count contiguous ranges with a few repeated locations."""
+    rng = random.Random(seed)
+    bounds = sorted(rng.sample(range(1, 2 ** 32), count - 1))
+    starts = [0] + bounds
+    ends = [b - 1 for b in bounds] + [2 ** 32 - 1]
+    countries = ["US", "DE", "JP", "BR", "AU", "ZA", "IN", "FR"]
+    rows = ({"start": str(s), "end": str(e), "country": rng.choice(countries),
+             "city": f"City{rng.randrange(5000)}", "asn": f"AS{rng.randrange(1, 65000)}"}
+            for s, e in zip(starts, ends))
+    return RangeTable.from_rows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ranges", type=int, default=200000)
+    parser.add_argument("--ips", type=int, default=1000000)
+    parser.add_argument("--loop-ips", type=int, default=100000, help="Addresses resolved by the per-IP loop")
+    args = parser.parse_args()
+
+    table = synthetic_table(args.ranges)
+    keys = np.random.default_rng(2).integers(0, 2 ** 32, size=args.ips, dtype=np.uint64)
+    ips = [f"{k >> 24}.{(k >> 16) & 255}.{(k >> 8) & 255}.{k & 255}" for k in keys.tolist()]
+
+    start = time.perf_counter()
+    result = lookup_many(ips, table=table)
+    bulk_seconds = time.perf_counter() - start
+    assert result["found"].all()
+
+    sample = ips[:args.loop_ips]
+    start = time.perf_counter()
+    for ip in sample:
+        table.lookup(ip)
+    loop_seconds = time.perf_counter() - start
+
+    bulk_rate = args.ips / bulk_seconds
+    loop_rate = len(sample) / loop_seconds
+    print(f"ranges: {args.ranges}")
+    print(f"lookup_many: {args.ips} IPs in {bulk_seconds:.3f}s ({bulk_rate:,.0f} lookups/s)")
+    print(f"per-IP loop: {len(sample)} IPs in {loop_seconds:.3f}s ({loop_rate:,.0f} lookups/s)")
+    print(f"speedup: {bulk_rate / loop_rate:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
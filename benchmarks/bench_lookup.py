@@ -0,0 +1,296 @@
+"""
+Benchmark: the single-IP lookup path against a local stub upstream.
+
+Measures get_ip_info through the primary provider, the fallback path, the
+cache layers (in-process cache, SQLite store, offline range table) and the
+provider-answer normalization, then writes machine-readable results that can
+be compared across commits:
+
+    python benchmarks/bench_lookup.py --latency 0.02 --output before.json
+    python benchmarks/bench_lookup.py --latency 0.02 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import ip_log
+import ip_lookup
+from ip_cache import PrefixCache, TTLCache
+from ip_flight import SingleFlight
+from ip_guard import ProviderGuard
+from ip_ranges import RangeTable
+from ip_store import LookupStore
+from stub_upstream import StubUpstream, ip_api_body, ipapi_body
+
+# Result format version, bumped when fields change meaning
+SCHEMA_VERSION = 1
+
+
+def unique_ips(prefix, count):
+    """count distinct documentation-range addresses, so nothing is cached between scenarios."""
+    return [f"{prefix}.{i // 256 % 256}.{i % 256}" for i in range(count)]
+
+
+@contextlib.contextmanager
+def lookup_state(**overrides):
+    """Run with fresh caches, no store or range table, and the given ip_lookup attributes overridden."""
+    state = dict(STORE_PATH="", RANGES_PATH="", _range_table=None, HEDGE_ENABLED=False,
+                 ip_info_cache=TTLCache(maxsize=100000, ttl=3600),
+                 PREFIX_CACHE_ENABLED=False, ip_prefix_cache=PrefixCache(maxsize=100000),
+                 ip_flight=SingleFlight(),
+                 _provider_guard=ProviderGuard(None, failure_threshold=10 ** 9))
+    state.update(overrides)
+    saved = {name: getattr(ip_lookup, name) for name in state}
+    for name, value in state.items():
+        setattr(ip_lookup, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(ip_lookup, name, value)
+
+
+def timed_calls(fn, args):
+    """Call fn on each argument and return the per-call durations in seconds."""
+    durations = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(arg)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def timed_loop(fn, iterations):
+    """Time a tight loop of a cheap call; returns per-call durations averaged over batches of 100."""
+    durations = []
+    batches = max(1, iterations // 100)
+    for _ in range(batches):
+        start = time.perf_counter()
+        for _ in range(100):
+            fn()
+        durations.append((time.perf_counter() - start) / 100)
+    return durations
+
+
+def bench_primary(stub, n, hedged=False):
+    stub.rate_limit_rate = 0.0
+    with lookup_state(HEDGE_ENABLED=hedged):
+        return timed_calls(ip_lookup.get_ip_info, unique_ips("198.18", n))
+
+
+def bench_fallback(stub, n):
+    """Every lookup gets ipapi.co's rate-limit body and is answered by ip-api.com."""
+    stub.rate_limit_rate = 1.0
+    # A zero cooldown keeps the breaker half-open, so every lookup still probes the primary
+    with lookup_state(_provider_guard=ProviderGuard(None, cooldown=0)):
+        durations = timed_calls(ip_lookup.get_ip_info, unique_ips("198.19", n))
+    stub.rate_limit_rate = 0.0
+    return durations
+
+
+def bench_breaker_open(stub, n):
+    """ipapi.co is rate-limited and its breaker open, so lookups go straight to ip-api.com."""
+    stub.rate_limit_rate = 1.0
+    with lookup_state(_provider_guard=ProviderGuard(None, cooldown=3600)):
+        ip_lookup.get_ip_info("198.18.255.1")
+        durations = timed_calls(ip_lookup.get_ip_info, unique_ips("198.18.254", n))
+    stub.rate_limit_rate = 0.0
+    return durations
+
+
+def bench_concurrent(stub, n, workers=16):
+    stub.rate_limit_rate = 0.0
+    ips = unique_ips("198.18.200", n)
+    with lookup_state():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda ip: timed_calls(ip_lookup.get_ip_info, [ip])[0], ips))
+
+
+def bench_prefix_traffic(stub, n, prefixes=8):
+    """Distinct addresses spread over a few /24s with the prefix tier on; also reports hit ratios."""
+    stub.rate_limit_rate = 0.0
+    ips = [f"198.18.{i % prefixes}.{i // prefixes % 256}" for i in range(n)]
+    with lookup_state(PREFIX_CACHE_ENABLED=True):
+        durations = timed_calls(ip_lookup.get_ip_info, ips)
+        report = ip_lookup.cache_hit_report()
+    return durations, {"exact_hit_ratio": report["exact_hit_ratio"],
+                       "combined_hit_ratio": report["combined_hit_ratio"]}
+
+
+def bench_memory_hit(n):
+    ips = unique_ips("203.0", min(n, 1000))
+    cache = TTLCache(maxsize=len(ips), ttl=3600)
+    for ip in ips:
+        cache.set(ip, ipapi_body(ip))
+    with lookup_state(ip_info_cache=cache):
+        return timed_calls(ip_lookup.get_ip_info, (ips * (n // len(ips) + 1))[:n])
+
+
+def bench_store_hit(n):
+    ips = unique_ips("203.0", min(n, 1000))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lookups.db")
+        store = LookupStore(path)
+        for ip in ips:
+            store.set(ip, ipapi_body(ip), ip_lookup.PROVIDER_IPAPI)
+        # A zero-size in-process cache sends every lookup to the store
+        with lookup_state(STORE_PATH=path, _lookup_store=store, ip_info_cache=TTLCache(maxsize=0, negative_maxsize=0)):
+            durations = timed_calls(ip_lookup.get_ip_info, (ips * (n // len(ips) + 1))[:n])
+        store.close()
+    return durations
+
+
+def bench_range_hit(n, ranges=100000):
+    step = 2 ** 32 // ranges
+    table = RangeTable.from_rows({"start": str(i * step), "end": str((i + 1) * step - 1),
+                                  "country": "US", "city": f"City{i % 500}"} for i in range(ranges))
+    ips = unique_ips("100.64", n)
+    with lookup_state(RANGES_PATH="<benchmark>", _range_table=table):
+        return timed_calls(ip_lookup.get_ip_info, ips)
+
+
+def bench_normalize_ip_api(n):
+    body = ip_api_body("192.0.2.1")
+    return timed_loop(lambda: ip_lookup._map_ip_api(body, "192.0.2.1"), n)
+
+
+def bench_normalize_ipapi(n):
+    body = ipapi_body("192.0.2.1")
+    return timed_loop(lambda: ip_lookup.interpret_ipapi(body, "192.0.2.1"), n)
+
+
+def summarize(durations):
+    """Latency summary in milliseconds, plus calls per second."""
+    ordered = sorted(durations)
+    count = len(ordered)
+
+    def percentile(p):
+        return ordered[min(count - 1, int(count * p / 100))] * 1000
+
+    total = sum(ordered)
+    return {
+        "n": count,
+        "mean_ms": total / count * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "ops_per_sec": count / total if total else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print p50 changes against a baseline run; return the names that regressed past threshold."""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        change = current["p50_ms"] / before["p50_ms"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"  {name:<28} {before['p50_ms']:10.4f} -> {current['p50_ms']:10.4f} ms  ({change:+.1%}){flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--iterations", type=int, default=200, help="Lookups per network scenario")
+    parser.add_argument("--local-iterations", type=int, default=20000, help="Calls per local scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random stub latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests failing with HTTP 500")
+    parser.add_argument("--only", nargs="*", help="Run only these scenarios")
+    parser.add_argument("-o", "--output", default="bench_lookup.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="p50 slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    n, local = args.iterations, args.local_iterations
+    stub = StubUpstream(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=1)
+    scenarios = {
+        "get_ip_info_primary": lambda: bench_primary(stub, n),
+        "get_ip_info_primary_hedged": lambda: bench_primary(stub, n, hedged=True),
+        "get_ip_info_fallback": lambda: bench_fallback(stub, n),
+        "get_ip_info_breaker_open": lambda: bench_breaker_open(stub, n),
+        "get_ip_info_concurrent": lambda: bench_concurrent(stub, n),
+        "get_ip_info_prefix_traffic": lambda: bench_prefix_traffic(stub, n),
+        "cache_memory_hit": lambda: bench_memory_hit(local),
+        "cache_store_hit": lambda: bench_store_hit(local),
+        "cache_range_hit": lambda: bench_range_hit(local),
+        "normalize_ip_api": lambda: bench_normalize_ip_api(local),
+        "normalize_ipapi": lambda: bench_normalize_ipapi(local),
+    }
+    selected = [name for name in scenarios if not args.only or name in args.only]
+
+    results = {}
+    with stub:
+        original_urls = {name: getattr(ip_lookup, name) for name in
+                         ("IPIFY_V4_URL", "IPIFY_V6_URL", "IPAPI_URL", "IP_API_URL", "IP_API_BATCH_URL")}
+        stub.point(ip_lookup)
+        try:
+            for name in selected:
+                # Keep provider error logs out of the report
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    durations = scenarios[name]()
+                    ip_log.event_log.flush()
+                # Scenarios may also return extra figures, e.g. cache hit ratios
+                durations, extra = durations if isinstance(durations, tuple) else (durations, {})
+                results[name] = summarize(durations)
+                results[name].update(extra)
+                r = results[name]
+                print(f"{name:<28} n={r['n']:<6} p50={r['p50_ms']:9.4f}ms p95={r['p95_ms']:9.4f}ms "
+                      f"p99={r['p99_ms']:9.4f}ms {r['ops_per_sec']:12,.0f}/s"
+                      + "".join(f" {key}={value:.3f}" for key, value in extra.items()))
+        finally:
+            for name, value in original_urls.items():
+                setattr(ip_lookup, name, value)
+        upstream_requests = dict(stub.requests)
+
+    report = {
+        "schema": SCHEMA_VERSION,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"iterations": n, "local_iterations": local, "latency": args.latency,
+                   "jitter": args.jitter, "error_rate": args.error_rate},
+        "upstream_requests": upstream_requests,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}):")
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
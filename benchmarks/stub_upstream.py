@@ -0,0 +1,225 @@
+"""
+Local stand-in for the upstream providers, for benchmarks and offline testing.
+
+Serves ipify-, ipapi.co- and ip-api.com-shaped answers from one threaded HTTP
+server, with configurable latency, jitter, HTTP error rate and ipapi.co
+rate-limit rate:
+
+    python benchmarks/stub_upstream.py --port 8089 --latency 0.05 --rate-limit-rate 0.1
+
+then point the app at it with the printed IP_*_URL environment variables.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ipapi.co's answer once the free quota is used up (served with HTTP 200)
+IPAPI_RATE_LIMIT_BODY = {
+    "error": True,
+    "reason": "RateLimited",
+    "message": "Visit https://ipapi.co/ratelimited/ for details",
+}
+
+_CITIES = [
+    ("Mountain View", "California", "US", "United States", 37.386, -122.0838, "America/Los_Angeles", "94035"),
+    ("Frankfurt am Main", "Hesse", "DE", "Germany", 50.1109, 8.6821, "Europe/Berlin", "60311"),
+    ("Tokyo", "Tokyo", "JP", "Japan", 35.6895, 139.6917, "Asia/Tokyo", "100-0001"),
+    ("Sydney", "New South Wales", "AU", "Australia", -33.8688, 151.2093, "Australia/Sydney", "2000"),
+]
+
+
+def _location(ip):
+    """Pick a stable fake location for ip, shared by its /24 (IPv4) or /48 (IPv6) like real data."""
+    network = ":".join(ip.split(":")[:3]) if ":" in ip else ".".join(ip.split(".")[:3])
+    digest = hashlib.md5(network.encode()).digest()
+    city, region, code, country, lat, lon, tz, postal = _CITIES[digest[0] % len(_CITIES)]
+    asn = 1000 + int.from_bytes(digest[1:3], "big")
+    return {"city": city, "region": region, "country": code, "country_name": country,
+            "latitude": lat, "longitude": lon, "timezone": tz, "postal": postal,
+            "asn": f"AS{asn}", "org": f"Example Network {asn}"}
+
+
+def ipapi_body(ip):
+    """An ipapi.co /json/ answer for ip."""
+    loc = _location(ip)
+    return {"ip": ip, "network": f"{ip}/24", "version": "IPv6" if ":" in ip else "IPv4",
+            "city": loc["city"], "region": loc["region"], "country": loc["country"],
+            "country_name": loc["country_name"], "country_code": loc["country"],
+            "postal": loc["postal"], "latitude": loc["latitude"], "longitude": loc["longitude"],
+            "timezone": loc["timezone"], "asn": loc["asn"], "org": loc["org"]}
+
+
+def ip_api_body(ip):
+    """An ip-api.com /json/ answer for ip."""
+    loc = _location(ip)
+    return {"status": "success", "query": ip, "country": loc["country_name"], "countryCode": loc["country"],
+            "regionName": loc["region"], "city": loc["city"], "zip": loc["postal"],
+            "lat": loc["latitude"], "lon": loc["longitude"], "timezone": loc["timezone"],
+            "isp": loc["org"], "as": f"{loc['asn']} {loc['org']}"}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connection bursts, adding 1s SYN retransmits to the numbers
+    request_queue_size = 128
+
+
+class StubUpstream:
+    """Threaded HTTP server imitating ipify, ipapi.co and ip-api.com.
+
+    Every request sleeps latency seconds (plus up to jitter more), then fails
+    with HTTP 500 with probability error_rate. ipapi.co requests additionally
+    get its rate-limit error body with probability rate_limit_rate. Settings
+    can be changed while the server runs; request counts per provider are
+    kept in requests.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 host="127.0.0.1", port=0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        """IP_*_URL environment variables pointing the app at this stub."""
+        return {
+            "IP_IPIFY_V4_URL": f"{self.url}/ipify/v4",
+            "IP_IPIFY_V6_URL": f"{self.url}/ipify/v6",
+            "IP_IPAPI_URL": self.url + "/ipapi/{ip}/json/",
+            "IP_IP_API_URL": self.url + "/ip-api/json/{ip}",
+            "IP_API_BATCH_URL": f"{self.url}/ip-api/batch",
+        }
+
+    def point(self, ip_lookup):
+        """Point an imported ip_lookup module's provider URLs at this stub."""
+        env = self.environ()
+        ip_lookup.IPIFY_V4_URL = env["IP_IPIFY_V4_URL"]
+        ip_lookup.IPIFY_V6_URL = env["IP_IPIFY_V6_URL"]
+        ip_lookup.IPAPI_URL = env["IP_IPAPI_URL"]
+        ip_lookup.IP_API_URL = env["IP_IP_API_URL"]
+        ip_lookup.IP_API_BATCH_URL = env["IP_API_BATCH_URL"]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _roll(self, probability):
+        with self._lock:
+            return self._random.random() < probability
+
+    def _count(self, provider):
+        with self._lock:
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+
+    def _delay(self):
+        with self._lock:
+            extra = self._random.random() * self.jitter if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, Nagle plus delayed ACKs add ~40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                parts = [part for part in path.split("/") if part]
+                if parts[:1] == ["ipify"]:
+                    stub._count("ipify")
+                    self._answer(lambda: {"ip": "2001:db8::7" if parts[1:] == ["v6"] else "203.0.113.7"})
+                elif parts[:1] == ["ipapi"] and len(parts) >= 2:
+                    stub._count("ipapi.co")
+                    ip = parts[1]
+                    self._answer(lambda: IPAPI_RATE_LIMIT_BODY if stub._roll(stub.rate_limit_rate) else ipapi_body(ip))
+                elif parts[:2] == ["ip-api", "json"] and len(parts) >= 3:
+                    stub._count("ip-api.com")
+                    self._answer(lambda: ip_api_body(parts[2]))
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if self.path.split("?", 1)[0] != "/ip-api/batch":
+                    self._send(404, {"error": "not found"})
+                    return
+                stub._count("ip-api.com/batch")
+                try:
+                    ips = json.loads(body)
+                except ValueError:
+                    self._send(400, {"error": "bad json"})
+                    return
+                self._answer(lambda: [ip_api_body(ip) for ip in ips])
+
+            def _answer(self, make_body):
+                stub._delay()
+                if stub._roll(stub.error_rate):
+                    self._send(500, {"error": "stub failure"})
+                else:
+                    self._send(200, make_body())
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of ipapi.co requests answered with its rate-limit body")
+    args = parser.parse_args()
+
+    stub = StubUpstream(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, port=args.port)
+    for name, value in stub.environ().items():
+        print(f"export {name}='{value}'")
+    try:
+        stub.start()._thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only bulk lookups need it
+    np = None
+
+from ip_ranges import MappedRangeTable
+
+# Columns returned by lookup_many, besides "ip" and "found"
+COLUMNS = ("city", "region", "country", "country_name", "latitude", "longitude",
+           "timezone", "org", "asn", "postal")
+
+# Longest dotted-quad IPv4 address ("255.255.255.255")
+_MAX_IPV4_LENGTH = 15
+# Rows parsed per pass; keeps the per-column working set in CPU cache
+_BLOCK_SIZE = 1 << 16
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Bulk lookups require numpy (pip install numpy)")
+
+
+def ipv4_keys(ips):
+    """Parse IPv4 address strings to integer keys in vectorized form.
+
+    Returns (keys, valid): a uint32 array of keys and a boolean array marking
+    which entries were well-formed dotted quads. The strings are viewed as a
+    matrix of code points and parsed one character column at a time, in
+    cache-sized blocks, so the work is a fixed number of whole-array
+    operations per block regardless of input size.
+    """
+    _require_numpy()
+    text = np.char.strip(np.asarray(ips, dtype=str))
+    n = len(text)
+    keys = np.zeros(n, dtype=np.uint32)
+    valid = np.ones(n, dtype=bool)
+    if n == 0:
+        return keys, valid
+    width = text.dtype.itemsize // 4
+    codepoints = text.view(np.uint32).reshape(n, width)
+
+    if width > _MAX_IPV4_LENGTH:
+        valid &= ~codepoints[:, _MAX_IPV4_LENGTH:].any(axis=1)
+    for start in range(0, n, _BLOCK_SIZE):
+        block = codepoints[start:start + _BLOCK_SIZE, :_MAX_IPV4_LENGTH]
+        # Anything non-ASCII is invalid; the rest fits in one byte per character
+        ascii_only = (block < 128).all(axis=1)
+        columns = np.ascontiguousarray(block.astype(np.uint8).T)
+        _parse_ipv4_block(columns, keys[start:start + len(block)], valid[start:start + len(block)])
+        valid[start:start + len(block)] &= ascii_only
+    return keys, valid
+
+
+def _parse_ipv4_block(columns, keys, valid):
+    """Parse one block of byte columns into keys/valid (both updated in place)."""
+    n = len(keys)
+    octet = np.zeros(n, dtype=np.uint16)
+    digits = np.zeros(n, dtype=np.uint8)
+    # Whether the current octet started with '0'; like ipaddress, "01" is not an octet
+    zero_first = np.zeros(n, dtype=bool)
+    dots = np.zeros(n, dtype=np.uint8)
+    ended = np.zeros(n, dtype=bool)
+
+    for c in columns:
+        value = c - np.uint8(48)
+        is_digit = value < 10
+        is_dot = c == 46
+        is_pad = c == 0
+        valid &= is_digit | is_dot | is_pad
+        np.copyto(octet, octet * np.uint16(10) + value, where=is_digit)
+        np.copyto(zero_first, value == 0, where=is_digit & (digits == 0))
+        digits += is_digit
+        _finish_octet(is_dot | (is_pad & ~ended), keys, valid, octet, digits, zero_first)
+        dots += is_dot
+        ended |= is_pad
+
+    _finish_octet(~ended, keys, valid, octet, digits, zero_first)
+    valid &= dots == 3
+
+
+def _finish_octet(mask, keys, valid, octet, digits, zero_first):
+    """Shift the octets completed in mask into keys and reset their accumulators."""
+    valid &= ~(mask & ((digits == 0) | (digits > 3) | (octet > 255) | (zero_first & (digits > 1))))
+    np.copyto(keys, (keys << np.uint32(8)) | octet, where=mask, casting="unsafe")
+    keep = ~mask
+    octet *= keep
+    digits *= keep
+    zero_first &= keep
+
+
+def _v4_columns(table):
+    """Return numpy views (starts, ends, rows, coords) over a table's IPv4 section, plus its strings."""
+    width = len(table._row_fields)
+    if isinstance(table, MappedRangeTable):
+        _, starts_off, ends_off, rows_off, coords_off, count = table._v4
+        mm = table._mm
+        starts = np.frombuffer(mm, dtype=">u4", count=count, offset=starts_off)
+        ends = np.frombuffer(mm, dtype=">u4", count=count, offset=ends_off)
+        rows = np.frombuffer(mm, dtype="<u4", count=count * width, offset=rows_off).reshape(count, width)
+        coords = np.frombuffer(mm, dtype="<f8", count=count * 2, offset=coords_off).reshape(count, 2)
+        strings = [table._string(i) for i in range(table._nstrings)]
+    else:
+        family = table.v4
+        count = len(family.starts)
+        starts = np.frombuffer(family.starts, dtype=np.uint32) if count else np.zeros(0, dtype=np.uint32)
+        ends = np.frombuffer(family.ends, dtype=np.uint32) if count else np.zeros(0, dtype=np.uint32)
+        rows = (np.frombuffer(family.rows, dtype=np.uint32).reshape(count, width) if count
+                else np.zeros((0, width), dtype=np.uint32))
+        coords = np.stack([np.frombuffer(family.latitudes, dtype=np.float64) if count else np.zeros(0),
+                           np.frombuffer(family.longitudes, dtype=np.float64) if count else np.zeros(0)], axis=1)
+        strings = table.strings
+    return starts, ends, rows, coords, strings
+
+
+def lookup_many(ips, table=None):
+    """Resolve many IPs against the local range table and return columnar results.
+
+    IPv4 addresses are resolved with a single searchsorted over the table's
+    start keys; IPv6 addresses (128-bit keys have no numpy dtype) fall back to
+    the table's per-address binary search. Returns a dict of equal-length
+    arrays: "ip", "found", and one array per name in COLUMNS, with None (or NaN
+    for coordinates) where an address was not found.
+    """
+    _require_numpy()
+    if table is None:
+        import ip_lookup
+        table = ip_lookup.get_range_table()
+        if table is None:
+            raise ValueError("No range table loaded; set IP_RANGES_PATH or pass table")
+
+    ip_array = np.asarray(ips, dtype=object)
+    n = len(ip_array)
+    keys, valid = ipv4_keys(ips)
+    starts, ends, rows, coords, strings = _v4_columns(table)
+    row_fields = table._row_fields
+
+    index = np.zeros(n, dtype=np.int64)
+    found = np.zeros(n, dtype=bool)
+    if len(starts):
+        candidate = np.searchsorted(starts, keys, side="right") - 1
+        np.clip(candidate, 0, None, out=index)
+        found = valid & (candidate >= 0) & (keys <= ends[index])
+
+    # String index 0 is the empty string, which stands for "no value" / not found
+    string_array = np.array(strings, dtype=object)
+    string_array[string_array == ""] = None
+    result = {"ip": ip_array, "found": found}
+    for column in COLUMNS:
+        if column in ("latitude", "longitude"):
+            values = coords[index, 0 if column == "latitude" else 1] if len(starts) else np.full(n, np.nan)
+            values = np.where(found, values, np.nan)
+        else:
+            codes = rows[index, row_fields.index(column)] if len(starts) else np.zeros(n, dtype=np.uint32)
+            values = string_array[np.where(found, codes, 0)]
+        result[column] = values
+
+    # Entries that were not dotted quads may still be IPv6 addresses
+    for i in np.flatnonzero(~valid):
+        record = table.lookup(str(ip_array[i])) if ip_array[i] is not None else None
+        if record is None:
+            continue
+        found[i] = True
+        for column in COLUMNS:
+            value = record[column]
+            result[column][i] = (np.nan if value is None else value) if column in ("latitude", "longitude") else value
+    return result
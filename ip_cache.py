@@ -0,0 +1,378 @@
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from ip_log import log_event
+from ip_record import IPRecord
+
+# Returned by TTLCache.get() when a key is absent or expired, so that a cached
+# negative result (None) can be told apart from a miss.
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time-to-live.
+
+    Successful results and negative results (None, e.g. failed or invalid
+    lookups) are kept in separate LRU tables, each with its own TTL and size
+    bound, so a burst of bad lookups can never evict good entries.
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600, negative_maxsize=1024, negative_ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_maxsize = negative_maxsize
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._negative = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING if absent or expired."""
+        return self._get(key, record=True)
+
+    def peek(self, key):
+        """Like get(), but without touching the hit/miss counters or the LRU order."""
+        return self._get(key, record=False)
+
+    def fetched_at(self, key):
+        """Wall-clock time the entry for key was fetched, or None if it is absent or expired."""
+        now = self._clock()
+        with self._lock:
+            for table in (self._entries, self._negative):
+                entry = table.get(key)
+                if entry is not None and entry[0] > now:
+                    return entry[2]
+        return None
+
+    def expires_in(self, key):
+        """Seconds until key's entry expires, or None if it is absent or expired."""
+        now = self._clock()
+        with self._lock:
+            for table in (self._entries, self._negative):
+                entry = table.get(key)
+                if entry is not None and entry[0] > now:
+                    return entry[0] - now
+        return None
+
+    def _get(self, key, record):
+        now = self._clock()
+        with self._lock:
+            for table in (self._entries, self._negative):
+                entry = table.get(key)
+                if entry is None:
+                    continue
+                expires_at, value, _ = entry
+                if expires_at <= now:
+                    del table[key]
+                    self.expirations += 1
+                    continue
+                if not record:
+                    return value
+                table.move_to_end(key)
+                if table is self._entries:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return value
+            if record:
+                self.misses += 1
+            return MISSING
+
+    def set(self, key, value, fetched_at=None):
+        """Store value under key; None is stored as a negative result.
+
+        fetched_at is the wall-clock time the value was originally fetched
+        (default now), for values promoted from a slower cache layer.
+        """
+        if value is None:
+            table, other, ttl, maxsize = self._negative, self._entries, self.negative_ttl, self.negative_maxsize
+        else:
+            table, other, ttl, maxsize = self._entries, self._negative, self.ttl, self.maxsize
+        if maxsize <= 0 or ttl <= 0:
+            return
+        expires_at = self._clock() + ttl
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            other.pop(key, None)
+            table[key] = (expires_at, value, fetched_at)
+            table.move_to_end(key)
+            while len(table) > maxsize:
+                table.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._negative.pop(key, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._negative.clear()
+            self.hits = self.negative_hits = self.misses = 0
+            self.evictions = self.expirations = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries) + len(self._negative)
+
+    def stats(self):
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "negative_size": len(self._negative),
+                "maxsize": self.maxsize,
+                "negative_maxsize": self.negative_maxsize,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+
+class StaleWhileRevalidate:
+    """A single value loaded once, then served from memory and refreshed in the background.
+
+    get() only blocks while nothing has been loaded yet (concurrent first
+    callers share one load). Once the value is older than max_age, get()
+    starts one background refresh and still returns the stale value at once.
+    A refresh whose result is rejected by accept, or that raises, keeps the
+    previous value and is retried after retry_interval seconds; a rejected
+    first load is likewise returned as is until then, instead of loading
+    again on every get(). A loader that raises is logged and counts as having
+    returned `failed`, so get() always returns a value of the usual shape.
+    start() additionally refreshes on a fixed schedule.
+    """
+
+    def __init__(self, loader, max_age, accept=None, retry_interval=30.0, clock=time.time, failed=None):
+        self.loader = loader
+        self.max_age = max_age
+        self.accept = accept or (lambda value: value is not None)
+        self.failed = failed
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._first_load = None
+        self._value = MISSING
+        # Result of a rejected load while nothing was accepted yet (failed if the loader raised)
+        self._rejected = MISSING
+        self._fetched_at = None
+        self._retry_at = 0.0
+        self._refreshing = False
+        self._scheduler = None
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.failures = 0
+
+    def get(self):
+        """Return (value, fetched_at) without waiting on refreshes.
+
+        fetched_at is the wall-clock time the value was loaded; it is None when
+        nothing could be loaded yet, in which case value is the rejected result.
+        """
+        with self._lock:
+            value, fetched_at = self._value, self._fetched_at
+            now = self._clock()
+            start = (value is not MISSING and now - fetched_at >= self.max_age
+                     and now >= self._retry_at and not self._refreshing)
+            if start:
+                self._refreshing = True
+        if value is MISSING:
+            return self._load_first()
+        if start:
+            threading.Thread(target=self.refresh, name="swr-refresh", daemon=True).start()
+        return value, fetched_at
+
+    def age(self):
+        """Seconds since the current value was loaded, or None before the first load."""
+        with self._lock:
+            return None if self._fetched_at is None else self._clock() - self._fetched_at
+
+    def _load_first(self):
+        with self._lock:
+            if self._value is not MISSING:
+                return self._value, self._fetched_at
+            if self._rejected is not MISSING and self._clock() < self._retry_at:
+                return self._rejected, None
+            future = self._first_load
+            owner = future is None
+            if owner:
+                future = self._first_load = Future()
+        if not owner:
+            # Another caller is loading; share its result rather than loading again
+            return future.result()
+        try:
+            result = self.refresh()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._first_load = None
+        return result
+
+    def refresh(self):
+        """Load a new value now and return (value, fetched_at) as get() would."""
+        accepted = False
+        value = self.failed
+        try:
+            value = self.loader()
+            accepted = self.accept(value)
+        except Exception as e:
+            value = self.failed
+            log_event("refresh_error", error=repr(e))
+        finally:
+            now = self._clock()
+            with self._lock:
+                self._refreshing = False
+                if accepted:
+                    self._value, self._fetched_at = value, now
+                    self.refreshes += 1
+                else:
+                    self.failures += 1
+                    self._retry_at = now + self.retry_interval
+                    if self._value is MISSING:
+                        self._rejected = value
+        with self._lock:
+            if accepted or self._value is MISSING:
+                return value, (now if accepted else None)
+            return self._value, self._fetched_at
+
+    def start(self, interval):
+        """Refresh every interval seconds in a daemon thread, starting with an immediate load."""
+        if self._scheduler is not None and self._scheduler.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            self.refresh()
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._scheduler = threading.Thread(target=run, name="swr-schedule", daemon=True)
+        self._scheduler.start()
+
+    def stop(self):
+        """Stop the scheduled refreshes."""
+        self._stop.set()
+
+    def clear(self):
+        """Forget the current value, so the next get() loads again."""
+        with self._lock:
+            self._value = MISSING
+            self._rejected = MISSING
+            self._fetched_at = None
+            self._retry_at = 0.0
+
+
+class PrefixCache:
+    """Location records shared by every address of an enclosing network.
+
+    Addresses are grouped by their IPv4 /v4_prefix or IPv6 /v6_prefix network
+    (a length of 0 disables the tier for that family). observe() feeds it the
+    answers of exact lookups: a prefix is only served once exact answers for
+    `confirmations` distinct addresses in it agree on COMPARE_FIELDS (the same
+    address answered again confirms nothing new), and a prefix whose answers
+    disagree is marked heterogeneous, so its addresses keep being looked up
+    exactly until the entry expires.
+    """
+
+    COMPARE_FIELDS = ("country", "region", "city", "asn")
+
+    def __init__(self, v4_prefix=24, v6_prefix=48, confirmations=2, maxsize=4096, ttl=3600, clock=time.monotonic):
+        self.prefixes = {4: v4_prefix, 6: v6_prefix}
+        self.confirmations = confirmations
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl, negative_maxsize=0, clock=clock)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.heterogeneous = 0
+
+    def prefix(self, ip):
+        """The enclosing network of ip as a string, or None when it is invalid or its family is disabled."""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        length = self.prefixes.get(address.version)
+        if not length:
+            return None
+        return str(ipaddress.ip_network((address, length), strict=False))
+
+    def get(self, ip):
+        """Return the shared record for ip's network (with ip filled in), or MISSING."""
+        key = self.prefix(ip)
+        if key is None:
+            return MISSING
+        entry = self._entries.get(key)
+        with self._lock:
+            if entry is MISSING or entry["heterogeneous"] or len(entry["ips"]) < self.confirmations:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            data = entry["data"]
+        return data._replace(ip=ip) if isinstance(data, IPRecord) else dict(data, ip=ip)
+
+    def observe(self, ip, data):
+        """Record an exact lookup answer for ip."""
+        key = self.prefix(ip) if data else None
+        if key is None:
+            return
+        ip = str(ipaddress.ip_address(ip))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is MISSING:
+                self._entries.set(key, {"data": data, "ips": {ip}, "heterogeneous": False})
+            elif entry["heterogeneous"]:
+                return
+            elif all(entry["data"].get(field) == data.get(field) for field in self.COMPARE_FIELDS):
+                # Only the first `confirmations` distinct addresses are worth remembering
+                if len(entry["ips"]) < self.confirmations:
+                    entry["ips"].add(ip)
+            else:
+                entry["heterogeneous"] = True
+                self.heterogeneous += 1
+
+    def clear(self):
+        """Drop every prefix and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.heterogeneous = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return a snapshot of the prefix tier counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "prefixes": len(self._entries),
+                "v4_prefix": self.prefixes[4],
+                "v6_prefix": self.prefixes[6],
+                "hits": self.hits,
+                "misses": self.misses,
+                "heterogeneous": self.heterogeneous,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,146 @@
+import ipaddress
+from collections import namedtuple
+
+# Categories; only GLOBAL addresses are worth asking a geolocation provider about
+GLOBAL = "global"
+INVALID = "invalid"
+PRIVATE = "private"
+SHARED = "shared"
+LOOPBACK = "loopback"
+LINK_LOCAL = "link-local"
+DOCUMENTATION = "documentation"
+BENCHMARKING = "benchmarking"
+MULTICAST = "multicast"
+BROADCAST = "broadcast"
+UNSPECIFIED = "unspecified"
+RESERVED = "reserved"
+
+# IANA IPv4 Special-Purpose Address Registry (RFC 6890 and updates), plus multicast.
+# A None category marks a globally reachable exception inside a larger reserved block.
+IPV4_SPECIAL = (
+    ("0.0.0.0/8", UNSPECIFIED, "\"This network\" address (RFC 791)"),
+    ("10.0.0.0/8", PRIVATE, "Private-use network (RFC 1918)"),
+    ("100.64.0.0/10", SHARED, "Shared carrier-grade NAT space (RFC 6598)"),
+    ("127.0.0.0/8", LOOPBACK, "Loopback address (RFC 1122)"),
+    ("169.254.0.0/16", LINK_LOCAL, "Link-local address (RFC 3927)"),
+    ("172.16.0.0/12", PRIVATE, "Private-use network (RFC 1918)"),
+    ("192.0.0.0/24", RESERVED, "IETF protocol assignment (RFC 6890)"),
+    ("192.0.0.9/32", None, None),
+    ("192.0.0.10/32", None, None),
+    ("192.0.2.0/24", DOCUMENTATION, "Documentation address, TEST-NET-1 (RFC 5737)"),
+    ("192.88.99.0/24", RESERVED, "Deprecated 6to4 relay anycast (RFC 7526)"),
+    ("192.168.0.0/16", PRIVATE, "Private-use network (RFC 1918)"),
+    ("198.18.0.0/15", BENCHMARKING, "Benchmarking network (RFC 2544)"),
+    ("198.51.100.0/24", DOCUMENTATION, "Documentation address, TEST-NET-2 (RFC 5737)"),
+    ("203.0.113.0/24", DOCUMENTATION, "Documentation address, TEST-NET-3 (RFC 5737)"),
+    ("224.0.0.0/4", MULTICAST, "Multicast address (RFC 5771)"),
+    ("240.0.0.0/4", RESERVED, "Reserved for future use (RFC 1112)"),
+    ("255.255.255.255/32", BROADCAST, "Limited broadcast address (RFC 919)"),
+)
+
+# IANA IPv6 Special-Purpose Address Registry; everything outside 2000::/3 is not
+# allocated for global unicast. IPv4-mapped addresses are classified as IPv4.
+IPV6_SPECIAL = (
+    ("::/0", RESERVED, "Outside the global unicast space (RFC 4291)"),
+    ("::/128", UNSPECIFIED, "Unspecified address (RFC 4291)"),
+    ("::1/128", LOOPBACK, "Loopback address (RFC 4291)"),
+    ("64:ff9b::/96", None, None),
+    ("64:ff9b:1::/48", PRIVATE, "Local-use IPv4/IPv6 translation (RFC 8215)"),
+    ("100::/64", RESERVED, "Discard-only address block (RFC 6666)"),
+    ("2000::/3", None, None),
+    ("2001::/23", RESERVED, "IETF protocol assignment (RFC 2928)"),
+    ("2001:1::1/128", None, None),
+    ("2001:1::2/128", None, None),
+    ("2001:2::/48", BENCHMARKING, "Benchmarking network (RFC 5180)"),
+    ("2001:3::/32", None, None),
+    ("2001:4:112::/48", None, None),
+    ("2001:20::/28", None, None),
+    ("2001:30::/28", None, None),
+    ("2001:db8::/32", DOCUMENTATION, "Documentation address (RFC 3849)"),
+    ("3fff::/20", DOCUMENTATION, "Documentation address (RFC 9637)"),
+    ("5f00::/16", RESERVED, "Segment routing SIDs (RFC 9602)"),
+    ("fc00::/7", PRIVATE, "Unique local address (RFC 4193)"),
+    ("fe80::/10", LINK_LOCAL, "Link-local address (RFC 4291)"),
+    ("ff00::/8", MULTICAST, "Multicast address (RFC 4291)"),
+)
+
+
+class Classification(namedtuple("Classification", "ip version category description")):
+    """Result of classify(): normalized address (or raw input), IP version, category and reason."""
+
+    __slots__ = ()
+
+    @property
+    def routable(self):
+        return self.category == GLOBAL
+
+
+class PrefixTrie:
+    """Binary radix trie mapping address prefixes to values, with longest-prefix match.
+
+    Nodes are [zero child, one child, value, has value] lists; a lookup walks at
+    most one node per bit and stops at the first missing child, so addresses
+    outside every listed prefix are rejected after a few steps.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self._root = [None, None, None, False]
+
+    def insert(self, key, prefixlen, value):
+        node = self._root
+        for shift in range(self.bits - 1, self.bits - 1 - prefixlen, -1):
+            bit = (key >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None, False]
+            node = node[bit]
+        node[2] = value
+        node[3] = True
+
+    def longest_match(self, key, default=None):
+        """Return the value of the longest prefix containing key, or default."""
+        node = self._root
+        found = node[2] if node[3] else default
+        shift = self.bits - 1
+        while shift >= 0:
+            node = node[(key >> shift) & 1]
+            if node is None:
+                break
+            if node[3]:
+                found = node[2]
+            shift -= 1
+        return found
+
+
+def _build(bits, registry):
+    trie = PrefixTrie(bits)
+    for prefix, category, description in registry:
+        network = ipaddress.ip_network(prefix)
+        trie.insert(int(network.network_address), network.prefixlen, (category, description))
+    return trie
+
+
+_TRIES = {4: _build(32, IPV4_SPECIAL), 6: _build(128, IPV6_SPECIAL)}
+
+
+def classify(ip):
+    """Classify an address string without any network access.
+
+    Returns a Classification whose category is INVALID for malformed input,
+    GLOBAL for globally routable addresses, or the special-purpose block the
+    address belongs to.
+    """
+    text = ip.strip() if isinstance(ip, str) else ""
+    try:
+        address = ipaddress.ip_address(text)
+    except ValueError:
+        return Classification(text, None, INVALID, "Not a valid IPv4 or IPv6 address")
+
+    if address.version == 6 and address.ipv4_mapped is not None:
+        mapped = classify(str(address.ipv4_mapped))
+        return mapped._replace(ip=str(address))
+
+    category, description = _TRIES[address.version].longest_match(int(address), (None, None))
+    if category is None:
+        return Classification(str(address), address.version, GLOBAL, "Globally routable address")
+    return Classification(str(address), address.version, category, description)
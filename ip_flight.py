@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one upstream call.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or exception) instead of running
+    it again. Nothing is remembered once the call finishes, so this only
+    deduplicates overlapping work; caching stays the cache's job. Threads use
+    do() and coroutines do_async(); both feed the same counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Coroutine flights are tracked per event loop, since tasks belong to one loop
+        self._async_calls = weakref.WeakKeyDictionary()
+        self.calls = 0
+        self.saved = 0
+
+    def do(self, key, fn, *args):
+        """Return fn(*args), sharing the call with concurrent callers for key."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.saved += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, fn, *args):
+        """Await fn(*args), sharing the coroutine with concurrent callers for key on this loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            task = calls.get(key)
+            if task is None:
+                task = calls[key] = loop.create_task(fn(*args))
+                task.add_done_callback(lambda _: calls.pop(key, None))
+                self.calls += 1
+            else:
+                self.saved += 1
+        # Shielded so one caller giving up does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Return calls made, calls saved by coalescing and calls currently in flight."""
+        with self._lock:
+            in_flight = len(self._calls) + sum(len(calls) for calls in self._async_calls.values())
+            return {"calls": self.calls, "saved": self.saved, "in_flight": in_flight}
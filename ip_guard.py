@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import threading
+import time
+
+from ip_log import log_event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provider_state (
+    provider TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    refilled_at REAL NOT NULL,
+    failures INTEGER NOT NULL,
+    opened_at REAL,
+    probe_at REAL
+);
+"""
+
+_COLUMNS = ("tokens", "refilled_at", "failures", "opened_at", "probe_at")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def parse_rate(value):
+    """Parse a "requests/seconds" quota such as "45/60" into a (requests, seconds) tuple."""
+    requests, _, seconds = str(value).partition("/")
+    return float(requests), float(seconds or 1)
+
+
+class ProviderGuard:
+    """Per-provider token-bucket rate limits and circuit breakers.
+
+    Each provider gets a bucket holding up to its quota of requests, refilled
+    continuously over the quota period, and a breaker that opens after
+    failure_threshold consecutive failures (or at once on a rate-limit answer).
+    An open breaker rejects calls for cooldown seconds, then lets a single
+    half-open probe through; its success closes the breaker again.
+
+    With a path, state lives in a SQLite file so every thread and worker
+    process draws from the same buckets; without one it is kept in memory for
+    this process only. Storage errors fail open, so lookups never stop because
+    the state file is unavailable.
+    """
+
+    def __init__(self, path=None, limits=None, failure_threshold=5, cooldown=30.0,
+                 busy_timeout=5.0, clock=time.time):
+        self.path = path
+        self.limits = dict(limits or {})
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._local = threading.local()
+        self.rejected = {}
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _new_row(self, provider, now):
+        limit = self.limits.get(provider)
+        return {"tokens": limit[0] if limit else 0.0, "refilled_at": now,
+                "failures": 0, "opened_at": None, "probe_at": None}
+
+    def _update(self, provider, change):
+        """Apply change(row, now) to provider's state atomically and return its result."""
+        now = self._clock()
+        if not self.path:
+            with self._lock:
+                row = self._rows.get(provider)
+                if row is None:
+                    row = self._rows[provider] = self._new_row(provider, now)
+                return change(row, now)
+
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            found = conn.execute(
+                "SELECT tokens, refilled_at, failures, opened_at, probe_at FROM provider_state WHERE provider = ?",
+                (provider,),
+            ).fetchone()
+            row = dict(zip(_COLUMNS, found)) if found else self._new_row(provider, now)
+            result = change(row, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO provider_state (provider, tokens, refilled_at, failures, opened_at, probe_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (provider,) + tuple(row[column] for column in _COLUMNS),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _state(self, row, now):
+        if row["opened_at"] is None:
+            return CLOSED
+        if now - row["opened_at"] < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def _refill(self, provider, row, now):
+        limit = self.limits.get(provider)
+        if limit:
+            requests, seconds = limit
+            row["tokens"] = min(requests, row["tokens"] + max(0.0, now - row["refilled_at"]) * requests / seconds)
+        row["refilled_at"] = now
+
+    def acquire(self, provider):
+        """Take one request slot for provider; False means skip it (no tokens or breaker open)."""
+
+        def change(row, now):
+            self._refill(provider, row, now)
+            state = self._state(row, now)
+            if state == OPEN:
+                return False
+            # Only one half-open probe at a time; a probe that never reports back expires after cooldown
+            if state == HALF_OPEN and row["probe_at"] is not None and now - row["probe_at"] < self.cooldown:
+                return False
+            if provider in self.limits:
+                if row["tokens"] < 1:
+                    return False
+                row["tokens"] -= 1
+            if state == HALF_OPEN:
+                row["probe_at"] = now
+            return True
+
+        try:
+            allowed = self._update(provider, change)
+        except sqlite3.Error as e:
+            log_event("guard_error", provider=provider, operation="acquire", error=str(e))
+            return True
+        if not allowed:
+            with self._lock:
+                self.rejected[provider] = self.rejected.get(provider, 0) + 1
+        return allowed
+
+    def record_success(self, provider):
+        """Report a usable answer from provider; closes its breaker."""
+
+        def change(row, now):
+            row["failures"] = 0
+            row["opened_at"] = None
+            row["probe_at"] = None
+
+        self._report(provider, change)
+
+    def record_failure(self, provider, rate_limited=False):
+        """Report an error from provider; rate_limited (e.g. HTTP 429) opens the breaker at once."""
+
+        def change(row, now):
+            row["failures"] += 1
+            if rate_limited:
+                # The provider says the quota is spent, whatever our bucket thinks
+                self._refill(provider, row, now)
+                row["tokens"] = 0.0
+            if rate_limited or row["failures"] >= self.failure_threshold or self._state(row, now) == HALF_OPEN:
+                row["opened_at"] = now
+                row["probe_at"] = None
+
+        self._report(provider, change)
+
+    def _report(self, provider, change):
+        try:
+            self._update(provider, change)
+        except sqlite3.Error as e:
+            log_event("guard_error", provider=provider, operation="update", error=str(e))
+
+    def state(self, provider):
+        """Return provider's breaker state: "closed", "open" or "half-open"."""
+        try:
+            return self._update(provider, lambda row, now: self._state(row, now))
+        except sqlite3.Error:
+            return CLOSED
+
+    def stats(self):
+        """Return breaker state, remaining tokens, consecutive failures and rejections per provider."""
+        providers = set(self.limits) | set(self.rejected)
+        if self.path:
+            try:
+                rows = self._connection().execute("SELECT provider FROM provider_state").fetchall()
+                providers.update(row[0] for row in rows)
+            except sqlite3.Error:
+                pass
+        else:
+            with self._lock:
+                providers.update(self._rows)
+
+        stats = {}
+        for provider in sorted(providers):
+            def snapshot(row, now, provider=provider):
+                self._refill(provider, row, now)
+                return {"state": self._state(row, now), "tokens": row["tokens"], "failures": row["failures"]}
+            try:
+                entry = self._update(provider, snapshot)
+            except sqlite3.Error:
+                continue
+            with self._lock:
+                entry["rejected"] = self.rejected.get(provider, 0)
+            stats[provider] = entry
+        return stats
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
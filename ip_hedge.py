@@ -0,0 +1,95 @@
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class Hedger:
+    """Races a fallback provider against a slow primary provider.
+
+    The primary call runs first; if it has not answered within the configured
+    percentile of its recent latencies, the fallback is fired in parallel and
+    the first valid answer wins. Provider callables return a (data, provider)
+    tuple where provider is None when no service gave a usable answer.
+
+    The primary call feeds record_latency() itself, and only for requests that
+    actually reached the provider: a call rejected by the rate limiter or an
+    open breaker returns at once and would drag the percentile towards zero.
+    """
+
+    def __init__(self, executor, percentile=95, default_delay=1.0, min_samples=20, window=256):
+        self.executor = executor
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.wins = {}
+
+    def record_latency(self, seconds):
+        """Add one primary-provider latency sample."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Seconds to wait for the primary before hedging."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return samples[index]
+
+    def record_win(self, provider):
+        """Count one answer won by provider; lookups no provider answered are not wins."""
+        if provider is None:
+            return
+        with self._lock:
+            self.wins[provider] = self.wins.get(provider, 0) + 1
+
+    def record_hedge(self):
+        """Count one fallback request fired because the primary was slow."""
+        with self._lock:
+            self.hedges += 1
+
+    def run(self, primary, fallback):
+        """Return the first valid (data, provider) answer from primary or a hedged fallback."""
+        primary_future = self.executor.submit(primary)
+        done, _ = wait([primary_future], timeout=self.delay())
+        if done:
+            result = primary_future.result()
+            if result[1] is None:
+                result = fallback()
+            self.record_win(result[1])
+            return result
+
+        self.record_hedge()
+        fallback_future = self.executor.submit(fallback)
+        pending = {primary_future, fallback_future}
+        result = (None, None)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result[1] is not None:
+                    break
+            if result[1] is not None:
+                break
+
+        # The loser's HTTP call cannot be aborted mid-flight; its answer is simply discarded
+        for future in pending:
+            future.cancel()
+        self.record_win(result[1])
+        return result
+
+    def stats(self):
+        """Return hedge counts, per-provider wins and the current hedge delay."""
+        delay = self.delay()
+        with self._lock:
+            return {
+                "hedges": self.hedges,
+                "wins": dict(self.wins),
+                "samples": len(self._latencies),
+                "percentile": self.percentile,
+                "delay": delay,
+            }
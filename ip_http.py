@@ -0,0 +1,88 @@
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connection pool settings, overridable from the environment
+HTTP_POOL_SIZE = int(os.environ.get("IP_HTTP_POOL_SIZE", 10))
+HTTP_POOL_BLOCK = os.environ.get("IP_HTTP_POOL_BLOCK", "0") == "1"
+
+
+class ProviderClient:
+    """Keeps one pooled keep-alive requests.Session per upstream host.
+
+    Sessions are created lazily and shared by every thread (Flask request
+    threads, GUI worker threads), so repeated calls to the same provider reuse
+    an open TCP/TLS connection instead of handshaking again.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, pool_block=HTTP_POOL_BLOCK, headers=None):
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.headers = dict(headers or {})
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session_for(self, host):
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    session.headers.update({"Connection": "keep-alive"})
+                    session.headers.update(self.headers)
+                    # Only one host goes through each session, so a single pool suffices
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=self.pool_block)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[host] = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the pooled session for url's host."""
+        parts = urlsplit(url)
+        return self._session_for(f"{parts.scheme}://{parts.netloc}").request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Send a GET request through the pooled session for url's host."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Send a POST request through the pooled session for url's host."""
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """Return per-host handshake and request counts plus the connection reuse ratio."""
+        with self._lock:
+            sessions = dict(self._sessions)
+        hosts = {}
+        for host, session in sessions.items():
+            handshakes = requests_sent = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        handshakes += pool.num_connections
+                        requests_sent += pool.num_requests
+            hosts[host] = {
+                "handshakes": handshakes,
+                "requests": requests_sent,
+                "reuse_ratio": 1 - handshakes / requests_sent if requests_sent else 0.0,
+            }
+        return hosts
+
+    def close(self):
+        """Close every pooled connection."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+# Shared by all provider calls in the process
+provider_client = ProviderClient()
@@ -1,90 +1,77 @@
-from flask import Flask, render_template, request
-import requests
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+
+import ip_lookup
+import ip_warmup
+from ip_classify import INVALID, classify
+from ip_lookup import (get_ip_address, get_ip_info, get_ip_info_batch, get_ip_info_classified,
+                       normalize_record)
+from ip_log import log_event
+from ip_metrics import CONTENT_TYPE, REGISTRY, TEMPLATE_RENDER_SECONDS
+
+# get_ip_address and get_ip_info used to be defined here and moved to ip_lookup;
+# they are re-exported so that callers importing them from ip_info keep working
+__all__ = ["app", "start_background_tasks", "get_ip_address", "get_ip_info"]
+
+# Largest number of IPs accepted in one /api/lookup/batch request
+BATCH_MAX_IPS = 10000
+
+# Stream the index page: the shell is sent at once and the location card once
+# the lookup finishes, or after PAGE_TIMEOUT seconds as a partial result
+PAGE_STREAMING = os.environ.get("IP_PAGE_STREAMING", "1") != "0"
+PAGE_TIMEOUT = float(os.environ.get("IP_PAGE_TIMEOUT", 8))
+
+# Runs the lookups of streamed index pages; a timed-out lookup keeps running here and fills the cache
+_page_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="page")
+
+# Set IP_BACKGROUND_TASKS to "0" to load the app without starting the cache
+# warm-up and the My-IP refresh schedule, e.g. for tests or tooling
+BACKGROUND_TASKS = os.environ.get("IP_BACKGROUND_TASKS", "1") != "0"
+
+# Process that started the background tasks; a forked worker starts its own
+_background_pid = None
+_background_lock = threading.Lock()
 
 app = Flask(__name__)
 
-def get_ip_address(version="ipv4"):
-    """Retrieve public IPv4 or IPv6 address using ipify."""
-    try:
-        if version == "ipv6":
-            res = requests.get("https://api6.ipify.org?format=json", timeout=5) #REST API for IPv6
-        else:
-            res = requests.get("https://api.ipify.org?format=json", timeout=5) #REST API for IPv4
-        res.raise_for_status()
-        return res.json().get("ip")
-    except requests.exceptions.RequestException:
-        return None
-    
-# This function retrieves the user's public IP address using the ipify API
-def get_ip_info(ip):
-    """Retrieve IP information (location, ISP, ASN, etc.) using ipapi.co with fallback."""
-    if not ip:
-        return None
-    
-    # Try ipapi.co first
-    try:
-        res = requests.get(f"https://ipapi.co/{ip}/json/", timeout=10)
-        res.raise_for_status()
-        data = res.json()
-        
-        # Check if API returned an error (rate limit, invalid IP, etc.)
-        if "error" in data:
-            error_reason = data.get("reason", "Unknown error")
-            print(f"ipapi.co error for {ip}: {error_reason}")
-            # If rate limited, try fallback API
-            if "rate" in error_reason.lower() or "limit" in error_reason.lower():
-                return get_ip_info_fallback(ip)
-            return None
-        
-        # Check if we have valid data
-        if "ip" in data:
-            return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching IP info from ipapi.co for {ip}: {e}")
-    
-    # Fallback to alternative API
-    return get_ip_info_fallback(ip)
-
-def get_ip_info_fallback(ip):
-    """Fallback API using ip-api.com (free, no key required)."""
-    try:
-        # ip-api.com returns data in different format, need to map fields
-        res = requests.get(f"http://ip-api.com/json/{ip}", timeout=10)
-        res.raise_for_status()
-        data = res.json()
-        
-        # Check if query was successful
-        if data.get("status") == "success":
-            # Map ip-api.com fields to match ipapi.co format
-            mapped_data = {
-                "ip": data.get("query", ip),
-                "city": data.get("city"),
-                "region": data.get("regionName"),
-                "country": data.get("countryCode"),
-                "country_name": data.get("country"),
-                "latitude": data.get("lat"),
-                "longitude": data.get("lon"),
-                "timezone": data.get("timezone"),
-                "org": data.get("isp"),
-                "asn": data.get("as", "").split()[0] if data.get("as") else None,
-                "postal": data.get("zip"),
-            }
-            print(f"Using fallback API (ip-api.com) for {ip}")
-            return mapped_data
-        else:
-            print(f"Fallback API error for {ip}: {data.get('message', 'Unknown error')}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching IP info from fallback API for {ip}: {e}")
-        return None
+def start_background_tasks():
+    """Start the My-IP refresh schedule and the cache warm-up, once per process.
+
+    Called when the app is created, so the first requests after a deploy
+    already find a warming cache under gunicorn or flask run as well as
+    under __main__; shared with the ASGI entry point.
+    """
+    global _background_pid
+    if not BACKGROUND_TASKS or _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+    if ip_lookup.MY_IP_REFRESH_INTERVAL > 0:
+        ip_lookup.my_ip_info_cache.start(ip_lookup.MY_IP_REFRESH_INTERVAL)
+    ip_warmup.start_warmup()
+
+def _restart_background_tasks_in_child():
+    """Threads do not survive fork(): a worker forked after the app was created
+    (e.g. gunicorn --preload) starts its own tasks."""
+    global _background_lock
+    _background_lock = threading.Lock()
+    if _background_pid is not None:
+        start_background_tasks()
+
+if hasattr(os, "register_at_fork"):  # POSIX only
+    os.register_at_fork(after_in_child=_restart_background_tasks_in_child)
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     """Main route to show both IPv4 and IPv6 addresses, or lookup a specific IP."""
-    # Get timestamp for when data was fetched
-    fetch_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
     # Check if user submitted an IP address to lookup
     # Only get from form if it's a POST request (to avoid conflicts with "My IP" button)
     lookup_ip = None
@@ -92,39 +79,233 @@ def index():
         lookup_ip = request.form.get("ip_address", "").strip()
         if not lookup_ip:  # Empty string or whitespace only
             lookup_ip = None
-    
+
+    if PAGE_STREAMING:
+        future = _page_executor.submit(resolve_index, lookup_ip)
+        return Response(stream_with_context(stream_index(lookup_ip, future)), mimetype="text/html")
+    context = index_context(lookup_ip, *resolve_index(lookup_ip))
+    with TEMPLATE_RENDER_SECONDS.time("index.html"):
+        return render_template("index.html", **context)
+
+def resolve_index(lookup_ip):
+    """Run the index page's lookup; returns (ipv4, ipv6, info_data, fetched_at, classification)."""
+    classification = None
     if lookup_ip:
-        # User wants to lookup a specific IP
-        lookup_ipv4 = lookup_ip if ":" not in lookup_ip else None
-        lookup_ipv6 = lookup_ip if ":" in lookup_ip else None
-        info_data = get_ip_info(lookup_ip)
+        # User wants to lookup a specific IP; malformed and non-routable
+        # addresses are answered locally without calling the providers
+        classification, info_data = get_ip_info_classified(lookup_ip)
+        # When the answer came from the cache, show when it was really fetched
+        fetched_at = ip_lookup.ip_info_cache.fetched_at(classification.ip) if info_data else None
         # For lookup mode, show the looked-up IP
-        ipv4 = lookup_ipv4
-        ipv6 = lookup_ipv6
+        ipv4, ipv6 = split_lookup_ip(lookup_ip)
+    else:
+        # My IP mode: served from memory, refreshed in the background once stale
+        (ipv4, ipv6, info_data), fetched_at = ip_lookup.get_my_ip_info_cached()
+    return ipv4, ipv6, info_data, fetched_at, classification
+
+def stream_index(lookup_ip, future):
+    """Yield the index page in two parts: the shell right away, then the info card.
+
+    The shell (head, search form, map container and a placeholder card with
+    any already-known IP badges) does not depend on the lookup, so the
+    browser can start loading styles and scripts while the providers answer.
+
+    future is the already-submitted resolve_index(lookup_ip) call.
+    """
+    ipv4, ipv6 = split_lookup_ip(lookup_ip) if lookup_ip else (None, None)
+    # Render inside the timer but yield outside it, so the client's read time is not counted
+    with TEMPLATE_RENDER_SECONDS.time("index_shell.html"):
+        shell = (render_template("_index_top.html", lookup_ip=lookup_ip)
+                 + render_template("_index_pending.html", lookup_ip=lookup_ip, ipv4=ipv4, ipv6=ipv6))
+    yield shell
+
+    wait([future], timeout=PAGE_TIMEOUT)
+    timed_out = None
+    if not future.done():
+        timed_out = PAGE_TIMEOUT
+        classification = classify(lookup_ip) if lookup_ip else None
+        result = (ipv4, ipv6, None, None, classification)
     else:
-        # Auto-detect user's IP addresses (My IP mode)
-        ipv4 = get_ip_address("ipv4")
-        ipv6 = get_ip_address("ipv6")
-        
-        # Try to get geolocation info - prefer IPv4, fallback to IPv6
-        info_data = None
-        if ipv4:
-            info_data = get_ip_info(ipv4)
-        if not info_data and ipv6:
-            info_data = get_ip_info(ipv6)
+        try:
+            result = future.result()
+        except Exception as e:
+            # Headers are already sent, so show the failure in the page instead
+            log_event("index_error", ip=lookup_ip, error=repr(e))
+            result = (ipv4, ipv6, None, None, None)
+    context = index_context(lookup_ip, *result, timed_out=timed_out)
+    with TEMPLATE_RENDER_SECONDS.time("index_card.html"):
+        card = render_template("_index_card.html", **context) + "\n</body>\n</html>\n"
+    yield card
 
+def split_lookup_ip(lookup_ip):
+    """Return (ipv4, ipv6) for a looked-up address, with the other family None."""
+    return (lookup_ip if ":" not in lookup_ip else None,
+            lookup_ip if ":" in lookup_ip else None)
+
+def index_context(lookup_ip, ipv4, ipv6, info_data, fetched_at=None, classification=None, timed_out=None):
+    """Build the index.html template variables; shared with the ASGI entry point.
+
+    fetched_at is the wall-clock time the data was fetched (None for just now);
+    timed_out is the timeout in seconds when a streamed page gave up waiting.
+    """
     # Determine if lookup failed and provide error context
     lookup_failed = lookup_ip and not info_data
     auto_detect_failed = not lookup_ip and not info_data
-    
-    return render_template("index.html", 
-                         ipv4=ipv4, 
-                         ipv6=ipv6, 
-                         data=info_data, 
-                         fetch_time=fetch_time, 
-                         lookup_ip=lookup_ip or "", 
-                         lookup_failed=lookup_failed,
-                         auto_detect_failed=auto_detect_failed)
+    now = datetime.now().timestamp()
+    fetched_at = now if fetched_at is None else fetched_at
+    return dict(ipv4=ipv4,
+                ipv6=ipv6,
+                data=info_data,
+                fetch_time=datetime.fromtimestamp(fetched_at).strftime("%Y-%m-%d %H:%M:%S"),
+                data_age=format_age(now - fetched_at),
+                lookup_ip=lookup_ip or "",
+                lookup_failed=lookup_failed,
+                auto_detect_failed=auto_detect_failed,
+                classification=classification,
+                timed_out=timed_out)
+
+def format_age(seconds):
+    """Describe an age in seconds the way the page shows it, e.g. "3 minutes ago"."""
+    if seconds < 5:
+        return "just now"
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60), ("second", 1)):
+        if seconds >= size:
+            count = int(seconds // size)
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+
+@app.route("/metrics")
+def metrics():
+    """Expose lookup, provider and rendering metrics in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route("/api/ip/<ip>")
+def api_ip(ip):
+    """Return the normalized location record for one IP as JSON."""
+    return answer_response(*api_ip_answer(ip, *get_ip_info_classified(ip)))
+
+@app.route("/api/me")
+def api_me():
+    """Return this server's public addresses and the location record of the preferred one."""
+    return answer_response(*api_me_answer(*ip_lookup.get_my_ip_info_cached()))
+
+@app.route("/api/ready")
+def api_ready():
+    """Report whether the startup cache warm-up has finished; the app serves requests either way."""
+    return answer_response(*api_ready_answer())
+
+# The JSON endpoints decide their answer as (status, payload, cache, headers), shared
+# with the ASGI entry point. cache holds Cache-Control directives; a public 200
+# answer also gets an ETag and is answered with 304 when the client's copy matches.
+
+def api_ip_answer(ip, classification, data):
+    """Answer for /api/ip/<ip> given get_ip_info_classified(ip)."""
+    if classification.category == INVALID:
+        return 400, {"error": f"Invalid IP address: {ip}"}, {}, {}
+
+    ip = classification.ip
+    data = normalize_record(data)
+    if data is None and not classification.routable:
+        # Never sent upstream; the answer only changes with the IANA registries
+        payload = {"error": f"{ip}: {classification.description}", "ip": ip, "category": classification.category}
+        return 422, payload, {"public": True, "max_age": ip_lookup.CACHE_TTL}, {}
+    if data is None:
+        return 404, {"error": f"No location data for {ip}"}, {"max_age": ip_lookup.CACHE_NEGATIVE_TTL}, {}
+    max_age = ttl_left(ip_lookup.ip_info_cache, ip, ip_lookup.CACHE_TTL)
+    return 200, data, {"public": True, "max_age": max_age}, {}
+
+def api_me_answer(my_ip_info, fetched_at):
+    """Answer for /api/me given get_my_ip_info_cached()."""
+    ipv4, ipv6, info_data = my_ip_info
+    if info_data is None:
+        payload = {"error": "Could not detect this server's public IP address", "ipv4": ipv4, "ipv6": ipv6}
+        return 502, payload, {"no_store": True}, {}
+    payload = {"ipv4": ipv4, "ipv6": ipv6, "data": normalize_record(info_data)}
+    age = datetime.now().timestamp() - fetched_at
+    cache = {"public": True, "max_age": max(0, int(ip_lookup.MY_IP_TTL - age))}
+    # Served from memory, possibly while a refresh runs; tell clients how old it is
+    return 200, payload, cache, {"Age": str(max(0, int(age)))}
+
+def api_ready_answer():
+    """Answer for /api/ready."""
+    status = ip_warmup.warmer.status()
+    return 200 if status["ready"] else 503, status, {"no_store": True}, {}
+
+def canonical_json(payload):
+    """Serialize payload canonically, so equal records always hash to the same strong ETag; returns (body, etag)."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return body, hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+def answer_response(status, payload, cache, headers):
+    """Flask response for a JSON endpoint's answer."""
+    if status == 200 and cache.get("public"):
+        response = conditional_json(payload, cache["max_age"])
+    else:
+        response = Response(canonical_json(payload)[0], status=status, mimetype="application/json")
+        for directive, value in cache.items():
+            setattr(response.cache_control, directive, value)
+    response.headers.update(headers)
+    return response
+
+def ttl_left(cache, key, default):
+    """Whole seconds until key expires from cache (default when it is not cached there)."""
+    remaining = cache.expires_in(key)
+    return default if remaining is None else int(remaining)
+
+def conditional_json(payload, max_age):
+    """JSON response with a strong content-hash ETag, answered with 304 when the client's copy matches.
+
+    The body is serialized canonically so equal records always hash to the same ETag.
+    """
+    body, etag = canonical_json(payload)
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+@app.route("/api/lookup/batch", methods=["POST"])
+def lookup_batch():
+    """Look up many IPs at once, streaming one NDJSON line per IP as results complete.
+
+    Accepts a JSON list of IPs (or {"ips": [...]}) or a newline-delimited text body.
+    """
+    ips, error = batch_request_ips(request.get_data(as_text=True), request.is_json)
+    if error is not None:
+        return jsonify(error=error[1]), error[0]
+
+    def generate():
+        for ip, data in get_ip_info_batch(ips):
+            yield batch_line(ip, data)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+def batch_request_ips(text, is_json):
+    """Parse a batch request body; returns (ips, None) or (None, (status, error message)).
+
+    Shared with the ASGI entry point.
+    """
+    if is_json:
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            payload = payload.get("ips")
+        if not isinstance(payload, list) or not all(isinstance(ip, str) for ip in payload):
+            return None, (400, "Expected a JSON list of IP address strings")
+        ips = payload
+    else:
+        ips = text.splitlines()
+
+    if len(ips) > BATCH_MAX_IPS:
+        return None, (413, f"At most {BATCH_MAX_IPS} IP addresses per request")
+    return ips, None
+
+def batch_line(ip, data):
+    """One NDJSON line of a batch response."""
+    return json.dumps({"ip": ip, "data": normalize_record(data)}) + "\n"
+
+start_background_tasks()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,193 @@
+"""ASGI entry point serving the index page and JSON API with the asyncio lookup client.
+
+Each in-flight lookup is a coroutine rather than a blocked worker thread, so a
+single process can wait on thousands of slow upstream calls. The routes and
+answers are the same as the Flask app's:
+
+    uvicorn ip_info_asgi:app
+"""
+import asyncio
+import threading
+from urllib.parse import parse_qs, unquote
+
+import ip_lookup
+import ip_lookup_async
+import ip_warmup
+from ip_info import (api_ip_answer, api_me_answer, api_ready_answer, app as flask_app, batch_line,
+                     batch_request_ips, canonical_json, index_context, split_lookup_ip,
+                     start_background_tasks)
+from ip_metrics import CONTENT_TYPE, REGISTRY, TEMPLATE_RENDER_SECONDS
+
+
+async def read_body(receive):
+    """Collect the full request body from ASGI receive events."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_response(send, status, body, content_type=b"text/plain; charset=utf-8", headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def request_header(scope, name):
+    """Value of the request header name (lowercase bytes), decoded, or ""."""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches etag."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.replace("W/", "", 1).strip('"') == etag for tag in tags)
+
+
+async def send_answer(scope, send, status, payload, cache, headers):
+    """Send a JSON endpoint's (status, payload, cache, headers) answer like ip_info.answer_response()."""
+    body, etag = canonical_json(payload)
+    directives = [directive.replace("_", "-") if value is True else f"{directive.replace('_', '-')}={value}"
+                  for directive, value in cache.items()]
+    extra = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    if directives:
+        extra.append((b"cache-control", ", ".join(directives).encode()))
+    if status == 200 and cache.get("public"):
+        extra.append((b"etag", f'"{etag}"'.encode()))
+        if etag_matches(request_header(scope, b"if-none-match"), etag):
+            await send_response(send, 304, b"", b"application/json", extra)
+            return
+    await send_response(send, status, body.encode("utf-8"), b"application/json", extra)
+
+
+async def lookup_batch(send, body, is_json):
+    """Async version of ip_info.lookup_batch(), streaming NDJSON lines as results complete."""
+    ips, error = batch_request_ips(body.decode("utf-8", errors="replace"), is_json)
+    if error is not None:
+        await send_answer({}, send, error[0], {"error": error[1]}, {}, {})
+        return
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")]})
+    # The batch client is thread-based; step through its results off the event loop
+    results = ip_lookup.get_ip_info_batch(ips)
+    # Closing waits for a step still running in its thread (e.g. after a cancelled await)
+    step_lock = threading.Lock()
+
+    def step():
+        with step_lock:
+            return next(results, None)
+
+    def close():
+        with step_lock:
+            results.close()
+
+    try:
+        while True:
+            item = await asyncio.to_thread(step)
+            if item is None:
+                break
+            await send({"type": "http.response.body", "body": batch_line(*item).encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # A client that went away must not leave the batch's executor and upstream calls running
+        await asyncio.to_thread(close)
+
+
+async def index(method, body):
+    """Async version of ip_info.index(); returns the rendered page."""
+    lookup_ip = None
+    if method == "POST":
+        form = parse_qs(body.decode("utf-8", errors="replace"))
+        lookup_ip = form.get("ip_address", [""])[0].strip() or None
+
+    classification = None
+    if lookup_ip:
+        classification, info_data = await ip_lookup_async.get_ip_info_classified(lookup_ip)
+        fetched_at = ip_lookup.ip_info_cache.fetched_at(classification.ip) if info_data else None
+        ipv4, ipv6 = split_lookup_ip(lookup_ip)
+    else:
+        # Shared stale-while-revalidate value; only the very first call waits on detection
+        (ipv4, ipv6, info_data), fetched_at = await asyncio.to_thread(ip_lookup.get_my_ip_info_cached)
+
+    template = flask_app.jinja_env.get_template("index.html")
+    with TEMPLATE_RENDER_SECONDS.time("index.html"):
+        return template.render(**index_context(lookup_ip, ipv4, ipv6, info_data, fetched_at, classification))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_background_tasks()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            ip_lookup.my_ip_info_cache.stop()
+            ip_warmup.warmer.stop()
+            await ip_lookup_async.async_provider_client.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    # Servers that skip the lifespan protocol still get the background tasks
+    start_background_tasks()
+
+    if scope["path"] == "/metrics":
+        await send_response(send, 200, REGISTRY.render().encode("utf-8"), CONTENT_TYPE.encode())
+        return
+    path = scope["path"]
+    if path.startswith("/api/"):
+        await api(scope, receive, send, path)
+        return
+    if path != "/":
+        await send_response(send, 404, b"Not Found")
+        return
+    if scope["method"] not in ("GET", "POST"):
+        await send_response(send, 405, b"Method Not Allowed")
+        return
+
+    body = await read_body(receive)
+    html = await index(scope["method"], body)
+    await send_response(send, 200, html.encode("utf-8"), b"text/html; charset=utf-8")
+
+
+async def api(scope, receive, send, path):
+    """Async versions of ip_info's /api/ routes."""
+    method = scope["method"]
+    if path == "/api/lookup/batch":
+        if method != "POST":
+            await send_response(send, 405, b"Method Not Allowed")
+            return
+        is_json = request_header(scope, b"content-type").split(";")[0].strip().endswith("json")
+        await lookup_batch(send, await read_body(receive), is_json)
+        return
+
+    ip = unquote(path[len("/api/ip/"):]) if path.startswith("/api/ip/") else ""
+    if not ip and path not in ("/api/me", "/api/ready"):
+        await send_response(send, 404, b"Not Found")
+        return
+    if method != "GET":
+        await send_response(send, 405, b"Method Not Allowed")
+        return
+
+    if ip:
+        answer = api_ip_answer(ip, *await ip_lookup_async.get_ip_info_classified(ip))
+    elif path == "/api/me":
+        answer = api_me_answer(*await asyncio.to_thread(ip_lookup.get_my_ip_info_cached))
+    else:
+        answer = api_ready_answer()
+    await send_answer(scope, send, *answer)
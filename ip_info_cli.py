@@ -0,0 +1,150 @@
+import argparse
+import csv
+import fileinput
+import ipaddress
+import json
+import re
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from colorama import Fore, Style, init as colorama_init
+from tabulate import tabulate
+
+from ip_lookup import get_ip_info_classified
+
+# Columns written for every resolved address
+FIELDS = ("ip", "country", "region", "city", "org", "asn", "latitude", "longitude")
+
+# Loose candidates; every match is validated with ipaddress before it is looked up
+IPV4_CANDIDATE = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
+IPV6_CANDIDATE = re.compile(r"(?<![0-9A-Fa-f:])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![0-9A-Fa-f:])")
+
+# Rows per tabulated block; tables are printed in blocks so memory stays bounded
+TABLE_BLOCK_SIZE = 50
+
+
+def read_lines(paths):
+    """Yield lines from the given files, or stdin for none / "-"."""
+    # openhook rather than encoding=/errors=, which need Python 3.10
+    hook = fileinput.hook_encoded("utf-8", "replace")
+    with fileinput.input(files=paths or ("-",), openhook=hook) as lines:
+        yield from lines
+
+
+def extract_ips(lines):
+    """Yield every valid IPv4/IPv6 address found in the lines, in order of appearance."""
+    for line in lines:
+        for pattern in (IPV4_CANDIDATE, IPV6_CANDIDATE):
+            for match in pattern.findall(line):
+                try:
+                    yield str(ipaddress.ip_address(match))
+                except ValueError:
+                    continue
+
+
+def lookup_ip(ip):
+    """Look up one address; only globally routable ones are sent to the providers."""
+    return get_ip_info_classified(ip)[1]
+
+
+def resolve(ips, workers=8, window=None, lookup=None):
+    """Look up ips with a bounded worker pool, yielding (ip, data) in input order.
+
+    At most window lookups are queued at a time, so memory stays constant on
+    unbounded input; concurrent lookups of the same IP share one future.
+    lookup replaces lookup_ip as the per-address function.
+    """
+    window = window or workers * 4
+    lookup = lookup or lookup_ip
+    in_flight = {}
+    pending = deque()
+
+    def release(ip):
+        entry = in_flight[ip]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del in_flight[ip]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as executor:
+        for ip in ips:
+            entry = in_flight.get(ip)
+            if entry is None:
+                entry = in_flight[ip] = [executor.submit(lookup, ip), 0]
+            entry[1] += 1
+            pending.append((ip, entry[0]))
+            while len(pending) >= window:
+                ip_done, future = pending.popleft()
+                release(ip_done)
+                yield ip_done, future.result()
+        while pending:
+            ip_done, future = pending.popleft()
+            release(ip_done)
+            yield ip_done, future.result()
+
+
+def to_row(ip, data):
+    """Flatten a lookup result into the FIELDS columns."""
+    data = data or {}
+    row = {field: data.get(field) for field in FIELDS}
+    row["ip"] = ip
+    return row
+
+
+def write_ndjson(results, out):
+    for ip, data in results:
+        out.write(json.dumps(to_row(ip, data)) + "\n")
+
+
+def write_csv(results, out):
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    for ip, data in results:
+        writer.writerow(to_row(ip, data))
+
+
+def write_table(results, out, color=False):
+    while True:
+        block = list(islice(results, TABLE_BLOCK_SIZE))
+        if not block:
+            break
+        rows = []
+        for ip, data in block:
+            row = to_row(ip, data)
+            values = ["N/A" if row[field] is None else row[field] for field in FIELDS]
+            if color:
+                tint = Fore.CYAN if data else Fore.RED
+                values[0] = f"{tint}{values[0]}{Style.RESET_ALL}"
+            rows.append(values)
+        out.write(tabulate(rows, headers=FIELDS, tablefmt="simple") + "\n\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrich IP addresses (or log lines containing them) with geolocation data.")
+    parser.add_argument("files", nargs="*", help="Files to read (default: stdin)")
+    parser.add_argument("-f", "--format", choices=("ndjson", "csv", "table"), default="table", help="Output format")
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Concurrent lookups")
+    parser.add_argument("--no-color", action="store_true", help="Disable colored table output")
+    args = parser.parse_args(argv)
+
+    results = resolve(extract_ips(read_lines(args.files)), workers=args.workers)
+    out = sys.stdout
+    try:
+        if args.format == "ndjson":
+            write_ndjson(results, out)
+        elif args.format == "csv":
+            write_csv(results, out)
+        else:
+            color = not args.no_color and out.isatty()
+            if color:
+                colorama_init()
+            write_table(results, out, color=color)
+    except BrokenPipeError:
+        # Output piped into e.g. `head`; stop quietly
+        sys.stderr.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,82 +1,27 @@
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
-import requests
+from tkinter import ttk, scrolledtext, messagebox, filedialog
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import csv
 import webbrowser
 import threading
 
-def get_ip_address(version="ipv4"):
-    """Retrieve public IPv4 or IPv6 address using ipify."""
-    try:
-        if version == "ipv6":
-            res = requests.get("https://api6.ipify.org?format=json", timeout=5)
-        else:
-            res = requests.get("https://api.ipify.org?format=json", timeout=5)
-        res.raise_for_status()
-        return res.json().get("ip")
-    except requests.exceptions.RequestException:
-        return None
+from ip_info_cli import FIELDS, extract_ips, resolve, to_row
+from ip_lookup import get_ip_info_classified, get_my_ip_info
 
-def get_ip_info(ip):
-    """Retrieve IP information (location, ISP, ASN, etc.) using ipapi.co with fallback."""
-    if not ip:
-        return None
-    
-    # Try ipapi.co first
-    try:
-        res = requests.get(f"https://ipapi.co/{ip}/json/", timeout=10)
-        res.raise_for_status()
-        data = res.json()
-        
-        # Check if API returned an error (rate limit, invalid IP, etc.)
-        if "error" in data:
-            error_reason = data.get("reason", "Unknown error")
-            print(f"ipapi.co error for {ip}: {error_reason}")
-            # If rate limited, try fallback API
-            if "rate" in error_reason.lower() or "limit" in error_reason.lower():
-                return get_ip_info_fallback(ip)
-            return None
-        
-        # Check if we have valid data
-        if "ip" in data:
-            return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching IP info from ipapi.co for {ip}: {e}")
-    
-    # Fallback to alternative API
-    return get_ip_info_fallback(ip)
+# Lookup requests arriving within this many ms of each other (e.g. repeated Enter) run once
+LOOKUP_DEBOUNCE_MS = 250
 
-def get_ip_info_fallback(ip):
-    """Fallback API using ip-api.com (free, no key required)."""
-    try:
-        res = requests.get(f"http://ip-api.com/json/{ip}", timeout=10)
-        res.raise_for_status()
-        data = res.json()
-        
-        # Check if query was successful
-        if data.get("status") == "success":
-            # Map ip-api.com fields to match ipapi.co format
-            mapped_data = {
-                "ip": data.get("query", ip),
-                "city": data.get("city"),
-                "region": data.get("regionName"),
-                "country": data.get("countryCode"),
-                "country_name": data.get("country"),
-                "latitude": data.get("lat"),
-                "longitude": data.get("lon"),
-                "timezone": data.get("timezone"),
-                "org": data.get("isp"),
-                "asn": data.get("as", "").split()[0] if data.get("as") else None,
-                "postal": data.get("zip"),
-            }
-            print(f"Using fallback API (ip-api.com) for {ip}")
-            return mapped_data
-        else:
-            print(f"Fallback API error for {ip}: {data.get('message', 'Unknown error')}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching IP info from fallback API for {ip}: {e}")
-        return None
+# Concurrent lookups in the batch tab
+BATCH_WORKERS = 8
+
+# Batch table rows inserted per UI tick, and the tick interval (ms); keeps the window responsive
+BATCH_INSERT_CHUNK = 200
+BATCH_POLL_MS = 50
+
+# Batch table and CSV export columns
+BATCH_COLUMNS = FIELDS + ("status",)
 
 class IPLocationFinderGUI:
     def __init__(self, root):
@@ -168,8 +113,16 @@ class IPLocationFinderGUI:
                                   foreground=self.colors['text_secondary'])
         subtitle_label.pack(anchor=tk.W, pady=(5, 0))
         
+        # Tabs: single lookup and batch lookup
+        notebook = ttk.Notebook(main_frame)
+        notebook.pack(fill=tk.BOTH, expand=True)
+        single_tab = tk.Frame(notebook, bg=self.colors['bg_primary'], padx=10, pady=15)
+        batch_tab = tk.Frame(notebook, bg=self.colors['bg_primary'], padx=10, pady=15)
+        notebook.add(single_tab, text="  Single Lookup  ")
+        notebook.add(batch_tab, text="  Batch Lookup  ")
+        
         # Search card
-        search_card = ttk.LabelFrame(main_frame, text="  IP Lookup  ", 
+        search_card = ttk.LabelFrame(single_tab, text="  IP Lookup  ", 
                                      style='Card.TLabelframe', padding=20)
         search_card.pack(fill=tk.X, pady=(0, 15))
         search_card.columnconfigure(1, weight=1)
@@ -195,7 +148,7 @@ class IPLocationFinderGUI:
         self.my_ip_btn.pack(side=tk.LEFT)
         
         # Status indicator with icon
-        status_frame = tk.Frame(main_frame, bg=self.colors['bg_primary'])
+        status_frame = tk.Frame(single_tab, bg=self.colors['bg_primary'])
         status_frame.pack(fill=tk.X, pady=(0, 15))
         
         self.status_icon = ttk.Label(status_frame, text="●", 
@@ -211,7 +164,7 @@ class IPLocationFinderGUI:
         self.status_label.pack(side=tk.LEFT)
         
         # Results card
-        results_card = ttk.LabelFrame(main_frame, text="  IP Information  ", 
+        results_card = ttk.LabelFrame(single_tab, text="  IP Information  ", 
                                      style='Card.TLabelframe', padding=15)
         results_card.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
         results_card.columnconfigure(0, weight=1)
@@ -235,9 +188,10 @@ class IPLocationFinderGUI:
         )
         self.results_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.results_text.config(state=tk.DISABLED)
+        self._configure_result_tags()
         
         # Bottom section with map button and timestamp
-        bottom_frame = tk.Frame(main_frame, bg=self.colors['bg_primary'])
+        bottom_frame = tk.Frame(single_tab, bg=self.colors['bg_primary'])
         bottom_frame.pack(fill=tk.X)
         
         self.map_btn = ttk.Button(bottom_frame, text="🗺️  View on Map", 
@@ -257,11 +211,101 @@ class IPLocationFinderGUI:
         self.current_lat = None
         self.current_lon = None
         
+        # Single-lookup scheduling: only the newest request's result is shown
+        self.lookup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="gui-lookup")
+        self.lookup_generation = 0
+        self.pending_lookup = None
+        self.lookup_future = None
+        
+        self._build_batch_tab(batch_tab)
+    
+    def _build_batch_tab(self, tab):
+        """Create the batch lookup widgets: input, controls, progress and results table."""
+        input_card = ttk.LabelFrame(tab, text="  IP Addresses (one per line, or any text containing them)  ",
+                                    style='Card.TLabelframe', padding=15)
+        input_card.pack(fill=tk.X, pady=(0, 15))
+        input_card.columnconfigure(0, weight=1)
+        
+        self.batch_input = scrolledtext.ScrolledText(input_card, height=6, wrap=tk.NONE,
+                                                     font=('Consolas', 10), bg='#FAFBFC',
+                                                     relief='flat', borderwidth=0)
+        self.batch_input.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        
+        controls = tk.Frame(input_card, bg=self.colors['bg_secondary'])
+        controls.grid(row=1, column=0, sticky=tk.W, pady=(10, 0))
+        
+        self.batch_open_btn = ttk.Button(controls, text="📂 Open File...",
+                                         command=self.open_batch_file, style='Secondary.TButton')
+        self.batch_open_btn.pack(side=tk.LEFT, padx=(0, 8))
+        
+        self.batch_start_btn = ttk.Button(controls, text="🔍 Lookup All",
+                                          command=self.start_batch, style='Primary.TButton')
+        self.batch_start_btn.pack(side=tk.LEFT, padx=(0, 8))
+        
+        self.batch_cancel_btn = ttk.Button(controls, text="Cancel", state=tk.DISABLED,
+                                           command=self.cancel_batch, style='Secondary.TButton')
+        self.batch_cancel_btn.pack(side=tk.LEFT, padx=(0, 8))
+        
+        self.batch_export_btn = ttk.Button(controls, text="💾 Export CSV...", state=tk.DISABLED,
+                                           command=self.export_batch_csv, style='Secondary.TButton')
+        self.batch_export_btn.pack(side=tk.LEFT)
+        
+        progress_frame = tk.Frame(tab, bg=self.colors['bg_primary'])
+        progress_frame.pack(fill=tk.X, pady=(0, 15))
+        
+        self.batch_progress = ttk.Progressbar(progress_frame, mode='determinate')
+        self.batch_progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 12))
+        
+        self.batch_status_label = ttk.Label(progress_frame, text="Ready",
+                                            font=('Segoe UI', 10),
+                                            background=self.colors['bg_primary'],
+                                            foreground=self.colors['text_secondary'])
+        self.batch_status_label.pack(side=tk.LEFT)
+        
+        table_card = ttk.LabelFrame(tab, text="  Results  ", style='Card.TLabelframe', padding=15)
+        table_card.pack(fill=tk.BOTH, expand=True)
+        table_card.columnconfigure(0, weight=1)
+        table_card.rowconfigure(0, weight=1)
+        
+        self.batch_table = ttk.Treeview(table_card, columns=BATCH_COLUMNS, show='headings')
+        for column in BATCH_COLUMNS:
+            self.batch_table.heading(column, text=column.replace("_", " ").title())
+            self.batch_table.column(column, width=90, stretch=True)
+        self.batch_table.column("ip", width=140)
+        self.batch_table.tag_configure('failed', foreground=self.colors['error'])
+        
+        scroll_y = ttk.Scrollbar(table_card, orient=tk.VERTICAL, command=self.batch_table.yview)
+        scroll_x = ttk.Scrollbar(table_card, orient=tk.HORIZONTAL, command=self.batch_table.xview)
+        self.batch_table.configure(yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set)
+        self.batch_table.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scroll_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        scroll_x.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        
+        # Rows finished by the worker thread and not yet shown; deque appends/pops are thread-safe
+        self.batch_pending = deque()
+        self.batch_rows = []
+        self.batch_total = 0
+        self.batch_cancel = threading.Event()
+        self.batch_running = False
+        self.batch_error = None
+        
+    def _configure_result_tags(self):
+        """Configure the results text tags once; rendering only refers to them by name."""
+        self.results_text.tag_config('header', foreground=self.colors['accent_blue'], font=('Consolas', 10, 'bold'))
+        self.results_text.tag_config('label', foreground=self.colors['text_secondary'], font=('Consolas', 10))
+        self.results_text.tag_config('value', foreground=self.colors['text_primary'], font=('Consolas', 10, 'bold'))
+        self.results_text.tag_config('error_header', foreground=self.colors['error'], font=('Consolas', 10, 'bold'))
+        self.results_text.tag_config('error_label', foreground=self.colors['text_primary'], font=('Consolas', 10, 'bold'))
+        self.results_text.tag_config('error_value', foreground=self.colors['error'], font=('Consolas', 10, 'bold'))
+        self.results_text.tag_config('error_text', foreground=self.colors['text_secondary'], font=('Consolas', 10))
+    
     def update_status(self, message, color="success"):
-        """Update status label with icon."""
+        """Update status label with icon; Tk redraws it once the current event is handled."""
         color_map = {
             'success': self.colors['success'],
+            'green': self.colors['success'],
             'error': self.colors['error'],
+            'red': self.colors['error'],
             'warning': self.colors['warning'],
             'blue': self.colors['accent_blue'],
             'black': self.colors['text_primary']
@@ -269,187 +313,170 @@ class IPLocationFinderGUI:
         status_color = color_map.get(color, self.colors['text_secondary'])
         self.status_icon.config(foreground=status_color)
         self.status_label.config(text=message, foreground=status_color)
-        self.root.update_idletasks()
     
     def update_timestamp(self):
         """Update timestamp label."""
         fetch_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.timestamp_label.config(text=f"Last fetched: {fetch_time}")
     
-    def display_results(self, ipv4, ipv6, data, lookup_ip=None):
-        """Display IP information in the text widget with enhanced formatting."""
-        self.results_text.config(state=tk.NORMAL)
-        self.results_text.delete(1.0, tk.END)
+    @staticmethod
+    def _section(parts, title, tag='header'):
+        """Append a boxed section title to parts."""
+        parts.extend(["╔" + "═" * 68 + "╗\n" + "║" + title.center(68) + "║\n" + "╚" + "═" * 68 + "╝\n\n", tag])
+    
+    @staticmethod
+    def _field(parts, label, value):
+        """Append a label/value line to parts."""
+        parts.extend([label, 'label', f"{value}\n", 'value'])
+    
+    def display_results(self, ipv4, ipv6, data, lookup_ip=None, classification=None):
+        """Display an IPRecord in the text widget with enhanced formatting.
+        
+        The text is assembled as (chars, tag) pairs and inserted in one call,
+        so a redraw costs the same however many lookups came before it.
+        """
+        parts = []
         
         if data:
-            # IP Addresses section
-            self.results_text.insert(tk.END, "╔" + "═" * 68 + "╗\n", 'header')
-            self.results_text.insert(tk.END, "║" + " " * 25 + "IP ADDRESSES" + " " * 32 + "║\n", 'header')
-            self.results_text.insert(tk.END, "╚" + "═" * 68 + "╝\n", 'header')
-            self.results_text.insert(tk.END, "\n")
+            self._section(parts, "IP ADDRESSES")
             if ipv4:
-                self.results_text.insert(tk.END, f"  IPv4:  ", 'label')
-                self.results_text.insert(tk.END, f"{ipv4}\n", 'value')
+                self._field(parts, "  IPv4:  ", ipv4)
             if ipv6:
-                self.results_text.insert(tk.END, f"  IPv6:  ", 'label')
-                self.results_text.insert(tk.END, f"{ipv6}\n", 'value')
-            self.results_text.insert(tk.END, "\n\n")
-            
-            # Location Details section
-            self.results_text.insert(tk.END, "╔" + "═" * 68 + "╗\n", 'header')
-            self.results_text.insert(tk.END, "║" + " " * 23 + "LOCATION DETAILS" + " " * 30 + "║\n", 'header')
-            self.results_text.insert(tk.END, "╚" + "═" * 68 + "╝\n", 'header')
-            self.results_text.insert(tk.END, "\n")
-            self.results_text.insert(tk.END, f"  City:         ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('city', 'N/A')}\n", 'value')
-            self.results_text.insert(tk.END, f"  Region:       ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('region', 'N/A')}\n", 'value')
-            self.results_text.insert(tk.END, f"  Country:      ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('country_name', 'N/A')} ({data.get('country', 'N/A')})\n", 'value')
-            self.results_text.insert(tk.END, f"  Postal Code:  ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('postal', 'N/A')}\n", 'value')
-            self.results_text.insert(tk.END, f"  Timezone:     ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('timezone', 'N/A')}\n", 'value')
-            self.results_text.insert(tk.END, "\n\n")
+                self._field(parts, "  IPv6:  ", ipv6)
+            parts.extend(["\n\n", ()])
             
-            # Coordinates section
-            self.results_text.insert(tk.END, "╔" + "═" * 68 + "╗\n", 'header')
-            self.results_text.insert(tk.END, "║" + " " * 26 + "COORDINATES" + " " * 31 + "║\n", 'header')
-            self.results_text.insert(tk.END, "╚" + "═" * 68 + "╝\n", 'header')
-            self.results_text.insert(tk.END, "\n")
-            lat = data.get('latitude')
-            lon = data.get('longitude')
-            self.results_text.insert(tk.END, f"  Latitude:     ", 'label')
-            self.results_text.insert(tk.END, f"{lat if lat else 'N/A'}\n", 'value')
-            self.results_text.insert(tk.END, f"  Longitude:    ", 'label')
-            self.results_text.insert(tk.END, f"{lon if lon else 'N/A'}\n", 'value')
-            self.results_text.insert(tk.END, "\n\n")
+            self._section(parts, "LOCATION DETAILS")
+            self._field(parts, "  City:         ", data.city or 'N/A')
+            self._field(parts, "  Region:       ", data.region or 'N/A')
+            self._field(parts, "  Country:      ", f"{data.country_name or 'N/A'} ({data.country or 'N/A'})")
+            self._field(parts, "  Postal Code:  ", data.postal or 'N/A')
+            self._field(parts, "  Timezone:     ", data.timezone or 'N/A')
+            parts.extend(["\n\n", ()])
             
-            # Network Information section
-            self.results_text.insert(tk.END, "╔" + "═" * 68 + "╗\n", 'header')
-            self.results_text.insert(tk.END, "║" + " " * 19 + "NETWORK INFORMATION" + " " * 30 + "║\n", 'header')
-            self.results_text.insert(tk.END, "╚" + "═" * 68 + "╝\n", 'header')
-            self.results_text.insert(tk.END, "\n")
-            self.results_text.insert(tk.END, f"  ISP/Organization:  ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('org', 'N/A')}\n", 'value')
-            self.results_text.insert(tk.END, f"  ASN:              ", 'label')
-            self.results_text.insert(tk.END, f"{data.get('asn', 'N/A')}\n", 'value')
+            self._section(parts, "COORDINATES")
+            lat = data.latitude
+            lon = data.longitude
+            self._field(parts, "  Latitude:     ", lat if lat else 'N/A')
+            self._field(parts, "  Longitude:    ", lon if lon else 'N/A')
+            parts.extend(["\n\n", ()])
             
-            # Configure text tags for styling
-            self.results_text.tag_config('header', foreground=self.colors['accent_blue'], font=('Consolas', 10, 'bold'))
-            self.results_text.tag_config('label', foreground=self.colors['text_secondary'], font=('Consolas', 10))
-            self.results_text.tag_config('value', foreground=self.colors['text_primary'], font=('Consolas', 10, 'bold'))
+            self._section(parts, "NETWORK INFORMATION")
+            self._field(parts, "  ISP/Organization:  ", data.org or 'N/A')
+            self._field(parts, "  ASN:              ", data.asn or 'N/A')
             
             # Store coordinates for map
             self.current_lat = lat
             self.current_lon = lon
-            if lat and lon:
-                self.map_btn.config(state=tk.NORMAL)
-            else:
-                self.map_btn.config(state=tk.DISABLED)
+            map_state = tk.NORMAL if lat and lon else tk.DISABLED
         else:
-            # Error display
-            self.results_text.insert(tk.END, "╔" + "═" * 68 + "╗\n", 'error_header')
-            self.results_text.insert(tk.END, "║" + " " * 28 + "ERROR" + " " * 36 + "║\n", 'error_header')
-            self.results_text.insert(tk.END, "╚" + "═" * 68 + "╝\n", 'error_header')
-            self.results_text.insert(tk.END, "\n")
-            if lookup_ip:
-                self.results_text.insert(tk.END, f"  Could not find information for IP: ", 'error_label')
-                self.results_text.insert(tk.END, f"{lookup_ip}\n\n", 'error_value')
-                self.results_text.insert(tk.END, "  Possible reasons:\n", 'error_label')
-                self.results_text.insert(tk.END, "    • Invalid IP address format\n", 'error_text')
-                self.results_text.insert(tk.END, "    • API rate limiting (try again in a few minutes)\n", 'error_text')
-                self.results_text.insert(tk.END, "    • IP address not found in database\n", 'error_text')
+            self._section(parts, "ERROR", 'error_header')
+            if lookup_ip and classification is not None and not classification.routable:
+                parts.extend(["  Not a public address: ", 'error_label',
+                              f"{lookup_ip}\n\n", 'error_value',
+                              f"  {classification.description}\n"
+                              "  It has no geolocation, so it was not sent to the lookup services.\n", 'error_text'])
+            elif lookup_ip:
+                parts.extend(["  Could not find information for IP: ", 'error_label',
+                              f"{lookup_ip}\n\n", 'error_value',
+                              "  Possible reasons:\n", 'error_label',
+                              "    • Invalid IP address format\n"
+                              "    • API rate limiting (try again in a few minutes)\n"
+                              "    • IP address not found in database\n", 'error_text'])
             else:
-                self.results_text.insert(tk.END, "  Unable to retrieve IP location information.\n\n", 'error_label')
-                self.results_text.insert(tk.END, "  Possible reasons:\n", 'error_label')
-                self.results_text.insert(tk.END, "    • API rate limiting (try again in a few minutes)\n", 'error_text')
-                self.results_text.insert(tk.END, "    • Network connectivity issues\n", 'error_text')
-                self.results_text.insert(tk.END, "    • Temporary API unavailability\n", 'error_text')
-            
-            # Configure error text tags
-            self.results_text.tag_config('error_header', foreground=self.colors['error'], font=('Consolas', 10, 'bold'))
-            self.results_text.tag_config('error_label', foreground=self.colors['text_primary'], font=('Consolas', 10, 'bold'))
-            self.results_text.tag_config('error_value', foreground=self.colors['error'], font=('Consolas', 10, 'bold'))
-            self.results_text.tag_config('error_text', foreground=self.colors['text_secondary'], font=('Consolas', 10))
-            
-            self.map_btn.config(state=tk.DISABLED)
+                parts.extend(["  Unable to retrieve IP location information.\n\n"
+                              "  Possible reasons:\n", 'error_label',
+                              "    • API rate limiting (try again in a few minutes)\n"
+                              "    • Network connectivity issues\n"
+                              "    • Temporary API unavailability\n", 'error_text'])
+            map_state = tk.DISABLED
         
+        self.results_text.config(state=tk.NORMAL)
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, *parts)
         self.results_text.config(state=tk.DISABLED)
+        self.map_btn.config(state=map_state)
         self.current_data = data
     
     def lookup_ip(self):
-        """Lookup a specific IP address."""
+        """Lookup a specific IP address; rapid repeats are debounced into one lookup."""
         ip = self.ip_entry.get().strip()
         if not ip:
             messagebox.showwarning("Warning", "Please enter an IP address to lookup.")
             return
         
         self.update_status("Looking up IP address...", "blue")
-        self.lookup_btn.config(state=tk.DISABLED)
-        self.my_ip_btn.config(state=tk.DISABLED)
-        
-        # Run in thread to avoid freezing GUI
-        thread = threading.Thread(target=self._lookup_ip_thread, args=(ip,))
-        thread.daemon = True
-        thread.start()
+        self._schedule_lookup(self._lookup_ip_work, ip)
+    
+    def get_my_ip(self):
+        """Get user's own IP addresses."""
+        self.ip_entry.delete(0, tk.END)
+        self.update_status("Detecting your IP addresses...", "blue")
+        self._schedule_lookup(self._get_my_ip_work)
+    
+    def _schedule_lookup(self, work, *args):
+        """Start work after LOOKUP_DEBOUNCE_MS, superseding any pending or running lookup.
+        
+        Each request gets a new generation number; a lookup that is already
+        running cannot be interrupted, but its result is dropped when it comes
+        back with an older generation.
+        """
+        self.lookup_generation += 1
+        generation = self.lookup_generation
+        if self.pending_lookup is not None:
+            self.root.after_cancel(self.pending_lookup)
+        if self.lookup_future is not None:
+            # Only succeeds while it is still queued behind another lookup
+            self.lookup_future.cancel()
+        self.pending_lookup = self.root.after(LOOKUP_DEBOUNCE_MS, self._start_lookup, generation, work, args)
+    
+    def _start_lookup(self, generation, work, args):
+        self.pending_lookup = None
+        if generation == self.lookup_generation:
+            self.lookup_future = self.lookup_executor.submit(work, generation, *args)
+    
+    def _deliver(self, generation, callback, *args):
+        """Run callback on the UI thread unless a newer lookup has superseded this one."""
+        def deliver():
+            if generation == self.lookup_generation:
+                callback(*args)
+        self.root.after(0, deliver)
     
-    def _lookup_ip_thread(self, ip):
-        """Thread function for IP lookup."""
+    def _lookup_ip_work(self, generation, ip):
+        """Worker function for IP lookup."""
         try:
             lookup_ipv4 = ip if ":" not in ip else None
             lookup_ipv6 = ip if ":" in ip else None
-            info_data = get_ip_info(ip)
+            # Malformed and non-routable input is answered locally, without a network call
+            classification, info_data = get_ip_info_classified(ip)
             
-            self.root.after(0, self._lookup_complete, lookup_ipv4, lookup_ipv6, info_data, ip)
+            self._deliver(generation, self._lookup_complete, lookup_ipv4, lookup_ipv6, info_data, ip, classification)
         except Exception as e:
-            self.root.after(0, self._lookup_error, str(e))
+            self._deliver(generation, self._lookup_error, str(e))
     
-    def _lookup_complete(self, ipv4, ipv6, info_data, lookup_ip):
+    def _lookup_complete(self, ipv4, ipv6, info_data, lookup_ip, classification=None):
         """Callback after lookup completes."""
-        self.display_results(ipv4, ipv6, info_data, lookup_ip)
+        self.display_results(ipv4, ipv6, info_data, lookup_ip, classification)
         self.update_timestamp()
         if info_data:
             self.update_status("Lookup completed successfully!", "green")
+        elif classification is not None and not classification.routable:
+            self.update_status(f"Not looked up: {classification.description}", "red")
         else:
             self.update_status("Lookup failed. See details above.", "red")
-        self.lookup_btn.config(state=tk.NORMAL)
-        self.my_ip_btn.config(state=tk.NORMAL)
     
     def _lookup_error(self, error_msg):
         """Callback for lookup error."""
         self.update_status(f"Error: {error_msg}", "red")
-        self.lookup_btn.config(state=tk.NORMAL)
-        self.my_ip_btn.config(state=tk.NORMAL)
     
-    def get_my_ip(self):
-        """Get user's own IP addresses."""
-        self.ip_entry.delete(0, tk.END)
-        self.update_status("Detecting your IP addresses...", "blue")
-        self.lookup_btn.config(state=tk.DISABLED)
-        self.my_ip_btn.config(state=tk.DISABLED)
-        
-        # Run in thread to avoid freezing GUI
-        thread = threading.Thread(target=self._get_my_ip_thread)
-        thread.daemon = True
-        thread.start()
-    
-    def _get_my_ip_thread(self):
-        """Thread function for getting user's IP."""
+    def _get_my_ip_work(self, generation):
+        """Worker function for getting user's IP."""
         try:
-            ipv4 = get_ip_address("ipv4")
-            ipv6 = get_ip_address("ipv6")
+            # Detect and geolocate concurrently - prefer IPv4, fallback to IPv6
+            ipv4, ipv6, info_data = get_my_ip_info()
             
-            # Try to get geolocation info - prefer IPv4, fallback to IPv6
-            info_data = None
-            if ipv4:
-                info_data = get_ip_info(ipv4)
-            if not info_data and ipv6:
-                info_data = get_ip_info(ipv6)
-            
-            self.root.after(0, self._my_ip_complete, ipv4, ipv6, info_data)
+            self._deliver(generation, self._my_ip_complete, ipv4, ipv6, info_data)
         except Exception as e:
-            self.root.after(0, self._my_ip_error, str(e))
+            self._deliver(generation, self._lookup_error, str(e))
     
     def _my_ip_complete(self, ipv4, ipv6, info_data):
         """Callback after getting user's IP completes."""
@@ -459,14 +486,123 @@ class IPLocationFinderGUI:
             self.update_status("IP detection completed successfully!", "green")
         else:
             self.update_status("IP detection failed. See details above.", "red")
-        self.lookup_btn.config(state=tk.NORMAL)
-        self.my_ip_btn.config(state=tk.NORMAL)
     
-    def _my_ip_error(self, error_msg):
-        """Callback for getting user's IP error."""
-        self.update_status(f"Error: {error_msg}", "red")
-        self.lookup_btn.config(state=tk.NORMAL)
-        self.my_ip_btn.config(state=tk.NORMAL)
+
+    def open_batch_file(self):
+        """Load a text file of IPs (or log lines containing them) into the batch input."""
+        path = filedialog.askopenfilename(title="Open IP list",
+                                          filetypes=[("Text files", "*.txt *.log *.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not read {path}: {e}")
+            return
+        self.batch_input.delete(1.0, tk.END)
+        self.batch_input.insert(tk.END, text)
+    
+    def start_batch(self):
+        """Resolve every address in the batch input with a bounded worker pool."""
+        # Duplicates are looked up and listed once
+        ips = list(dict.fromkeys(extract_ips(self.batch_input.get(1.0, tk.END).splitlines())))
+        if not ips:
+            messagebox.showwarning("Warning", "No valid IP addresses found in the input.")
+            return
+        
+        self.batch_table.delete(*self.batch_table.get_children())
+        self.batch_pending.clear()
+        self.batch_rows = []
+        self.batch_total = len(ips)
+        self.batch_cancel.clear()
+        self.batch_error = None
+        self.batch_running = True
+        self.batch_progress.config(maximum=len(ips), value=0)
+        self.batch_status_label.config(text=f"0 / {len(ips)}")
+        self.batch_start_btn.config(state=tk.DISABLED)
+        self.batch_open_btn.config(state=tk.DISABLED)
+        self.batch_export_btn.config(state=tk.DISABLED)
+        self.batch_cancel_btn.config(state=tk.NORMAL)
+        
+        thread = threading.Thread(target=self._batch_thread, args=(ips,), name="batch-lookup")
+        thread.daemon = True
+        thread.start()
+        self.root.after(BATCH_POLL_MS, self._drain_batch)
+    
+    def _batch_thread(self, ips):
+        """Worker thread: feeds the pool and queues finished rows for the UI."""
+        try:
+            for ip, (classification, data) in resolve(iter(ips), workers=BATCH_WORKERS,
+                                                      lookup=get_ip_info_classified):
+                if data:
+                    status = "found"
+                elif not classification.routable:
+                    status = classification.category
+                else:
+                    status = "not found"
+                row = to_row(ip, data)
+                row["status"] = status
+                self.batch_pending.append(row)
+                if self.batch_cancel.is_set():
+                    break
+        except Exception as e:
+            self.batch_error = str(e)
+        finally:
+            self.batch_running = False
+    
+    def _drain_batch(self):
+        """Move up to BATCH_INSERT_CHUNK finished rows into the table, then reschedule."""
+        running = self.batch_running
+        for _ in range(min(BATCH_INSERT_CHUNK, len(self.batch_pending))):
+            row = self.batch_pending.popleft()
+            self.batch_rows.append(row)
+            values = ["" if row[column] is None else row[column] for column in BATCH_COLUMNS]
+            self.batch_table.insert('', tk.END, values=values,
+                                    tags=() if row["status"] == "found" else ('failed',))
+        
+        done = len(self.batch_rows)
+        self.batch_progress.config(value=done)
+        if running or self.batch_pending:
+            self.batch_status_label.config(text=f"{done} / {self.batch_total}")
+            self.root.after(BATCH_POLL_MS, self._drain_batch)
+            return
+        
+        found = sum(1 for row in self.batch_rows if row["status"] == "found")
+        if self.batch_error:
+            summary = f"Error: {self.batch_error}"
+        elif done < self.batch_total:
+            summary = "cancelled"
+        else:
+            summary = ""
+        self.batch_status_label.config(
+            text=f"{done} / {self.batch_total} looked up, {found} found" + (f" ({summary})" if summary else ""))
+        self.batch_start_btn.config(state=tk.NORMAL)
+        self.batch_open_btn.config(state=tk.NORMAL)
+        self.batch_cancel_btn.config(state=tk.DISABLED)
+        self.batch_export_btn.config(state=tk.NORMAL if self.batch_rows else tk.DISABLED)
+    
+    def cancel_batch(self):
+        """Stop queueing new lookups; those already running still finish."""
+        self.batch_cancel.set()
+        self.batch_cancel_btn.config(state=tk.DISABLED)
+        self.batch_status_label.config(text="Cancelling...")
+    
+    def export_batch_csv(self):
+        """Write every batch result to a CSV file."""
+        path = filedialog.asksaveasfilename(title="Export results", defaultextension=".csv",
+                                            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=BATCH_COLUMNS)
+                writer.writeheader()
+                writer.writerows(self.batch_rows)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not write {path}: {e}")
+            return
+        self.batch_status_label.config(text=f"Exported {len(self.batch_rows)} rows to {path}")
     
     def open_map(self):
         """Open location in web browser map."""
@@ -481,6 +617,7 @@ def main():
     root = tk.Tk()
     app = IPLocationFinderGUI(root)
     root.mainloop()
+    app.lookup_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,152 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+
+def parse_sample_rates(text):
+    """Parse "event=rate,event=rate" (rates between 0 and 1) into a dict."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+# Fraction of each event type that is logged (default 1), e.g. "fallback_used=0.1"
+LOG_SAMPLE_RATES = parse_sample_rates(os.environ.get("IP_LOG_SAMPLE", ""))
+# Most records per second logged for any one event type; 0 means no cap
+LOG_RATE_LIMIT = float(os.environ.get("IP_LOG_RATE_LIMIT", 50))
+# Records waiting for the writer thread; further records are dropped, never waited for
+LOG_QUEUE_SIZE = int(os.environ.get("IP_LOG_QUEUE_SIZE", 10000))
+
+_STOP = object()
+
+
+class EventLogger:
+    """Structured event log written as JSON lines by a background thread.
+
+    log() never blocks: a record is sampled, checked against its event type's
+    rate cap (a token bucket of rate_limit records per second) and put on a
+    bounded queue, or dropped and counted. The first record let through after
+    a capped stretch carries the number of records suppressed in between.
+    stream defaults to whatever sys.stderr is when the record is written, so
+    the log never mixes with results a tool prints to stdout.
+    """
+
+    def __init__(self, stream=None, sample_rates=None, rate_limit=50.0, maxsize=10000, clock=time.monotonic):
+        self.stream = stream
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limit = rate_limit
+        self._clock = clock
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        # event -> [tokens, last refill time, suppressed since last emitted record]
+        self._buckets = {}
+        self._thread = None
+        self.logged = 0
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+    def log(self, event, **fields):
+        """Queue an event record; returns False when it was sampled out, capped or dropped."""
+        rate = self.sample_rates.get(event, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            with self._lock:
+                self.sampled_out += 1
+            return False
+
+        record = {"ts": round(time.time(), 3), "event": event}
+        record.update(fields)
+        if rate < 1.0:
+            record["sample_rate"] = rate
+        with self._lock:
+            if self.rate_limit > 0:
+                now = self._clock()
+                bucket = self._buckets.get(event)
+                if bucket is None:
+                    bucket = self._buckets[event] = [self.rate_limit, now, 0]
+                bucket[0] = min(self.rate_limit, bucket[0] + (now - bucket[1]) * self.rate_limit)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    bucket[2] += 1
+                    self.rate_limited += 1
+                    return False
+                bucket[0] -= 1
+                if bucket[2]:
+                    record["suppressed"] = bucket[2]
+                    bucket[2] = 0
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.logged += 1
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Write whatever else is already waiting in one go
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            records = [record for record in batch if record is not _STOP]
+            try:
+                if records:
+                    stream = self.stream or sys.stderr
+                    stream.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+                    stream.flush()
+            except Exception:
+                with self._lock:
+                    self.write_errors += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Wait until every queued record has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write the remaining records and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {"logged": self.logged, "sampled_out": self.sampled_out, "rate_limited": self.rate_limited,
+                    "dropped": self.dropped, "write_errors": self.write_errors, "queued": self._queue.qsize()}
+
+
+# Shared by the lookup modules; replace it to redirect or reconfigure the event log
+event_log = EventLogger(sample_rates=LOG_SAMPLE_RATES, rate_limit=LOG_RATE_LIMIT, maxsize=LOG_QUEUE_SIZE)
+
+
+def log_event(event, **fields):
+    """Log an event to the shared event_log without blocking."""
+    return event_log.log(event, **fields)
+
+
+# Records still queued at exit are written before the process ends
+atexit.register(lambda: event_log.close())
@@ -0,0 +1,653 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import requests
+
+from ip_cache import MISSING, PrefixCache, StaleWhileRevalidate, TTLCache
+from ip_classify import INVALID, classify
+from ip_flight import SingleFlight
+from ip_guard import ProviderGuard, parse_rate
+from ip_hedge import Hedger
+from ip_http import provider_client
+import ip_log
+from ip_log import log_event
+from ip_metrics import LOOKUP_SECONDS, CallbackMetric, track_upstream
+from ip_record import RECORD_FIELDS, IPRecord
+from ip_ranges import load_range_table
+from ip_store import LookupStore
+
+# Cache settings (seconds / entry counts), overridable from the environment
+CACHE_TTL = int(os.environ.get("IP_CACHE_TTL", 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("IP_CACHE_MAX_ENTRIES", 4096))
+CACHE_NEGATIVE_TTL = int(os.environ.get("IP_CACHE_NEGATIVE_TTL", 300))
+CACHE_NEGATIVE_MAX_ENTRIES = int(os.environ.get("IP_CACHE_NEGATIVE_MAX_ENTRIES", 1024))
+
+# Shared by the web app and the GUI; replace or clear() it to reconfigure.
+ip_info_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL,
+                         negative_maxsize=CACHE_NEGATIVE_MAX_ENTRIES, negative_ttl=CACHE_NEGATIVE_TTL)
+
+# Optional prefix tier behind the exact-IP cache: addresses in the same IPv4 /24 or
+# IPv6 /48 (configurable; 0 disables a family) share one record once
+# PREFIX_CONFIRMATIONS exact lookups in the network agreed on the location.
+PREFIX_CACHE_ENABLED = os.environ.get("IP_PREFIX_CACHE", "0") == "1"
+PREFIX_V4 = int(os.environ.get("IP_PREFIX_V4", 24))
+PREFIX_V6 = int(os.environ.get("IP_PREFIX_V6", 48))
+PREFIX_CONFIRMATIONS = int(os.environ.get("IP_PREFIX_CONFIRMATIONS", 2))
+ip_prefix_cache = PrefixCache(PREFIX_V4, PREFIX_V6, PREFIX_CONFIRMATIONS, maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+
+PROVIDER_IPAPI = "ipapi.co"
+PROVIDER_IP_API = "ip-api.com"
+PROVIDER_IP_API_BATCH = "ip-api.com/batch"
+PROVIDER_IPIFY = "ipify.org"
+
+# Upstream endpoints, overridable so the app can be pointed at a local stub
+IPIFY_V4_URL = os.environ.get("IP_IPIFY_V4_URL", "https://api.ipify.org?format=json")
+IPIFY_V6_URL = os.environ.get("IP_IPIFY_V6_URL", "https://api6.ipify.org?format=json")
+IPAPI_URL = os.environ.get("IP_IPAPI_URL", "https://ipapi.co/{ip}/json/")
+IP_API_URL = os.environ.get("IP_IP_API_URL", "http://ip-api.com/json/{ip}")
+
+# Coalesces concurrent identical upstream calls (same IP, or the same self-detection)
+ip_flight = SingleFlight()
+
+# Durable on-disk store behind the in-process cache; set IP_STORE_PATH to "" to disable it.
+STORE_PATH = os.environ.get("IP_STORE_PATH", os.path.join(os.path.expanduser("~"), ".ip_location_finder", "lookups.db"))
+STORE_TTL = int(os.environ.get("IP_STORE_TTL", 86400))
+STORE_VACUUM_INTERVAL = int(os.environ.get("IP_STORE_VACUUM_INTERVAL", 600))
+# Request history kept in the store for cache warm-up: a request's weight halves
+# every IP_HISTORY_HALF_LIFE seconds; only the IP_HISTORY_SIZE hottest IPs are kept
+HISTORY_HALF_LIFE = float(os.environ.get("IP_HISTORY_HALF_LIFE", 86400))
+HISTORY_SIZE = int(os.environ.get("IP_HISTORY_SIZE", 10000))
+
+# Overall time budget (seconds) for detecting and geolocating the caller's own addresses
+MY_IP_DEADLINE = float(os.environ.get("IP_MY_IP_DEADLINE", 10))
+
+# The server's own addresses and location are detected once and served from memory;
+# after MY_IP_TTL seconds the next request triggers a background refresh, and with
+# IP_MY_IP_REFRESH_INTERVAL set the web app also refreshes them on that schedule.
+MY_IP_TTL = int(os.environ.get("IP_MY_IP_TTL", 300))
+MY_IP_REFRESH_INTERVAL = float(os.environ.get("IP_MY_IP_REFRESH_INTERVAL", 0))
+
+# Runs the concurrent address detection / geolocation calls of get_my_ip_info()
+_my_ip_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="my-ip")
+
+# Hedged requests: fire ip-api.com in parallel once ipapi.co is slower than this
+# percentile of its recent latencies (or IP_HEDGE_DELAY seconds until enough samples exist)
+HEDGE_ENABLED = os.environ.get("IP_HEDGE", "1") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("IP_HEDGE_PERCENTILE", 95))
+HEDGE_DELAY = float(os.environ.get("IP_HEDGE_DELAY", 1.0))
+
+ip_hedger = Hedger(ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge"),
+                   percentile=HEDGE_PERCENTILE, default_delay=HEDGE_DELAY)
+
+# Bulk lookups go to ip-api.com's batch endpoint, which accepts up to 100 IPs per call
+IP_API_BATCH_URL = os.environ.get("IP_API_BATCH_URL", "http://ip-api.com/batch")
+BATCH_CHUNK_SIZE = int(os.environ.get("IP_BATCH_CHUNK_SIZE", 100))
+BATCH_MAX_WORKERS = int(os.environ.get("IP_BATCH_MAX_WORKERS", 4))
+BATCH_TIMEOUT = float(os.environ.get("IP_BATCH_TIMEOUT", 15))
+
+# Optional offline range database (CSV, or a file compiled by ip_ranges.py) consulted
+# before any network call
+RANGES_PATH = os.environ.get("IP_RANGES_PATH", "")
+
+# Client-side quotas ("requests/seconds") matching each provider's published free tier
+RATE_LIMITS = {
+    PROVIDER_IPAPI: parse_rate(os.environ.get("IP_RATE_IPAPI", "1000/86400")),
+    PROVIDER_IP_API: parse_rate(os.environ.get("IP_RATE_IP_API", "45/60")),
+    PROVIDER_IP_API_BATCH: parse_rate(os.environ.get("IP_RATE_IP_API_BATCH", "15/60")),
+}
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+BREAKER_THRESHOLD = int(os.environ.get("IP_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("IP_BREAKER_COOLDOWN", 30))
+# Rate-limit/breaker state shared by all processes; set IP_LIMITS_PATH to "" to keep it per process.
+LIMITS_PATH = os.environ.get("IP_LIMITS_PATH", os.path.join(os.path.expanduser("~"), ".ip_location_finder", "limits.db"))
+
+_lookup_store = None
+_lookup_store_lock = threading.Lock()
+_provider_guard = None
+_provider_guard_lock = threading.Lock()
+_range_table = None
+_range_table_lock = threading.Lock()
+
+
+def get_range_table():
+    """Return the local RangeTable, loading it on first use (None when not configured)."""
+    global _range_table
+    if not RANGES_PATH:
+        return None
+    if _range_table is None:
+        with _range_table_lock:
+            if _range_table is None:
+                try:
+                    _range_table = load_range_table(RANGES_PATH)
+                except (OSError, ValueError) as e:
+                    log_event("ranges_error", operation="open", path=RANGES_PATH, error=str(e))
+                    return None
+    return _range_table
+
+
+def get_lookup_store():
+    """Return the shared LookupStore, opening it on first use (None when disabled)."""
+    global _lookup_store
+    if not STORE_PATH:
+        return None
+    if _lookup_store is None:
+        with _lookup_store_lock:
+            if _lookup_store is None:
+                try:
+                    store = LookupStore(STORE_PATH, ttl=STORE_TTL, negative_ttl=CACHE_NEGATIVE_TTL,
+                                        history_half_life=HISTORY_HALF_LIFE, history_size=HISTORY_SIZE)
+                except (OSError, sqlite3.Error) as e:
+                    log_event("store_error", operation="open", path=STORE_PATH, error=str(e))
+                    return None
+                store.start_vacuum(STORE_VACUUM_INTERVAL)
+                # Keep the request history of this run for the next one's warm-up
+                atexit.register(store.flush_hits)
+                _lookup_store = store
+    return _lookup_store
+
+
+def local_sources_loaded():
+    """Whether the lookup store and range table are open or disabled, so using them never waits on loading."""
+    return (_lookup_store is not None or not STORE_PATH) and (_range_table is not None or not RANGES_PATH)
+
+
+def load_local_sources():
+    """Open the lookup store and load the range table now instead of on first use."""
+    get_lookup_store()
+    get_range_table()
+
+
+def get_provider_guard():
+    """Return the shared ProviderGuard, creating it on first use."""
+    global _provider_guard
+    if _provider_guard is None:
+        with _provider_guard_lock:
+            if _provider_guard is None:
+                options = dict(limits=RATE_LIMITS, failure_threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN)
+                try:
+                    _provider_guard = ProviderGuard(LIMITS_PATH or None, **options)
+                except (OSError, sqlite3.Error) as e:
+                    log_event("guard_error", operation="open", path=LIMITS_PATH, error=str(e))
+                    _provider_guard = ProviderGuard(None, **options)
+    return _provider_guard
+
+
+def request_outcome(error):
+    """Classify a failed requests call as "rate_limited" (HTTP 429), "timeout" or "error"."""
+    response = getattr(error, "response", None)
+    if response is not None and response.status_code == 429:
+        return "rate_limited"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    return "error"
+
+
+def lookup_outcome(provider):
+    """Label an uncached lookup by who answered it: "success", "fallback_used" or "failed"."""
+    if provider == PROVIDER_IPAPI:
+        return "success"
+    return "fallback_used" if provider == PROVIDER_IP_API else "failed"
+
+
+def observe_lookup(ip, provider, seconds):
+    """Record one uncached lookup: its latency metric and a "lookup" log event."""
+    outcome = lookup_outcome(provider)
+    LOOKUP_SECONDS.observe(seconds, outcome)
+    log_event("lookup", ip=ip, provider=provider, outcome=outcome, latency_ms=round(seconds * 1000, 1),
+              fallback_used=provider == PROVIDER_IP_API)
+
+
+def get_ip_address(version="ipv4"):
+    """Retrieve public IPv4 or IPv6 address using ipify."""
+    # Concurrent "My IP" requests share one detection call
+    return ip_flight.do(("address", version), _fetch_ip_address, version)
+
+
+def _fetch_ip_address(version):
+    with track_upstream(PROVIDER_IPIFY) as call:
+        try:
+            if version == "ipv6":
+                res = provider_client.get(IPIFY_V6_URL, timeout=5) #REST API for IPv6
+            else:
+                res = provider_client.get(IPIFY_V4_URL, timeout=5) #REST API for IPv4
+            res.raise_for_status()
+            return res.json().get("ip")
+        except requests.exceptions.RequestException as e:
+            call.outcome = request_outcome(e)
+            return None
+
+
+def get_my_ip_info(deadline=None):
+    """Detect the public IPv4 and IPv6 addresses and geolocate them concurrently.
+
+    Both detections start at once and each address is geolocated as soon as it
+    is known. Returns (ipv4, ipv6, info_data) as soon as the preferred result is
+    in (IPv4 geolocation, else IPv6), or whatever is available when the deadline
+    passes; calls still in flight are cancelled or ignored.
+    """
+    deadline = MY_IP_DEADLINE if deadline is None else deadline
+    end = time.monotonic() + deadline
+
+    detect = {
+        _my_ip_executor.submit(get_ip_address, "ipv4"): "ipv4",
+        _my_ip_executor.submit(get_ip_address, "ipv6"): "ipv6",
+    }
+    geolocate = {}
+    addresses = {}
+    infos = {}
+    pending = set(detect)
+
+    while pending:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in detect:
+                version = detect[future]
+                addresses[version] = future.result()
+                if addresses[version]:
+                    lookup = _my_ip_executor.submit(get_ip_info, addresses[version])
+                    geolocate[lookup] = version
+                    pending.add(lookup)
+            else:
+                infos[geolocate[future]] = future.result()
+
+        if infos.get("ipv4"):
+            break
+        # IPv4 has no answer to give, so IPv6 geolocation becomes the preferred result
+        ipv4_settled = "ipv4" in infos or ("ipv4" in addresses and not addresses["ipv4"])
+        if ipv4_settled and "ipv6" in infos:
+            break
+
+    for future in pending:
+        future.cancel()
+
+    info_data = infos.get("ipv4") or infos.get("ipv6")
+    return addresses.get("ipv4"), addresses.get("ipv6"), info_data
+
+
+def get_my_ip_info_cached():
+    """Return ((ipv4, ipv6, info_data), fetched_at) for this server, without waiting on refreshes.
+
+    Only the very first call blocks on detection. fetched_at is the wall-clock
+    time of the detection, or None if no detection has succeeded yet.
+    """
+    return my_ip_info_cache.get()
+
+
+# Late-bound so tests and callers can replace get_my_ip_info
+# A failed detection reads as "nothing detected", which the page and /api/me already handle
+my_ip_info_cache = StaleWhileRevalidate(lambda: get_my_ip_info(), max_age=MY_IP_TTL,
+                                        accept=lambda result: result[2] is not None, failed=(None, None, None))
+
+
+def get_ip_info(ip):
+    """Retrieve IP information (location, ISP, ASN, etc.), served from the lookup caches when possible."""
+    if not ip:
+        return None
+    ip = ip.strip()
+    record_request(ip)
+
+    cached = get_cached_ip_info(ip)
+    if cached is not MISSING:
+        return cached
+
+    # Concurrent callers for the same IP wait on one upstream lookup
+    return ip_flight.do(("info", ip), _fetch_and_remember, ip)
+
+
+def _fetch_and_remember(ip):
+    # A flight that finished just after our cache miss has already stored the answer
+    cached = ip_info_cache.peek(ip)
+    if cached is not MISSING:
+        return cached
+    return refresh_ip_info(ip)
+
+
+def refresh_ip_info(ip):
+    """Fetch ip from the providers regardless of the caches and remember the answer."""
+    data, provider = fetch_ip_info(ip)
+    remember_ip_info(ip, data, provider)
+    return data
+
+
+def record_request(ip):
+    """Count a request for ip in the store's history, which ranks IPs for cache warm-up."""
+    store = get_lookup_store()
+    if store is not None:
+        store.record_hit(ip)
+
+
+def get_ip_info_classified(ip):
+    """Classify ip locally and only send globally routable addresses to the providers.
+
+    Returns (classification, data). Malformed and special-purpose addresses
+    (private, loopback, documentation, multicast, ...) are answered at once:
+    from the offline range database if it covers them, otherwise None.
+    """
+    classification = classify(ip)
+    if classification.routable:
+        return classification, get_ip_info(classification.ip)
+    if classification.category == INVALID:
+        return classification, None
+    return classification, lookup_local(classification.ip)
+
+
+def get_cached_ip_info(ip, use_store=True, use_prefix=True):
+    """Answer ip from the local range database or the caches, or return MISSING."""
+    local = lookup_local(ip)
+    if local is not None:
+        return local
+
+    cached = ip_info_cache.get(ip)
+    if cached is not MISSING:
+        return cached
+
+    if PREFIX_CACHE_ENABLED and use_prefix:
+        cached = ip_prefix_cache.get(ip)
+        if cached is not MISSING:
+            return cached
+
+    if use_store:
+        return load_stored_ip_info(ip)
+    return MISSING
+
+
+def load_stored_ip_info(ip, min_ttl=0):
+    """Promote ip's record from the store into the in-process cache, or return MISSING.
+
+    Only records that stay valid in the store for at least min_ttl more seconds are used.
+    """
+    store = get_lookup_store()
+    if store is None:
+        return MISSING
+    record = store.get(ip, now=time.time() + min_ttl)
+    if record is None:
+        return MISSING
+    data = IPRecord.from_mapping(record["data"]) if record["data"] is not None else None
+    ip_info_cache.set(ip, data, fetched_at=record["fetched_at"])
+    return data
+
+
+def remember_ip_info(ip, data, provider):
+    """Store a freshly fetched result in the caches."""
+    ip_info_cache.set(ip, data)
+    if PREFIX_CACHE_ENABLED and provider is not None:
+        ip_prefix_cache.observe(ip, data)
+    store = get_lookup_store()
+    # Only persist answers a provider actually gave us, not transient network failures
+    if store is not None and provider is not None:
+        store.set(ip, data, provider)
+
+
+def cache_hit_report():
+    """Compare the exact-IP cache hit ratio with the ratio including prefix-tier hits."""
+    exact = ip_info_cache.stats()
+    prefix = ip_prefix_cache.stats()
+    lookups = exact["hits"] + exact["negative_hits"] + exact["misses"]
+    combined = exact["hits"] + exact["negative_hits"] + prefix["hits"]
+    return {
+        "lookups": lookups,
+        "exact_hit_ratio": exact["hit_ratio"],
+        "prefix_hits": prefix["hits"],
+        "combined_hit_ratio": combined / lookups if lookups else 0.0,
+        "heterogeneous_prefixes": prefix["heterogeneous"],
+    }
+
+
+def lookup_local(ip):
+    """Resolve ip from the offline range database, or None on a miss or when none is loaded."""
+    table = get_range_table()
+    return table.lookup(ip) if table is not None else None
+
+
+def fetch_ip_info(ip):
+    """Retrieve IP information from ipapi.co with fallback, bypassing the caches.
+
+    Returns a (data, provider) tuple; provider is None when no service answered.
+    In hedging mode the fallback is raced against a slow primary instead of
+    only being tried after it fails.
+    """
+    start = time.perf_counter()
+    if HEDGE_ENABLED:
+        data, provider = ip_hedger.run(lambda: _fetch_primary(ip), lambda: _fetch_fallback(ip))
+    else:
+        data, provider = _fetch_primary(ip)
+        if provider is None:
+            # Fallback to alternative API
+            data, provider = _fetch_fallback(ip)
+    observe_lookup(ip, provider, time.perf_counter() - start)
+    return data, provider
+
+
+def _fetch_primary(ip):
+    """Query ipapi.co; provider is None when the fallback API should be tried."""
+    guard = get_provider_guard()
+    if not guard.acquire(PROVIDER_IPAPI):
+        log_event("provider_skipped", ip=ip, provider=PROVIDER_IPAPI, outcome="rejected")
+        return None, None
+    with track_upstream(PROVIDER_IPAPI) as call:
+        try:
+            res = provider_client.get(IPAPI_URL.format(ip=ip), timeout=10)
+            res.raise_for_status()
+            data = res.json()
+        except requests.exceptions.RequestException as e:
+            call.outcome = request_outcome(e)
+            guard.record_failure(PROVIDER_IPAPI, rate_limited=call.outcome == "rate_limited")
+            log_event("upstream_error", ip=ip, provider=PROVIDER_IPAPI, outcome=call.outcome,
+                      latency_ms=call.elapsed_ms(), error=str(e))
+            return None, None
+        finally:
+            # Only calls that reached ipapi.co shape the hedge delay; a rejected call takes no time
+            ip_hedger.record_latency(time.perf_counter() - call.started)
+        if is_ipapi_rate_limited(data):
+            call.outcome = "rate_limited"
+    report_ipapi_answer(guard, data)
+    return interpret_ipapi(data, ip)
+
+
+def is_ipapi_rate_limited(data):
+    """Whether an ipapi.co response body is its rate-limit error."""
+    reason = str(data.get("reason", "")).lower()
+    return "error" in data and ("rate" in reason or "limit" in reason)
+
+
+def report_ipapi_answer(guard, data):
+    """Feed an ipapi.co response body to the circuit breaker."""
+    if is_ipapi_rate_limited(data):
+        guard.record_failure(PROVIDER_IPAPI, rate_limited=True)
+    else:
+        # Error bodies such as "Invalid IP Address" still mean the service is up
+        guard.record_success(PROVIDER_IPAPI)
+
+
+def interpret_ipapi(data, ip):
+    """Turn an ipapi.co response body into (data, provider); provider None means try the fallback."""
+    # Check if API returned an error (rate limit, invalid IP, etc.)
+    if "error" in data:
+        # If rate limited, try fallback API
+        rate_limited = is_ipapi_rate_limited(data)
+        log_event("provider_error", ip=ip, provider=PROVIDER_IPAPI,
+                  outcome="rate_limited" if rate_limited else "error", reason=data.get("reason", "Unknown error"))
+        if rate_limited:
+            return None, None
+        return None, PROVIDER_IPAPI
+
+    # Check if we have valid data
+    if "ip" in data:
+        return IPRecord.from_mapping(data), PROVIDER_IPAPI
+    return None, None
+
+
+def _fetch_fallback(ip):
+    """Run the fallback lookup and tag a successful answer with its provider."""
+    data = get_ip_info_fallback(ip)
+    return data, (PROVIDER_IP_API if data is not None else None)
+
+
+def get_ip_info_fallback(ip):
+    """Fallback API using ip-api.com (free, no key required)."""
+    guard = get_provider_guard()
+    if not guard.acquire(PROVIDER_IP_API):
+        log_event("provider_skipped", ip=ip, provider=PROVIDER_IP_API, outcome="rejected")
+        return None
+    with track_upstream(PROVIDER_IP_API) as call:
+        try:
+            # ip-api.com returns data in different format, need to map fields
+            res = provider_client.get(IP_API_URL.format(ip=ip), timeout=10)
+            res.raise_for_status()
+            data = res.json()
+        except requests.exceptions.RequestException as e:
+            call.outcome = request_outcome(e)
+            guard.record_failure(PROVIDER_IP_API, rate_limited=call.outcome == "rate_limited")
+            log_event("upstream_error", ip=ip, provider=PROVIDER_IP_API, outcome=call.outcome,
+                      latency_ms=call.elapsed_ms(), error=str(e))
+            return None
+    guard.record_success(PROVIDER_IP_API)
+    return interpret_ip_api(data, ip)
+
+
+def interpret_ip_api(data, ip):
+    """Turn an ip-api.com response body into ipapi.co-shaped data, or None on failure."""
+    # Check if query was successful
+    if data.get("status") == "success":
+        log_event("fallback_used", ip=ip, provider=PROVIDER_IP_API, outcome="success")
+        return _map_ip_api(data, ip)
+    log_event("provider_error", ip=ip, provider=PROVIDER_IP_API, outcome="error",
+              reason=data.get("message", "Unknown error"))
+    return None
+
+
+def normalize_record(data):
+    """Return a lookup result as a JSON-ready dict of the RECORD_FIELDS, or None."""
+    if data is None:
+        return None
+    return {field: data.get(field) for field in RECORD_FIELDS}
+
+
+def _map_ip_api(data, ip):
+    """Map ip-api.com fields to match ipapi.co format."""
+    return IPRecord.from_ip_api(data, ip)
+
+
+def get_ip_info_batch(ips, chunk_size=None, max_workers=None):
+    """Look up many IPs, yielding (ip, data) pairs as results become available.
+
+    Duplicates are dropped. Malformed and non-routable addresses are answered
+    at once like in get_ip_info_classified (valid ones under their normalized
+    form), then cached entries; the misses are sent to ip-api.com's batch
+    endpoint in chunks, with at most max_workers chunks in flight, and yielded
+    as each chunk completes.
+    """
+    chunk_size = BATCH_CHUNK_SIZE if chunk_size is None else chunk_size
+    max_workers = BATCH_MAX_WORKERS if max_workers is None else max_workers
+
+    routable = []
+    seen = set()
+    for ip in ips:
+        ip = ip.strip() if ip else ""
+        if not ip:
+            continue
+        classification = classify(ip)
+        if classification.category != INVALID:
+            ip = classification.ip
+        if ip in seen:
+            continue
+        seen.add(ip)
+        if classification.routable:
+            routable.append(ip)
+        elif classification.category == INVALID:
+            yield ip, None
+        else:
+            yield ip, lookup_local(ip)
+
+    misses = []
+    for ip in routable:
+        cached = get_cached_ip_info(ip)
+        if cached is not MISSING:
+            yield ip, cached
+        else:
+            misses.append(ip)
+
+    if not misses:
+        return
+
+    chunks = [misses[i:i + chunk_size] for i in range(0, len(misses), chunk_size)]
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(_fetch_batch_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            for ip, (data, provider) in future.result():
+                remember_ip_info(ip, data, provider)
+                yield ip, data
+    finally:
+        # Runs on early close too (e.g. a streaming client disconnecting)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _fetch_batch_chunk(ips):
+    """Query ip-api.com's batch endpoint for up to 100 IPs; returns [(ip, (data, provider))]."""
+    guard = get_provider_guard()
+    if not guard.acquire(PROVIDER_IP_API_BATCH):
+        log_event("provider_skipped", ips=len(ips), provider=PROVIDER_IP_API_BATCH, outcome="rejected")
+        return [(ip, (None, None)) for ip in ips]
+    with track_upstream(PROVIDER_IP_API_BATCH) as call:
+        try:
+            res = provider_client.post(IP_API_BATCH_URL, json=ips, timeout=BATCH_TIMEOUT)
+            res.raise_for_status()
+            answers = res.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            call.outcome = request_outcome(e)
+            guard.record_failure(PROVIDER_IP_API_BATCH, rate_limited=call.outcome == "rate_limited")
+            log_event("upstream_error", ips=len(ips), provider=PROVIDER_IP_API_BATCH, outcome=call.outcome,
+                      latency_ms=call.elapsed_ms(), error=str(e))
+            return [(ip, (None, None)) for ip in ips]
+    guard.record_success(PROVIDER_IP_API_BATCH)
+
+    results = []
+    # The batch endpoint answers in request order
+    for ip, answer in zip(ips, answers):
+        if answer.get("status") == "success":
+            results.append((ip, (_map_ip_api(answer, ip), PROVIDER_IP_API)))
+        else:
+            results.append((ip, (None, PROVIDER_IP_API)))
+    for ip in ips[len(answers):]:
+        results.append((ip, (None, None)))
+    return results
+
+
+# Values other components already count, read when /metrics is scraped
+CallbackMetric("ip_cache_hits_total", "In-process cache hits (positive and negative).",
+               lambda: ip_info_cache.hits + ip_info_cache.negative_hits, type="counter")
+CallbackMetric("ip_cache_misses_total", "In-process cache misses.",
+               lambda: ip_info_cache.misses, type="counter")
+CallbackMetric("ip_cache_hit_ratio", "In-process cache hit ratio since start.",
+               lambda: ip_info_cache.stats()["hit_ratio"])
+CallbackMetric("ip_cache_entries", "Entries in the in-process cache.", lambda: len(ip_info_cache))
+CallbackMetric("ip_prefix_cache_hits_total", "Exact-cache misses answered by the prefix tier.",
+               lambda: ip_prefix_cache.hits, type="counter")
+CallbackMetric("ip_prefix_cache_heterogeneous_total", "Prefixes found to hold differing locations.",
+               lambda: ip_prefix_cache.heterogeneous, type="counter")
+CallbackMetric("ip_cache_combined_hit_ratio", "Hit ratio of the exact-IP cache and the prefix tier together.",
+               lambda: cache_hit_report()["combined_hit_ratio"])
+CallbackMetric("ip_coalesced_calls_saved_total", "Upstream calls avoided by request coalescing.",
+               lambda: ip_flight.stats()["saved"], type="counter")
+CallbackMetric("ip_hedged_requests_total", "Fallback requests fired because the primary was slow.",
+               lambda: ip_hedger.stats()["hedges"], type="counter")
+CallbackMetric("ip_provider_rejected_total", "Provider calls skipped by the rate limiter or circuit breaker.",
+               lambda: {(provider,): stats["rejected"] for provider, stats in get_provider_guard().stats().items()},
+               type="counter", labelnames=("provider",))
+CallbackMetric("ip_upstream_connections_opened_total", "Connections (TCP/TLS handshakes) opened to each provider host.",
+               lambda: {(host,): stats["handshakes"] for host, stats in provider_client.stats().items()},
+               type="counter", labelnames=("host",))
+CallbackMetric("ip_upstream_connection_reuse_ratio", "Share of requests to each provider host sent on a reused connection.",
+               lambda: {(host,): stats["reuse_ratio"] for host, stats in provider_client.stats().items()},
+               labelnames=("host",))
+CallbackMetric("ip_log_records_dropped_total", "Event log records not written, by reason.",
+               lambda: {(reason,): ip_log.event_log.stats()[reason] for reason in ("rate_limited", "dropped")},
+               type="counter", labelnames=("reason",))
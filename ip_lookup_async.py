@@ -0,0 +1,292 @@
+import asyncio
+import os
+import time
+import weakref
+
+import aiohttp
+
+import ip_lookup
+from ip_cache import MISSING
+from ip_classify import INVALID, classify
+from ip_log import log_event
+from ip_metrics import track_upstream
+
+# Whole-lookup time budget (seconds) for get_ip_info, covering primary and fallback
+LOOKUP_DEADLINE = float(os.environ.get("IP_LOOKUP_DEADLINE", 20))
+# Connections kept by one event loop's session, in total and per provider host
+ASYNC_POOL_LIMIT = int(os.environ.get("IP_ASYNC_POOL_LIMIT", 1000))
+ASYNC_POOL_PER_HOST = int(os.environ.get("IP_ASYNC_POOL_PER_HOST", 100))
+
+# Errors that mean "this provider gave no usable answer"
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+
+class AsyncProviderClient:
+    """Keeps one pooled keep-alive aiohttp session per event loop.
+
+    aiohttp sessions are bound to the loop that created them, so each running
+    loop lazily gets its own connector with per-host connection limits.
+    """
+
+    def __init__(self, limit=ASYNC_POOL_LIMIT, limit_per_host=ASYNC_POOL_PER_HOST, keepalive_timeout=30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout)
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[loop] = session
+        return session
+
+    async def get_json(self, url, timeout):
+        """GET url and decode its JSON body."""
+        async with self._session().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+            res.raise_for_status()
+            return await res.json(content_type=None)
+
+    async def post_json(self, url, payload, timeout):
+        """POST payload as JSON to url and decode the JSON answer."""
+        async with self._session().post(url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+            res.raise_for_status()
+            return await res.json(content_type=None)
+
+    async def close(self):
+        """Close the current loop's session."""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+# Shared by all async provider calls in the process
+async_provider_client = AsyncProviderClient()
+
+
+async def get_ip_address(version="ipv4"):
+    """Retrieve public IPv4 or IPv6 address using ipify."""
+    return await ip_lookup.ip_flight.do_async(("address", version), _fetch_ip_address, version)
+
+
+async def _fetch_ip_address(version):
+    url = ip_lookup.IPIFY_V6_URL if version == "ipv6" else ip_lookup.IPIFY_V4_URL
+    with track_upstream(ip_lookup.PROVIDER_IPIFY) as call:
+        try:
+            data = await async_provider_client.get_json(url, timeout=5)
+            return data.get("ip")
+        except UPSTREAM_ERRORS as e:
+            call.outcome = request_outcome(e)
+            return None
+
+
+async def get_ip_info(ip, deadline=None):
+    """Retrieve IP information, served from the shared caches when possible.
+
+    Network lookups are abandoned after deadline seconds (LOOKUP_DEADLINE by default).
+    """
+    if not ip:
+        return None
+    ip = ip.strip()
+    await load_local_sources()
+    ip_lookup.record_request(ip)
+
+    cached = ip_lookup.get_cached_ip_info(ip, use_store=False)
+    if cached is not MISSING:
+        return cached
+    if ip_lookup.get_lookup_store() is not None:
+        # SQLite may wait on another process's write lock; keep that off the event loop
+        cached = await asyncio.to_thread(ip_lookup.get_cached_ip_info, ip, True, False)
+        if cached is not MISSING:
+            return cached
+
+    # Concurrent lookups of the same IP on this loop share one upstream call
+    return await ip_lookup.ip_flight.do_async(("info", ip), _fetch_and_remember, ip, deadline)
+
+
+async def _fetch_and_remember(ip, deadline):
+    cached = ip_lookup.ip_info_cache.peek(ip)
+    if cached is not MISSING:
+        return cached
+    data, provider = await fetch_ip_info(ip, deadline)
+    await asyncio.to_thread(ip_lookup.remember_ip_info, ip, data, provider)
+    return data
+
+
+async def load_local_sources():
+    """Open the lookup store and load the range table in a worker thread the first time they are needed.
+
+    Opening SQLite or parsing the range file on the event loop would stall
+    every coroutine on it; once loaded, both are used directly.
+    """
+    if not ip_lookup.local_sources_loaded():
+        await asyncio.to_thread(ip_lookup.load_local_sources)
+
+
+async def get_ip_info_classified(ip, deadline=None):
+    """Same contract as ip_lookup.get_ip_info_classified: only routable addresses go upstream."""
+    classification = classify(ip)
+    if classification.routable:
+        return classification, await get_ip_info(classification.ip, deadline)
+    if classification.category == INVALID:
+        return classification, None
+    await load_local_sources()
+    return classification, ip_lookup.lookup_local(classification.ip)
+
+
+async def fetch_ip_info(ip, deadline=None):
+    """Retrieve IP information from ipapi.co with fallback, bypassing the caches.
+
+    Returns a (data, provider) tuple; provider is None when no service answered.
+    """
+    deadline = LOOKUP_DEADLINE if deadline is None else deadline
+    start = time.perf_counter()
+    try:
+        fetch = _fetch_hedged(ip) if ip_lookup.HEDGE_ENABLED else _fetch_sequential(ip)
+        data, provider = await asyncio.wait_for(fetch, deadline)
+    except asyncio.TimeoutError:
+        log_event("lookup_deadline", ip=ip, deadline=deadline)
+        data, provider = None, None
+    ip_lookup.observe_lookup(ip, provider, time.perf_counter() - start)
+    return data, provider
+
+
+async def _fetch_sequential(ip):
+    data, provider = await _fetch_primary(ip)
+    if provider is None:
+        # Fallback to alternative API
+        data, provider = await _fetch_fallback(ip)
+    return data, provider
+
+
+async def _fetch_hedged(ip):
+    """Race ip-api.com against ipapi.co once the latter is slower than the hedge delay."""
+    hedger = ip_lookup.ip_hedger
+    primary = asyncio.ensure_future(_fetch_primary(ip))
+    done, _ = await asyncio.wait({primary}, timeout=hedger.delay())
+    if done:
+        result = primary.result()
+        if result[1] is None:
+            result = await _fetch_fallback(ip)
+        hedger.record_win(result[1])
+        return result
+
+    hedger.record_hedge()
+    pending = {primary, asyncio.ensure_future(_fetch_fallback(ip))}
+    result = (None, None)
+    try:
+        while pending and result[1] is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result()[1] is not None:
+                    result = task.result()
+                    break
+    finally:
+        # Unlike the threaded version, the losing request really is cancelled here
+        for task in pending:
+            task.cancel()
+    hedger.record_win(result[1])
+    return result
+
+
+async def _guarded(call, *args):
+    """Run a provider-guard call, off the loop when it may wait on the shared SQLite file."""
+    if ip_lookup.get_provider_guard().path:
+        return await asyncio.to_thread(call, *args)
+    return call(*args)
+
+
+def request_outcome(error):
+    """Classify a failed aiohttp call as "rate_limited" (HTTP 429), "timeout" or "error"."""
+    if isinstance(error, aiohttp.ClientResponseError) and error.status == 429:
+        return "rate_limited"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return "error"
+
+
+async def _fetch_primary(ip):
+    """Query ipapi.co; provider is None when the fallback API should be tried."""
+    guard = ip_lookup.get_provider_guard()
+    if not await _guarded(guard.acquire, ip_lookup.PROVIDER_IPAPI):
+        log_event("provider_skipped", ip=ip, provider=ip_lookup.PROVIDER_IPAPI, outcome="rejected")
+        return None, None
+    with track_upstream(ip_lookup.PROVIDER_IPAPI) as call:
+        try:
+            data = await async_provider_client.get_json(ip_lookup.IPAPI_URL.format(ip=ip), timeout=10)
+        except UPSTREAM_ERRORS as e:
+            call.outcome = request_outcome(e)
+            await _guarded(guard.record_failure, ip_lookup.PROVIDER_IPAPI, call.outcome == "rate_limited")
+            log_event("upstream_error", ip=ip, provider=ip_lookup.PROVIDER_IPAPI, outcome=call.outcome,
+                      latency_ms=call.elapsed_ms(), error=repr(e))
+            return None, None
+        finally:
+            # Only calls that reached ipapi.co shape the hedge delay; a rejected call takes no time
+            ip_lookup.ip_hedger.record_latency(time.perf_counter() - call.started)
+        if ip_lookup.is_ipapi_rate_limited(data):
+            call.outcome = "rate_limited"
+    await _guarded(ip_lookup.report_ipapi_answer, guard, data)
+    return ip_lookup.interpret_ipapi(data, ip)
+
+
+async def _fetch_fallback(ip):
+    """Run the fallback lookup and tag a successful answer with its provider."""
+    data = await get_ip_info_fallback(ip)
+    return data, (ip_lookup.PROVIDER_IP_API if data is not None else None)
+
+
+async def get_ip_info_fallback(ip):
+    """Fallback API using ip-api.com (free, no key required)."""
+    guard = ip_lookup.get_provider_guard()
+    if not await _guarded(guard.acquire, ip_lookup.PROVIDER_IP_API):
+        log_event("provider_skipped", ip=ip, provider=ip_lookup.PROVIDER_IP_API, outcome="rejected")
+        return None
+    with track_upstream(ip_lookup.PROVIDER_IP_API) as call:
+        try:
+            data = await async_provider_client.get_json(ip_lookup.IP_API_URL.format(ip=ip), timeout=10)
+        except UPSTREAM_ERRORS as e:
+            call.outcome = request_outcome(e)
+            await _guarded(guard.record_failure, ip_lookup.PROVIDER_IP_API, call.outcome == "rate_limited")
+            log_event("upstream_error", ip=ip, provider=ip_lookup.PROVIDER_IP_API, outcome=call.outcome,
+                      latency_ms=call.elapsed_ms(), error=repr(e))
+            return None
+    await _guarded(guard.record_success, ip_lookup.PROVIDER_IP_API)
+    return ip_lookup.interpret_ip_api(data, ip)
+
+
+async def get_my_ip_info(deadline=None):
+    """Detect and geolocate the public IPv4 and IPv6 addresses concurrently.
+
+    Same contract as ip_lookup.get_my_ip_info: returns (ipv4, ipv6, info_data)
+    as soon as the preferred result is in or the deadline passes, cancelling
+    whatever is still running.
+    """
+    deadline = ip_lookup.MY_IP_DEADLINE if deadline is None else deadline
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    addresses = {}
+    infos = {}
+
+    async def probe(version):
+        addresses[version] = await get_ip_address(version)
+        info = await get_ip_info(addresses[version]) if addresses[version] else None
+        return version, info
+
+    pending = {asyncio.ensure_future(probe(version)) for version in ("ipv4", "ipv6")}
+    try:
+        while pending and not infos.get("ipv4"):
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                version, info = task.result()
+                infos[version] = info
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return addresses.get("ipv4"), addresses.get("ipv6"), infos.get("ipv4") or infos.get("ipv6")
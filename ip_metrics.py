@@ -0,0 +1,228 @@
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from ip_log import log_event
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for metrics whose series are keyed by a tuple of label values.
+
+    Recording is a dictionary update under a lock; text is only built when
+    the registry is rendered, so an unscraped metric costs next to nothing.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) for every series."""
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield "", labels, (), value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    type = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets, plus their sum and count."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, the +Inf overflow bucket last, then sum
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._values.items()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                yield "_bucket", labels, (("le", _number(bound)),), cumulative
+            yield "_sum", labels, (), series[-1]
+            yield "_count", labels, (), cumulative
+
+
+class CallbackMetric(_Metric):
+    """Metric read from a function at scrape time, for values other modules already keep.
+
+    The function returns a number, or a dict mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, callback, type="gauge", labelnames=(), registry=None):
+        self.type = type
+        self.callback = callback
+        super().__init__(name, documentation, labelnames, registry)
+
+    def samples(self):
+        value = self.callback()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in items:
+            yield "", tuple(labels), (), number
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken callback must not take the whole scrape down
+                log_event("metric_error", metric=metric.name, error=repr(e))
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, extra, value in samples:
+                lines.append(f"{metric.name}{suffix}{_labels(metric.labelnames, labels, extra)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPSTREAM_SECONDS = Histogram(
+    "ip_upstream_request_seconds", "Latency of upstream provider requests.", ("provider", "outcome"))
+UPSTREAM_IN_FLIGHT = Gauge(
+    "ip_upstream_requests_in_flight", "Upstream provider requests currently in flight.", ("provider",))
+LOOKUP_SECONDS = Histogram(
+    "ip_lookup_seconds", "Latency of uncached IP lookups across the provider chain.", ("outcome",))
+TEMPLATE_RENDER_SECONDS = Histogram(
+    "ip_template_render_seconds", "Time spent rendering page templates.", ("template",))
+
+
+class UpstreamCall:
+    """Outcome holder for track_upstream; callers set outcome when a call did not succeed."""
+
+    __slots__ = ("outcome", "started")
+
+    def __init__(self):
+        self.outcome = "success"
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self):
+        """Milliseconds since the call started, for log records."""
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+
+@contextmanager
+def track_upstream(provider):
+    """Count provider's request as in flight and record its latency by outcome.
+
+    Set the yielded call's outcome to "rate_limited", "timeout" or "error" for
+    failed requests; exceptions escaping the block are recorded as "error",
+    or "cancelled" for a cancelled coroutine.
+    """
+    call = UpstreamCall()
+    UPSTREAM_IN_FLIGHT.inc(provider)
+    start = call.started
+    try:
+        yield call
+    except BaseException as e:
+        call.outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        raise
+    finally:
+        UPSTREAM_IN_FLIGHT.dec(provider)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, provider, call.outcome)
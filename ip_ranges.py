@@ -0,0 +1,270 @@
+import csv
+import ipaddress
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from ip_record import IPRecord
+
+# Location columns understood in a range CSV besides the required start/end
+FIELDS = ("city", "region", "country", "country_name", "latitude", "longitude",
+          "timezone", "org", "asn", "postal")
+
+
+def ip_to_key(ip):
+    """Return (version, integer key) for an IP address string, or None if invalid."""
+    try:
+        address = ipaddress.ip_address(ip.strip())
+    except (ValueError, AttributeError):
+        return None
+    return address.version, int(address)
+
+
+def _parse_bound(value):
+    """Parse a range bound given either as an IP address or as an integer."""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        return (4 if number < 2 ** 32 else 6), number
+    return ip_to_key(value)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _FamilyTable:
+    """Sorted start/end keys for one address family with per-row string-table indices."""
+
+    def __init__(self, typecode):
+        self.starts = array(typecode) if typecode else []
+        self.ends = array(typecode) if typecode else []
+        self.rows = array("I")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+
+    def lookup(self, key):
+        i = bisect_right(self.starts, key) - 1
+        if i >= 0 and key <= self.ends[i]:
+            return i
+        return None
+
+
+class RangeTable:
+    """In-memory IP-range -> location table with binary-search lookups.
+
+    IPv4 ranges are kept as packed 32-bit arrays; IPv6 keys exceed every array
+    typecode and are kept as sorted int lists. Repeated strings (cities,
+    countries, organisations) are stored once in a shared string table.
+    """
+
+    def __init__(self):
+        self.strings = [""]
+        self._string_index = {"": 0}
+        # One row of string-table indices (len(FIELDS) - 2, coordinates excluded) per range
+        self._row_fields = [f for f in FIELDS if f not in ("latitude", "longitude")]
+        self.v4 = _FamilyTable("I" if array("I").itemsize >= 4 else "L")
+        self.v6 = _FamilyTable(None)
+
+    def __len__(self):
+        return len(self.v4.starts) + len(self.v6.starts)
+
+    def _intern(self, value):
+        value = (value or "").strip()
+        index = self._string_index.get(value)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(value)
+            self._string_index[value] = index
+        return index
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a CSV with a header row containing start, end and any of FIELDS."""
+        with open(path, newline="", encoding="utf-8") as f:
+            return cls.from_rows(csv.DictReader(f))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table from dicts with start/end bounds and location fields."""
+        table = cls()
+        entries = {4: [], 6: []}
+        for row in rows:
+            start = _parse_bound(row.get("start", ""))
+            end = _parse_bound(row.get("end", ""))
+            if start is None or end is None or start[0] != end[0] or start[1] > end[1]:
+                continue
+            indices = tuple(table._intern(row.get(field)) for field in table._row_fields)
+            entries[start[0]].append((start[1], end[1], indices,
+                                      _to_float(row.get("latitude")), _to_float(row.get("longitude"))))
+
+        for version, family in ((4, table.v4), (6, table.v6)):
+            for start, end, indices, lat, lon in sorted(entries[version], key=lambda e: e[0]):
+                family.starts.append(start)
+                family.ends.append(end)
+                family.rows.extend(indices)
+                family.latitudes.append(lat if lat is not None else float("nan"))
+                family.longitudes.append(lon if lon is not None else float("nan"))
+        return table
+
+    def lookup(self, ip):
+        """Return location data for ip as an IPRecord, or None on a miss."""
+        parsed = ip_to_key(ip)
+        if parsed is None:
+            return None
+        version, key = parsed
+        family = self.v4 if version == 4 else self.v6
+        i = family.lookup(key)
+        if i is None:
+            return None
+        return self._record(ip.strip(), family, i)
+
+    def _record(self, ip, family, i):
+        width = len(self._row_fields)
+        values = {field: self.strings[family.rows[i * width + n]] or None
+                  for n, field in enumerate(self._row_fields)}
+        return _make_record(ip, values, family.latitudes[i], family.longitudes[i])
+
+    def compile(self, path):
+        """Write the table in the fixed-width binary format read by MappedRangeTable."""
+        width = len(self._row_fields)
+        encoded = [value.encode("utf-8") for value in self.strings]
+        string_offsets = [0]
+        for value in encoded:
+            string_offsets.append(string_offsets[-1] + len(value))
+
+        sections = []
+        for family, key_size in ((self.v4, 4), (self.v6, 16)):
+            sections.append(b"".join(key.to_bytes(key_size, "big") for key in family.starts))
+            sections.append(b"".join(key.to_bytes(key_size, "big") for key in family.ends))
+            sections.append(struct.pack(f"<{len(family.rows)}I", *family.rows))
+            coords = [c for pair in zip(family.latitudes, family.longitudes) for c in pair]
+            sections.append(struct.pack(f"<{len(coords)}d", *coords))
+        sections.append(struct.pack(f"<{len(string_offsets)}I", *string_offsets))
+        sections.append(b"".join(encoded))
+
+        offsets = []
+        position = _HEADER.size
+        for section in sections:
+            position = _align(position)
+            offsets.append(position)
+            position += len(section)
+
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(self.v4.starts), len(self.v6.starts), len(self.strings), width, *offsets))
+            for offset, section in zip(offsets, sections):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(section)
+
+
+def _align(position, alignment=8):
+    return (position + alignment - 1) // alignment * alignment
+
+
+def _make_record(ip, values, lat, lon):
+    """Build a result as the IPRecord every provider answer is normalized to."""
+    return IPRecord(
+        ip=ip,
+        city=values["city"],
+        region=values["region"],
+        country=values["country"],
+        country_name=values["country_name"],
+        # NaN marks a missing coordinate
+        latitude=lat if lat == lat else None,
+        longitude=lon if lon == lon else None,
+        timezone=values["timezone"],
+        org=values["org"],
+        asn=values["asn"],
+        postal=values["postal"],
+    )
+
+
+# Binary range file: magic, counts, then 10 section offsets (v4 starts/ends/rows/coords,
+# v6 starts/ends/rows/coords, string offsets, string blob). Keys are big-endian so
+# byte order matches numeric order; everything else is little-endian.
+MAGIC = b"IPRANGE1"
+_HEADER = struct.Struct("<8s4Q10Q")
+
+
+class MappedRangeTable:
+    """Read-only RangeTable backed by a memory-mapped compiled file.
+
+    Lookups binary-search the mapped pages directly, so nothing is parsed at
+    startup and every worker process shares the same page-cache copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mm, 0) if len(self._mm) >= _HEADER.size else (None,)
+        if header[0] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a compiled range file")
+        self._n4, self._n6, self._nstrings, self._width = header[1:5]
+        offsets = header[5:]
+        self._v4 = (4,) + offsets[0:4] + (self._n4,)
+        self._v6 = (16,) + offsets[4:8] + (self._n6,)
+        self._string_offsets, self._string_blob = offsets[8:10]
+        self._row_fields = [f for f in FIELDS if f not in ("latitude", "longitude")]
+
+    def __len__(self):
+        return self._n4 + self._n6
+
+    def close(self):
+        self._mm.close()
+
+    def _key(self, offset, size, i):
+        return int.from_bytes(self._mm[offset + i * size:offset + (i + 1) * size], "big")
+
+    def _string(self, i):
+        start, end = struct.unpack_from("<2I", self._mm, self._string_offsets + 4 * i)
+        return self._mm[self._string_blob + start:self._string_blob + end].decode("utf-8")
+
+    def lookup(self, ip):
+        """Return location data for ip as an IPRecord, or None on a miss."""
+        parsed = ip_to_key(ip)
+        if parsed is None:
+            return None
+        version, key = parsed
+        size, starts, ends, rows, coords, count = self._v4 if version == 4 else self._v6
+
+        # bisect_right over the mapped start keys
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < self._key(starts, size, mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        i = lo - 1
+        if i < 0 or key > self._key(ends, size, i):
+            return None
+
+        indices = struct.unpack_from(f"<{self._width}I", self._mm, rows + 4 * self._width * i)
+        values = {field: self._string(index) or None for field, index in zip(self._row_fields, indices)}
+        lat, lon = struct.unpack_from("<2d", self._mm, coords + 16 * i)
+        return _make_record(ip.strip(), values, lat, lon)
+
+
+def load_range_table(path):
+    """Open a compiled range file with mmap, or load a CSV into memory."""
+    with open(path, "rb") as f:
+        is_compiled = f.read(len(MAGIC)) == MAGIC
+    return MappedRangeTable(path) if is_compiled else RangeTable.from_csv(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile an IP range CSV into the memory-mappable binary format.")
+    parser.add_argument("csv_path", help="Range CSV with start/end columns")
+    parser.add_argument("output_path", help="Compiled file to write")
+    args = parser.parse_args()
+    table = RangeTable.from_csv(args.csv_path)
+    table.compile(args.output_path)
+    print(f"Compiled {len(table)} ranges into {args.output_path}")
@@ -0,0 +1,96 @@
+import sys
+from collections import namedtuple
+
+# Fields every provider answer is mapped to (ipapi.co names)
+RECORD_FIELDS = ("ip", "city", "region", "country", "country_name", "latitude", "longitude",
+                 "timezone", "org", "asn", "postal")
+
+# Low-cardinality fields; their strings are interned so a large cache keeps one copy of each
+_INTERNED_FIELDS = frozenset(("city", "region", "country", "country_name", "timezone", "org", "asn"))
+
+
+def _text(value, intern=False):
+    if value is None or value == "":
+        return None
+    value = value if isinstance(value, str) else str(value)
+    return sys.intern(value) if intern else value
+
+
+def _coordinate(value):
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+class IPRecord(namedtuple("IPRecord", RECORD_FIELDS)):
+    """Location record normalized across providers and the offline range table.
+
+    A plain tuple with named fields, so an entry costs a fraction of the
+    provider's JSON dict. Country, region, city, timezone, org and ASN strings
+    are interned and coordinates are floats. get(), string indexing, `in`,
+    keys() and items() work by field name like the dicts the providers
+    return, so existing callers keep working, and dict(record) copies it.
+    It is not a dict subclass, and iterating it still yields the values as
+    for any tuple; use to_dict() where JSON is needed.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_mapping(cls, data, ip=None):
+        """Build a record from a dict in the RECORD_FIELDS shape (e.g. an ipapi.co answer); extra keys are dropped."""
+        return cls(
+            ip=_text(ip if ip is not None else data.get("ip")),
+            city=_text(data.get("city"), intern=True),
+            region=_text(data.get("region"), intern=True),
+            country=_text(data.get("country"), intern=True),
+            country_name=_text(data.get("country_name"), intern=True),
+            latitude=_coordinate(data.get("latitude")),
+            longitude=_coordinate(data.get("longitude")),
+            timezone=_text(data.get("timezone"), intern=True),
+            org=_text(data.get("org"), intern=True),
+            asn=_text(data.get("asn"), intern=True),
+            postal=_text(data.get("postal")),
+        )
+
+    @classmethod
+    def from_ip_api(cls, data, ip):
+        """Build a record from an ip-api.com answer, mapping its field names to ipapi.co's."""
+        return cls.from_mapping({
+            "ip": data.get("query", ip),
+            "city": data.get("city"),
+            "region": data.get("regionName"),
+            "country": data.get("countryCode"),
+            "country_name": data.get("country"),
+            "latitude": data.get("lat"),
+            "longitude": data.get("lon"),
+            "timezone": data.get("timezone"),
+            "org": data.get("isp"),
+            "asn": data.get("as", "").split()[0] if data.get("as") else None,
+            "postal": data.get("zip"),
+        })
+
+    def get(self, field, default=None):
+        """Like dict.get: the field's value, or default for an unknown field."""
+        return getattr(self, field) if field in self._fields else default
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        """Like dict: whether key is a field name, not whether it is a value."""
+        return key in self._fields
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
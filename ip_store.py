@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from ip_log import log_event
+from ip_record import IPRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lookups (
+    ip TEXT PRIMARY KEY,
+    data TEXT,
+    provider TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lookups_expires_at ON lookups (expires_at);
+CREATE TABLE IF NOT EXISTS lookup_history (
+    ip TEXT PRIMARY KEY,
+    rank REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lookup_history_rank ON lookup_history (rank);
+"""
+
+# Largest number of IPs bound into one SQL statement
+_SQL_CHUNK = 500
+
+
+class LookupStore:
+    """Durable SQLite cache of IP lookups shared across restarts and worker processes.
+
+    The database runs in WAL mode so readers in one process never block the
+    writer in another; every thread gets its own connection. Each record keeps
+    the time it was fetched and the provider that answered it.
+
+    The store also keeps a request history for cache warm-up: record_hit()
+    counts requests in memory and flush_hits() folds the counts into a score
+    that halves every history_half_life seconds without new requests. The
+    score is stored as rank = log2(score) + time / half_life, which orders IPs
+    by their decayed score without rewriting rows as time passes.
+    """
+
+    def __init__(self, path, ttl=86400, negative_ttl=300, busy_timeout=5.0,
+                 history_half_life=86400, history_size=10000):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.busy_timeout = busy_timeout
+        self.history_half_life = history_half_life
+        self.history_size = history_size
+        self._hits = {}
+        self._hits_lock = threading.Lock()
+        self._local = threading.local()
+        self._vacuum_thread = None
+        self._vacuum_stop = threading.Event()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        with conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            # auto_vacuum only takes effect on a fresh database, before any table exists
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, ip, now=None):
+        """Return {"data", "provider", "fetched_at"} for a fresh record, or None."""
+        now = time.time() if now is None else now
+        try:
+            row = self._connection().execute(
+                "SELECT data, provider, fetched_at FROM lookups WHERE ip = ? AND expires_at > ?",
+                (ip, now),
+            ).fetchone()
+        except sqlite3.Error as e:
+            log_event("store_error", ip=ip, operation="read", error=str(e))
+            return None
+        if row is None:
+            return None
+        data, provider, fetched_at = row
+        return {
+            "data": json.loads(data) if data is not None else None,
+            "provider": provider,
+            "fetched_at": fetched_at,
+        }
+
+    def set(self, ip, data, provider, fetched_at=None):
+        """Store a lookup result; None is stored as a negative result with the shorter TTL."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        ttl = self.ttl if data is not None else self.negative_ttl
+        if isinstance(data, IPRecord):
+            data = data.to_dict()
+        payload = json.dumps(data) if data is not None else None
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO lookups (ip, data, provider, fetched_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (ip, payload, provider, fetched_at, fetched_at + ttl),
+                )
+        except sqlite3.Error as e:
+            log_event("store_error", ip=ip, operation="write", error=str(e))
+
+    def delete(self, ip):
+        """Remove the record for ip if present."""
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM lookups WHERE ip = ?", (ip,))
+
+    def record_hit(self, ip):
+        """Count a request for ip towards the history; written by the next flush_hits()."""
+        with self._hits_lock:
+            # Bound the pending counts; a flush makes room again
+            if ip in self._hits or len(self._hits) < self.history_size:
+                self._hits[ip] = self._hits.get(ip, 0) + 1
+
+    def flush_hits(self, now=None):
+        """Fold the pending request counts into the stored history; returns the number of IPs written."""
+        now = time.time() if now is None else now
+        with self._hits_lock:
+            hits, self._hits = self._hits, {}
+        if not hits:
+            return 0
+        ips = list(hits)
+        try:
+            conn = self._connection()
+            ranks = {}
+            for start in range(0, len(ips), _SQL_CHUNK):
+                chunk = ips[start:start + _SQL_CHUNK]
+                ranks.update(conn.execute(
+                    f"SELECT ip, rank FROM lookup_history WHERE ip IN ({','.join('?' * len(chunk))})", chunk,
+                ).fetchall())
+            epoch = now / self.history_half_life
+            rows = []
+            for ip, count in hits.items():
+                score = count + (2.0 ** (ranks[ip] - epoch) if ip in ranks else 0.0)
+                rows.append((ip, math.log2(score) + epoch))
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO lookup_history (ip, rank) VALUES (?, ?)", rows)
+        except sqlite3.Error as e:
+            log_event("store_error", operation="history", error=str(e))
+            return 0
+        return len(rows)
+
+    def hot_ips(self, limit):
+        """The limit IPs with the highest decayed request score, hottest first."""
+        try:
+            rows = self._connection().execute(
+                "SELECT ip FROM lookup_history ORDER BY rank DESC LIMIT ?", (limit,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            log_event("store_error", operation="history", error=str(e))
+            return []
+        return [row[0] for row in rows]
+
+    def purge_expired(self, now=None):
+        """Delete expired records and excess history, return their pages to the file and checkpoint the WAL."""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        with conn:
+            removed = conn.execute("DELETE FROM lookups WHERE expires_at <= ?", (now,)).rowcount
+            conn.execute(
+                "DELETE FROM lookup_history WHERE rank < "
+                "(SELECT rank FROM lookup_history ORDER BY rank DESC LIMIT 1 OFFSET ?)",
+                (self.history_size - 1,),
+            )
+        conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return removed
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+
+    def start_vacuum(self, interval=600):
+        """Purge expired records every interval seconds in a daemon thread."""
+        if self._vacuum_thread is not None and self._vacuum_thread.is_alive():
+            return
+        self._vacuum_stop.clear()
+
+        def run():
+            while not self._vacuum_stop.wait(interval):
+                try:
+                    self.flush_hits()
+                    self.purge_expired()
+                except sqlite3.Error as e:
+                    log_event("store_error", operation="vacuum", error=str(e))
+
+        self._vacuum_thread = threading.Thread(target=run, name="lookup-store-vacuum", daemon=True)
+        self._vacuum_thread.start()
+
+    def stop_vacuum(self):
+        """Stop the background vacuum thread."""
+        self._vacuum_stop.set()
+
+    def close(self):
+        """Stop vacuuming, write the pending history and close this thread's connection."""
+        self.stop_vacuum()
+        self.flush_hits()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,250 @@
+"""Cache warm-up from historical traffic.
+
+After a restart the in-process cache is empty, so the first wave of requests
+would pay full upstream latency and burn provider quota. The Warmer loads the
+hottest IPs of earlier runs (the store's request history, or a file such as an
+access log) into the cache in the background, first from the durable store and
+only then from the providers, and re-warms them before they expire:
+
+    python ip_warmup.py [access.log]
+
+runs a single pass and prints what it did.
+"""
+import ipaddress
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import ip_lookup
+from ip_cache import MISSING
+from ip_classify import classify
+from ip_log import log_event
+from ip_metrics import CallbackMetric
+
+# Set IP_WARMUP to "0" to serve from a cold cache
+WARMUP_ENABLED = os.environ.get("IP_WARMUP", "1") == "1"
+# Number of hottest IPs kept warm
+WARMUP_TOP_N = int(os.environ.get("IP_WARMUP_TOP_N", 200))
+# History file (one IP per line, or an access log starting each line with the client IP);
+# empty means the store's request history
+WARMUP_HISTORY_PATH = os.environ.get("IP_WARMUP_HISTORY", "")
+# Seconds between passes after the first; 0 runs the startup pass only
+WARMUP_INTERVAL = float(os.environ.get("IP_WARMUP_INTERVAL", 600))
+# Entries expiring within this many seconds are refreshed by a pass
+WARMUP_REFRESH_AHEAD = float(os.environ.get("IP_WARMUP_REFRESH_AHEAD", 900))
+# Fraction of each provider's quota that warm-up never touches, left for real users
+WARMUP_RESERVE = float(os.environ.get("IP_WARMUP_RESERVE", 0.5))
+# Concurrent warm-up lookups
+WARMUP_WORKERS = int(os.environ.get("IP_WARMUP_WORKERS", 4))
+
+# Outcomes of warm_ip()
+FRESH = "fresh"
+PROMOTED = "promoted"
+FETCHED = "fetched"
+FAILED = "failed"
+NO_QUOTA = "no_quota"
+
+# Providers a single-IP lookup may call
+_LOOKUP_PROVIDERS = (ip_lookup.PROVIDER_IPAPI, ip_lookup.PROVIDER_IP_API)
+
+
+def read_history_file(path, limit):
+    """Rank the IPs of a history file by request count, most recent first on ties.
+
+    Each line's first field is taken as the IP, which fits plain IP lists as
+    well as common/combined-format access logs; other lines are skipped.
+    """
+    counts = Counter()
+    last_seen = {}
+    with open(path, encoding="utf-8", errors="replace") as lines:
+        for position, line in enumerate(lines):
+            field = line.split(None, 1)[0] if line.strip() else ""
+            try:
+                ip = str(ipaddress.ip_address(field))
+            except ValueError:
+                continue
+            counts[ip] += 1
+            last_seen[ip] = position
+    return sorted(counts, key=lambda ip: (counts[ip], last_seen[ip]), reverse=True)[:limit]
+
+
+def hot_ips(limit=None, path=None):
+    """The hottest globally routable IPs of earlier traffic, hottest first."""
+    limit = WARMUP_TOP_N if limit is None else limit
+    path = WARMUP_HISTORY_PATH if path is None else path
+    if path:
+        try:
+            candidates = read_history_file(path, limit * 2)
+        except OSError as e:
+            log_event("warmup_error", path=path, error=str(e))
+            candidates = []
+    else:
+        store = ip_lookup.get_lookup_store()
+        candidates = store.hot_ips(limit * 2) if store is not None else []
+    # Only addresses the providers would be asked about are worth warming
+    return [ip for ip in candidates if classify(ip).routable][:limit]
+
+
+def quota_available(reserve=None):
+    """Whether every lookup provider is closed and holds more than reserve of its quota."""
+    reserve = WARMUP_RESERVE if reserve is None else reserve
+    guard = ip_lookup.get_provider_guard()
+    stats = guard.stats()
+    for provider in _LOOKUP_PROVIDERS:
+        entry = stats.get(provider)
+        limit = guard.limits.get(provider)
+        if entry is None or limit is None:
+            continue
+        if entry["state"] != "closed" or entry["tokens"] < 1 + reserve * limit[0]:
+            return False
+    return True
+
+
+def warm_ip(ip, refresh_ahead=None, reserve=None):
+    """Make sure ip stays cached for refresh_ahead more seconds; returns the outcome.
+
+    A cached entry is left alone, a stored record is promoted without any
+    network call, and only then are the providers asked, if their quota
+    allows (NO_QUOTA otherwise).
+    """
+    refresh_ahead = WARMUP_REFRESH_AHEAD if refresh_ahead is None else refresh_ahead
+    remaining = ip_lookup.ip_info_cache.expires_in(ip)
+    if (remaining is not None and remaining > refresh_ahead) or ip_lookup.lookup_local(ip) is not None:
+        return FRESH
+    if ip_lookup.load_stored_ip_info(ip, min_ttl=refresh_ahead) is not MISSING:
+        return PROMOTED
+    if not quota_available(reserve):
+        return NO_QUOTA
+    # Shares the flight of a user request for the same IP, so both cause one upstream call
+    data = ip_lookup.ip_flight.do(("info", ip), ip_lookup.refresh_ip_info, ip)
+    return FETCHED if data is not None else FAILED
+
+
+class Warmer:
+    """Runs warm-up passes in a daemon thread and reports readiness.
+
+    A pass warms every IP returned by candidates() with warm(), using workers
+    threads. IPs that would need quota the providers cannot spare are left
+    for the next pass (NO_QUOTA). The warmer is ready once its first pass has
+    finished, however far the quota let it get; the app serves requests all
+    along.
+    """
+
+    def __init__(self, candidates=hot_ips, warm=warm_ip, interval=600.0, workers=4, clock=time.time):
+        self.candidates = candidates
+        self.warm = warm
+        self.interval = interval
+        self.workers = workers
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.state = "idle"
+        self.passes = 0
+        self.last_pass = {}
+        self.last_pass_at = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Block until the first pass has finished; returns whether it has."""
+        return self._ready.wait(timeout)
+
+    def run_pass(self):
+        """Warm the current candidates once; returns the count of each outcome."""
+        with self._lock:
+            if not self.ready:
+                self.state = "warming"
+        started = self._clock()
+        outcomes = Counter()
+
+        def warm_one(ip):
+            if self._stop.is_set():
+                return "skipped"
+            try:
+                return self.warm(ip)
+            except Exception as e:
+                log_event("warmup_error", ip=ip, error=repr(e))
+                return FAILED
+
+        try:
+            ips = self.candidates()
+        except Exception as e:
+            log_event("warmup_error", error=repr(e))
+            ips = []
+        with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="warmup") as pool:
+            outcomes.update(pool.map(warm_one, ips))
+
+        summary = {"candidates": len(ips), **outcomes, "seconds": round(self._clock() - started, 3)}
+        with self._lock:
+            self.passes += 1
+            self.last_pass = summary
+            self.last_pass_at = self._clock()
+            self.state = "ready"
+        self._ready.set()
+        log_event("warmup_pass", **summary)
+        return outcomes
+
+    def start(self):
+        """Run the first pass now and further passes every interval seconds, in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            self.run_pass()
+            while self.interval > 0 and not self._stop.wait(self.interval):
+                self.run_pass()
+
+        self._thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current lookups; an unfinished first pass leaves the warmer not ready."""
+        self._stop.set()
+
+    def skip(self):
+        """Report ready without warming anything, for a disabled warm-up."""
+        with self._lock:
+            self.state = "disabled"
+        self._ready.set()
+
+    def status(self):
+        with self._lock:
+            return {"ready": self.ready, "state": self.state, "passes": self.passes,
+                    "last_pass": dict(self.last_pass), "last_pass_at": self.last_pass_at}
+
+
+# Started by the web apps through start_warmup()
+warmer = Warmer(interval=WARMUP_INTERVAL, workers=WARMUP_WORKERS)
+
+
+def start_warmup():
+    """Start the shared warmer in the background, or mark it ready when warm-up is disabled."""
+    if WARMUP_ENABLED:
+        warmer.start()
+    else:
+        warmer.skip()
+
+
+CallbackMetric("ip_warmup_ready", "1 once the startup cache warm-up pass has finished.",
+               lambda: 1 if warmer.ready else 0)
+CallbackMetric("ip_warmup_passes_total", "Cache warm-up passes run.", lambda: warmer.passes, type="counter")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else None
+    one_pass = Warmer(candidates=lambda: hot_ips(path=path), workers=WARMUP_WORKERS)
+    outcomes = one_pass.run_pass()
+    print(", ".join(f"{outcome}: {count}" for outcome, count in sorted(outcomes.items())) or "No IPs to warm")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Shared fixtures for the test suite.
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Importing the web app must not start the real warm-up and My-IP refresh threads
+os.environ.setdefault("IP_BACKGROUND_TASKS", "0")
+
+import ip_lookup
+from ip_guard import ProviderGuard
+
+
+@pytest.fixture(autouse=True)
+def isolated_provider_guard(monkeypatch):
+    """Give every test fresh in-memory rate limits so the shared state file is never touched."""
+    guard = ProviderGuard(None, limits=ip_lookup.RATE_LIMITS,
+                          failure_threshold=ip_lookup.BREAKER_THRESHOLD, cooldown=ip_lookup.BREAKER_COOLDOWN)
+    monkeypatch.setattr(ip_lookup, "_provider_guard", guard)
+    return guard
+
+
+@pytest.fixture(autouse=True)
+def isolated_lookup_store(monkeypatch):
+    """Keep every test away from the real lookup store; tests that need one point STORE_PATH at tmp_path."""
+    monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+    monkeypatch.setattr(ip_lookup, "_lookup_store", None)
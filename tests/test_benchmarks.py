@@ -0,0 +1,64 @@
+"""
+Smoke tests for the stub upstream and the lookup benchmark, so they do not rot.
+"""
+import pytest
+import sys
+import os
+import json
+
+import requests
+
+# Add parent and benchmarks directories to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import bench_lookup
+from stub_upstream import IPAPI_RATE_LIMIT_BODY, StubUpstream
+
+
+class TestStubUpstream:
+    """Test cases for the provider stand-in."""
+
+    def test_provider_shapes(self):
+        """Each provider path answers in that provider's format."""
+        with StubUpstream() as stub:
+            env = stub.environ()
+            assert requests.get(env["IP_IPIFY_V4_URL"]).json() == {"ip": "203.0.113.7"}
+            assert requests.get(env["IP_IPAPI_URL"].format(ip="192.0.2.1")).json()["ip"] == "192.0.2.1"
+            assert requests.get(env["IP_IP_API_URL"].format(ip="192.0.2.1")).json()["status"] == "success"
+            batch = requests.post(env["IP_API_BATCH_URL"], json=["192.0.2.1", "192.0.2.2"]).json()
+            assert [answer["query"] for answer in batch] == ["192.0.2.1", "192.0.2.2"]
+            assert stub.requests == {"ipify": 1, "ipapi.co": 1, "ip-api.com": 1, "ip-api.com/batch": 1}
+
+    def test_rate_limit_and_errors(self):
+        """The rate-limit body and HTTP errors are served at the configured rates."""
+        with StubUpstream(rate_limit_rate=1.0) as stub:
+            url = stub.environ()["IP_IPAPI_URL"].format(ip="192.0.2.1")
+            assert requests.get(url).json() == IPAPI_RATE_LIMIT_BODY
+            stub.error_rate = 1.0
+            assert requests.get(url).status_code == 500
+
+
+class TestBenchLookup:
+    """Test cases for the benchmark runner."""
+
+    def test_writes_results_and_compares(self, tmp_path, capsys):
+        """A run writes per-scenario latency summaries; a comparison run reports against it."""
+        output = str(tmp_path / "results.json")
+        argv = ["-n", "5", "--local-iterations", "200", "-o", output,
+                "--only", "get_ip_info_primary", "get_ip_info_fallback", "cache_memory_hit"]
+        assert bench_lookup.main(argv) == 0
+        with open(output) as f:
+            report = json.load(f)
+        assert set(report["results"]) == {"get_ip_info_primary", "get_ip_info_fallback", "cache_memory_hit"}
+        assert report["results"]["get_ip_info_primary"]["n"] == 5
+        assert report["upstream_requests"]["ip-api.com"] == 5
+
+        argv = ["--local-iterations", "200", "-o", str(tmp_path / "again.json"),
+                "--only", "cache_memory_hit", "--compare", output, "--threshold", "100"]
+        assert bench_lookup.main(argv) == 0
+        assert "cache_memory_hit" in capsys.readouterr().out
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,80 @@
+"""
+Unit tests for NumPy-vectorized bulk lookups.
+"""
+import pytest
+import sys
+import os
+import ipaddress
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+
+import ip_lookup
+from ip_bulk import ipv4_keys, lookup_many
+from ip_ranges import MappedRangeTable, RangeTable
+from tests.test_ip_ranges import SAMPLE_CSV
+
+
+@pytest.fixture(params=["memory", "mapped"])
+def table(request, tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(SAMPLE_CSV)
+    table = RangeTable.from_csv(str(path))
+    if request.param == "mapped":
+        table.compile(str(tmp_path / "ranges.bin"))
+        table = MappedRangeTable(str(tmp_path / "ranges.bin"))
+    return table
+
+
+class TestIPv4Keys:
+    """Test cases for vectorized IPv4 parsing."""
+
+    def test_matches_ipaddress(self):
+        """Valid addresses parse to the same integers as the ipaddress module."""
+        ips = ["0.0.0.0", "8.8.8.8", " 192.168.1.20 ", "255.255.255.255", "10.0.0.1"]
+        keys, valid = ipv4_keys(ips)
+        assert valid.all()
+        assert keys.tolist() == [int(ipaddress.ip_address(ip.strip())) for ip in ips]
+
+    def test_rejects_malformed(self):
+        """Malformed or non-IPv4 strings are flagged invalid."""
+        ips = ["999.1.1.1", "1.2.3", "1.2.3.4.5", "a.b.c.d", "", "1..2.3", "2001:db8::1", "1.2.3.4444",
+               "01.2.3.4", "1.2.3.00", "8.08.8.8"]
+        _, valid = ipv4_keys(ips)
+        assert not valid.any()
+
+
+class TestLookupMany:
+    """Test cases for columnar bulk resolution against the range table."""
+
+    def test_columns_match_per_ip_lookup(self, table):
+        """Bulk results agree with table.lookup for every address."""
+        ips = ["8.8.8.8", "1.1.1.1", "9.9.9.9", "1.1.2.5", "2001:4860::1", "bogus", "8.8.8.255"]
+        result = lookup_many(ips, table=table)
+        assert result["found"].tolist() == [True, True, False, True, True, False, True]
+        for i, ip in enumerate(ips):
+            record = table.lookup(ip)
+            for column in ("city", "country", "asn", "org"):
+                assert result[column][i] == (record[column] if record else None)
+        assert result["latitude"][0] == pytest.approx(37.4056)
+        assert np.isnan(result["latitude"][2])
+
+    def test_leading_zeros_agree_with_per_ip_lookup(self, table, monkeypatch):
+        """Octets such as "08" are rejected by the bulk path exactly as by ip_lookup."""
+        monkeypatch.setattr(ip_lookup, "RANGES_PATH", "ranges")
+        monkeypatch.setattr(ip_lookup, "_range_table", table)
+        ips = ["08.8.8.8", "8.8.8.08", "8.8.8.0", "0.0.0.0", "1.1.1.1", "01.1.1.1", "8.8.8.000"]
+        result = lookup_many(ips, table=table)
+        assert result["found"].tolist() == [ip_lookup.lookup_local(ip) is not None for ip in ips]
+        assert result["found"].tolist() == [False, False, True, False, True, False, False]
+
+    def test_empty_input(self, table):
+        """An empty batch returns empty columns."""
+        result = lookup_many([], table=table)
+        assert len(result["found"]) == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
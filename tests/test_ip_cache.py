@@ -0,0 +1,297 @@
+"""
+Unit tests for the in-process lookup cache.
+"""
+import pytest
+import sys
+import os
+import threading
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_cache import MISSING, PrefixCache, StaleWhileRevalidate, TTLCache
+
+
+class FakeClock:
+    """Manually advanced replacement for time.monotonic."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Test cases for TTL expiry, LRU eviction and counters."""
+
+    def test_hit_and_miss(self):
+        """Stored values are returned and counted as hits."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        assert cache.get("8.8.8.8") is MISSING
+        cache.set("8.8.8.8", {"ip": "8.8.8.8"})
+        assert cache.get("8.8.8.8") == {"ip": "8.8.8.8"}
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_ttl_expiry(self):
+        """Entries disappear once their TTL has elapsed."""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+        cache.set("1.1.1.1", {"ip": "1.1.1.1"})
+        clock.now = 9
+        assert cache.get("1.1.1.1") is not MISSING
+        clock.now = 10
+        assert cache.get("1.1.1.1") is MISSING
+        assert cache.stats()["expirations"] == 1
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted when full."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_negative_results_are_separate(self):
+        """None is cached with its own TTL and never evicts positive entries."""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=1, ttl=100, negative_maxsize=1, negative_ttl=5, clock=clock)
+        cache.set("good", {"ip": "good"})
+        cache.set("bad1", None)
+        cache.set("bad2", None)
+        assert cache.get("good") == {"ip": "good"}
+        assert cache.get("bad1") is MISSING
+        assert cache.get("bad2") is None
+        clock.now = 5
+        assert cache.get("bad2") is MISSING
+        assert cache.stats()["negative_hits"] == 1
+
+    def test_peek_leaves_counters_alone(self):
+        """peek() returns entries without counting hits or misses."""
+        cache = TTLCache(maxsize=2, ttl=10)
+        assert cache.peek("a") is MISSING
+        cache.set("a", 1)
+        assert cache.peek("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 0
+        assert stats["misses"] == 0
+
+
+class TestStaleWhileRevalidate:
+    """Test cases for the background-refreshed single value."""
+
+    def test_first_get_loads_then_serves_from_memory(self):
+        """Only the first get() calls the loader while the value is fresh."""
+        clock = FakeClock()
+        loads = []
+        cache = StaleWhileRevalidate(lambda: loads.append(1) or len(loads), max_age=60, clock=clock)
+        assert cache.get() == (1, 0.0)
+        clock.now = 30
+        assert cache.get() == (1, 0.0)
+        assert cache.age() == 30
+        assert loads == [1]
+
+    def test_stale_value_is_returned_while_refreshing(self):
+        """A stale get() returns at once and the refresh happens in the background."""
+        clock = FakeClock()
+        release = threading.Event()
+        values = iter(["old", "new"])
+
+        def loader():
+            value = next(values)
+            if value == "new":
+                release.wait(5)
+            return value
+
+        cache = StaleWhileRevalidate(loader, max_age=60, clock=clock)
+        cache.get()
+        clock.now = 61
+        assert cache.get() == ("old", 0.0)
+        # A second stale read does not start another refresh
+        assert cache.get() == ("old", 0.0)
+        release.set()
+        for _ in range(500):
+            if cache.refreshes == 2:
+                break
+            threading.Event().wait(0.01)
+        assert cache.get() == ("new", 61)
+
+    def test_failed_refresh_keeps_old_value_and_backs_off(self):
+        """A rejected refresh keeps serving the previous value and waits retry_interval."""
+        clock = FakeClock()
+        values = iter(["old", None, "new"])
+        cache = StaleWhileRevalidate(lambda: next(values), max_age=60, retry_interval=30, clock=clock)
+        cache.get()
+        clock.now = 61
+        assert cache.refresh() == ("old", 0.0)
+        assert cache.failures == 1
+        # Still stale, but inside the retry interval: no background refresh
+        assert cache.get() == ("old", 0.0)
+        assert cache.refresh() == ("new", 61)
+
+    def test_nothing_loaded_returns_rejected_value(self):
+        """Without any successful load, get() returns the rejected result and no fetch time."""
+        cache = StaleWhileRevalidate(lambda: None, max_age=60)
+        assert cache.get() == (None, None)
+        assert cache.age() is None
+
+    def test_raising_first_load_returns_failed_value_and_backs_off(self):
+        """A loader that raises reads as `failed` and is not called again within retry_interval."""
+        clock = FakeClock()
+        calls = []
+
+        def loader():
+            calls.append(clock.now)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return "loaded"
+
+        cache = StaleWhileRevalidate(loader, max_age=60, retry_interval=30, clock=clock, failed="nothing")
+        assert cache.get() == ("nothing", None)
+        clock.now = 29
+        assert cache.get() == ("nothing", None)
+        assert calls == [0.0]
+        clock.now = 30
+        assert cache.get() == ("loaded", 30)
+
+    def test_concurrent_first_callers_share_one_load(self):
+        """Callers arriving during the first load wait for it instead of loading again."""
+        loads = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def loader():
+            loads.append(1)
+            started.set()
+            release.wait(5)
+            return None
+
+        cache = StaleWhileRevalidate(loader, max_age=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert results == [(None, None)] * 4
+        assert loads == [1]
+
+    def test_rejected_first_load_backs_off(self):
+        """After a rejected first load, get() answers at once until retry_interval passed."""
+        clock = FakeClock()
+        values = iter([None, "late"])
+        cache = StaleWhileRevalidate(lambda: next(values), max_age=60, retry_interval=30, clock=clock)
+        assert cache.get() == (None, None)
+        clock.now = 10
+        assert cache.get() == (None, None)
+        assert cache.failures == 1
+        clock.now = 30
+        assert cache.get() == ("late", 30)
+
+
+class TestPrefixCache:
+    """Test cases for the prefix-aggregated tier."""
+
+    def test_prefix_served_after_confirmations(self):
+        """A /24 is only served once two exact answers in it agree."""
+        cache = PrefixCache(confirmations=2)
+        cache.observe("8.8.8.1", {"ip": "8.8.8.1", "city": "Mountain View", "asn": "AS15169"})
+        assert cache.get("8.8.8.200") is MISSING
+        cache.observe("8.8.8.2", {"ip": "8.8.8.2", "city": "Mountain View", "asn": "AS15169"})
+        assert cache.get("8.8.8.200") == {"ip": "8.8.8.200", "city": "Mountain View", "asn": "AS15169"}
+        assert cache.get("8.8.9.1") is MISSING
+        assert cache.stats()["hits"] == 1
+
+    def test_repeated_ip_is_not_a_confirmation(self):
+        """The same address answered again does not confirm its prefix."""
+        cache = PrefixCache(confirmations=2)
+        for _ in range(3):
+            cache.observe("8.8.8.1", {"ip": "8.8.8.1", "city": "Mountain View"})
+        assert cache.get("8.8.8.200") is MISSING
+        cache.observe("8.8.8.2", {"ip": "8.8.8.2", "city": "Mountain View"})
+        assert cache.get("8.8.8.200")["city"] == "Mountain View"
+
+    def test_heterogeneous_prefix_is_not_served(self):
+        """Disagreeing answers mark the prefix heterogeneous for good."""
+        cache = PrefixCache(confirmations=1)
+        cache.observe("1.2.3.1", {"city": "A"})
+        cache.observe("1.2.3.2", {"city": "B"})
+        cache.observe("1.2.3.3", {"city": "A"})
+        assert cache.get("1.2.3.4") is MISSING
+        assert cache.stats()["heterogeneous"] == 1
+
+    def test_prefix_lengths(self):
+        """Prefix lengths are per family, 0 disables a family and IPv4-mapped addresses count as IPv4."""
+        cache = PrefixCache(v4_prefix=16, v6_prefix=0)
+        assert cache.prefix("10.1.2.3") == "10.1.0.0/16"
+        assert cache.prefix("::ffff:10.1.2.3") == "10.1.0.0/16"
+        assert cache.prefix("2001:4860::1") is None
+        assert cache.prefix("not an ip") is None
+        assert PrefixCache().prefix("2001:4860:4860::8888") == "2001:4860:4860::/48"
+
+
+class TestCachedLookup:
+    """Test cases for the cache in front of get_ip_info."""
+
+    def test_get_ip_info_uses_cache(self, monkeypatch):
+        """Repeated lookups of the same IP only go upstream once."""
+        calls = []
+
+        def fake_fetch(ip):
+            calls.append(ip)
+            return {"ip": ip}, ip_lookup.PROVIDER_IPAPI
+
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", fake_fetch)
+        assert ip_lookup.get_ip_info("8.8.8.8") == {"ip": "8.8.8.8"}
+        assert ip_lookup.get_ip_info(" 8.8.8.8 ") == {"ip": "8.8.8.8"}
+        assert calls == ["8.8.8.8"]
+
+    def test_failed_lookup_is_negatively_cached(self, monkeypatch):
+        """A failed lookup is not retried while its negative entry is fresh."""
+        calls = []
+
+        def fake_fetch(ip):
+            calls.append(ip)
+            return None, None
+
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", fake_fetch)
+        assert ip_lookup.get_ip_info("999.999.999.999") is None
+        assert ip_lookup.get_ip_info("999.999.999.999") is None
+        assert calls == ["999.999.999.999"]
+
+    def test_prefix_tier_answers_neighbours(self, monkeypatch):
+        """With the prefix tier on, further addresses of a confirmed /24 are not fetched."""
+        calls = []
+
+        def fake_fetch(ip):
+            calls.append(ip)
+            return {"ip": ip, "city": "Frankfurt", "asn": "AS3320"}, ip_lookup.PROVIDER_IPAPI
+
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "PREFIX_CACHE_ENABLED", True)
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=64, ttl=60))
+        monkeypatch.setattr(ip_lookup, "ip_prefix_cache", PrefixCache(confirmations=2))
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", fake_fetch)
+        for i in range(1, 11):
+            assert ip_lookup.get_ip_info(f"80.150.6.{i}")["ip"] == f"80.150.6.{i}"
+        assert calls == ["80.150.6.1", "80.150.6.2"]
+        report = ip_lookup.cache_hit_report()
+        assert report["exact_hit_ratio"] == 0.0
+        assert report["combined_hit_ratio"] == 0.8
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,107 @@
+"""
+Unit tests for local classification of special-purpose and malformed addresses.
+"""
+import pytest
+import sys
+import os
+import ipaddress
+import random
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_classify import (BENCHMARKING, BROADCAST, DOCUMENTATION, GLOBAL, INVALID, LINK_LOCAL, LOOPBACK, MULTICAST,
+                         PRIVATE, RESERVED, SHARED, UNSPECIFIED, PrefixTrie, classify)
+from ip_info import app
+
+
+class TestClassify:
+    """Test cases for the special-purpose registries."""
+
+    @pytest.mark.parametrize("ip, category", [
+        ("8.8.8.8", GLOBAL),
+        ("2001:4860:4860::8888", GLOBAL),
+        ("999.999.999.999", INVALID),
+        ("not an ip", INVALID),
+        ("", INVALID),
+        ("10.1.2.3", PRIVATE),
+        ("172.31.255.255", PRIVATE),
+        ("172.32.0.1", GLOBAL),
+        ("192.168.1.1", PRIVATE),
+        ("100.64.0.1", SHARED),
+        ("127.0.0.1", LOOPBACK),
+        ("169.254.10.10", LINK_LOCAL),
+        ("192.0.2.55", DOCUMENTATION),
+        ("198.51.100.1", DOCUMENTATION),
+        ("203.0.113.9", DOCUMENTATION),
+        ("198.19.0.1", BENCHMARKING),
+        ("224.0.0.251", MULTICAST),
+        ("240.0.0.1", RESERVED),
+        ("255.255.255.255", BROADCAST),
+        ("0.0.0.0", UNSPECIFIED),
+        ("192.0.0.9", GLOBAL),
+        ("::", UNSPECIFIED),
+        ("::1", LOOPBACK),
+        ("fe80::1", LINK_LOCAL),
+        ("fd12:3456::1", PRIVATE),
+        ("ff02::1", MULTICAST),
+        ("2001:db8::1", DOCUMENTATION),
+        ("2001:2::1", BENCHMARKING),
+        ("4000::1", RESERVED),
+        ("::ffff:192.168.0.1", PRIVATE),
+        ("::ffff:8.8.8.8", GLOBAL),
+    ])
+    def test_categories(self, ip, category):
+        """Addresses fall in the category of their most specific registry entry."""
+        assert classify(ip).category == category
+
+    def test_normalizes_address(self):
+        """The result carries the canonical address text and version."""
+        result = classify(" 2001:4860:4860:0:0:0:0:8888 ")
+        assert result.ip == "2001:4860:4860::8888"
+        assert result.version == 6
+        assert result.routable
+
+    def test_agrees_with_ipaddress_on_random_ipv4(self):
+        """For random IPv4 addresses the trie agrees with ipaddress.is_global."""
+        rng = random.Random(7)
+        for _ in range(20000):
+            address = ipaddress.IPv4Address(rng.getrandbits(32))
+            if address.is_multicast:
+                continue
+            assert classify(str(address)).routable == address.is_global, address
+
+    def test_longest_prefix_match(self):
+        """The most specific prefix wins."""
+        trie = PrefixTrie(8)
+        trie.insert(0b10000000, 1, "short")
+        trie.insert(0b10100000, 3, "long")
+        assert trie.longest_match(0b10111111) == "long"
+        assert trie.longest_match(0b11000000) == "short"
+        assert trie.longest_match(0b01000000, "none") == "none"
+
+
+class TestClassifiedLookup:
+    """Test cases for skipping the network for non-routable input."""
+
+    def test_non_routable_never_fetched(self, monkeypatch):
+        """Only globally routable addresses reach fetch_ip_info."""
+        fetched = []
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", lambda ip: (fetched.append(ip), ({"ip": ip}, "ipapi.co"))[1])
+        for ip in ("999.999.999.999", "10.0.0.1", "127.0.0.1", "fe80::1", "224.0.0.1"):
+            classification, data = ip_lookup.get_ip_info_classified(ip)
+            assert data is None and not classification.routable
+        assert fetched == []
+
+    def test_index_explains_non_routable(self, monkeypatch):
+        """The web form says why a private address has no location."""
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", lambda ip: pytest.fail("should not fetch"))
+        response = app.test_client().post("/", data={"ip_address": "192.168.1.1"})
+        assert response.status_code == 200
+        assert b"Private-use network (RFC 1918)" in response.data
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,127 @@
+"""
+Unit tests for single-flight coalescing of concurrent lookups.
+"""
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_cache import TTLCache
+from ip_flight import SingleFlight
+
+
+def run_threads(count, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    """Test cases for the coalescing primitive."""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Callers overlapping an in-flight call get its result without calling again."""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return "answer"
+
+        results = run_threads(10, lambda: flight.do("key", slow))
+        assert results == ["answer"] * 10
+        assert len(calls) == 1
+        assert flight.stats() == {"calls": 1, "saved": 9, "in_flight": 0}
+
+    def test_exception_reaches_every_caller(self):
+        """A failing call raises in every coalesced caller."""
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        def call():
+            try:
+                flight.do("key", failing)
+            except RuntimeError as e:
+                return str(e)
+
+        assert run_threads(5, call) == ["upstream down"] * 5
+
+    def test_sequential_calls_are_not_coalesced(self):
+        """Finished calls are forgotten; the next caller runs the function again."""
+        flight = SingleFlight()
+        assert flight.do("key", lambda: 1) == 1
+        assert flight.do("key", lambda: 2) == 2
+        assert flight.saved == 0
+
+    def test_async_callers_share_one_task(self):
+        """Coroutines for the same key await one shared task."""
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "answer"
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async("key", slow) for _ in range(20)))
+
+        assert asyncio.run(main()) == ["answer"] * 20
+        assert len(calls) == 1
+        assert flight.stats()["saved"] == 19
+
+
+class TestLookupCoalescing:
+    """Test cases for coalescing in the lookup functions."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_state(self, monkeypatch):
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+        monkeypatch.setattr(ip_lookup, "ip_flight", SingleFlight())
+
+    def test_get_ip_info_thundering_herd(self, monkeypatch):
+        """Many threads looking up one uncached IP cause a single upstream fetch."""
+        fetched = []
+
+        def slow_fetch(ip):
+            fetched.append(ip)
+            time.sleep(0.2)
+            return {"ip": ip, "city": "Herd"}, "ipapi.co"
+
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", slow_fetch)
+        results = run_threads(20, lambda: ip_lookup.get_ip_info("8.8.8.8"))
+        assert all(result["city"] == "Herd" for result in results)
+        assert fetched == ["8.8.8.8"]
+        assert ip_lookup.ip_flight.stats()["saved"] == 19
+
+    def test_get_ip_address_coalesced(self, monkeypatch):
+        """Concurrent self-detection calls share one ipify request."""
+        requested = []
+
+        def slow_address(version):
+            requested.append(version)
+            time.sleep(0.2)
+            return "203.0.113.7"
+
+        monkeypatch.setattr(ip_lookup, "_fetch_ip_address", slow_address)
+        assert run_threads(8, lambda: ip_lookup.get_ip_address("ipv4")) == ["203.0.113.7"] * 8
+        assert requested == ["ipv4"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,158 @@
+"""
+Unit tests for the per-provider rate limiter and circuit breaker.
+"""
+import pytest
+import sys
+import os
+import multiprocessing
+import threading
+from unittest.mock import Mock
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_guard import CLOSED, HALF_OPEN, OPEN, ProviderGuard, parse_rate
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _take_tokens(path, count, results):
+    guard = ProviderGuard(path, limits={"svc": (10, 3600)})
+    results.put(sum(guard.acquire("svc") for _ in range(count)))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_guard(request, tmp_path):
+    clock = FakeClock()
+
+    def make(**options):
+        path = str(tmp_path / "limits.db") if request.param == "sqlite" else None
+        return ProviderGuard(path, clock=clock, **options)
+
+    make.clock = clock
+    return make
+
+
+class TestTokenBucket:
+    """Test cases for the per-provider quota."""
+
+    def test_parse_rate(self):
+        """Quotas are given as requests/seconds."""
+        assert parse_rate("45/60") == (45.0, 60.0)
+
+    def test_quota_and_refill(self, make_guard):
+        """The bucket allows the quota in a burst, then refills over the period."""
+        guard = make_guard(limits={"svc": (3, 60)})
+        assert [guard.acquire("svc") for _ in range(4)] == [True, True, True, False]
+        make_guard.clock.now += 20
+        assert guard.acquire("svc")
+        assert not guard.acquire("svc")
+        assert guard.stats()["svc"]["rejected"] == 2
+
+    def test_unlimited_provider(self, make_guard):
+        """Providers without a quota are only subject to the breaker."""
+        guard = make_guard()
+        assert all(guard.acquire("other") for _ in range(100))
+
+    def test_shared_between_threads(self, make_guard):
+        """Concurrent threads never take more than the quota."""
+        guard = make_guard(limits={"svc": (50, 3600)})
+        taken = []
+        threads = [threading.Thread(target=lambda: taken.append(sum(guard.acquire("svc") for _ in range(20))))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sum(taken) == 50
+
+    def test_shared_between_processes(self, tmp_path):
+        """Worker processes draw from the same bucket through the state file."""
+        path = str(tmp_path / "limits.db")
+        ProviderGuard(path, limits={"svc": (10, 3600)})
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_take_tokens, args=(path, 8, results)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert sum(results.get() for _ in workers) == 10
+
+
+class TestCircuitBreaker:
+    """Test cases for opening, half-open probes and closing."""
+
+    def test_opens_after_consecutive_failures(self, make_guard):
+        """The breaker opens on the threshold and rejects calls while open."""
+        guard = make_guard(failure_threshold=3, cooldown=30)
+        for _ in range(2):
+            guard.record_failure("svc")
+        guard.record_success("svc")
+        for _ in range(2):
+            guard.record_failure("svc")
+        assert guard.state("svc") == CLOSED
+        guard.record_failure("svc")
+        assert guard.state("svc") == OPEN
+        assert not guard.acquire("svc")
+
+    def test_rate_limit_opens_immediately(self, make_guard):
+        """A rate-limit answer opens the breaker and empties the bucket."""
+        guard = make_guard(limits={"svc": (100, 60)}, cooldown=30)
+        guard.record_failure("svc", rate_limited=True)
+        assert guard.state("svc") == OPEN
+        assert guard.stats()["svc"]["tokens"] == 0
+
+    def test_half_open_single_probe(self, make_guard):
+        """After the cooldown one probe goes through; its outcome closes or reopens the breaker."""
+        guard = make_guard(failure_threshold=1, cooldown=30)
+        guard.record_failure("svc")
+        make_guard.clock.now += 31
+        assert guard.state("svc") == HALF_OPEN
+        assert guard.acquire("svc")
+        assert not guard.acquire("svc")
+        guard.record_failure("svc")
+        assert guard.state("svc") == OPEN
+
+        make_guard.clock.now += 31
+        assert guard.acquire("svc")
+        guard.record_success("svc")
+        assert guard.state("svc") == CLOSED
+        assert guard.acquire("svc")
+
+
+class TestLookupIntegration:
+    """Test cases for the guard in the provider chain."""
+
+    def test_open_primary_goes_straight_to_fallback(self, monkeypatch, isolated_provider_guard):
+        """With ipapi.co's breaker open, lookups skip it without a request."""
+        monkeypatch.setattr(ip_lookup, "HEDGE_ENABLED", False)
+        isolated_provider_guard.record_failure(ip_lookup.PROVIDER_IPAPI, rate_limited=True)
+        response = Mock(status_code=200)
+        response.json.return_value = {"status": "success", "query": "8.8.8.8", "city": "Mountain View"}
+        get = Mock(return_value=response)
+        monkeypatch.setattr(ip_lookup.provider_client, "get", get)
+
+        data, provider = ip_lookup.fetch_ip_info("8.8.8.8")
+        assert provider == ip_lookup.PROVIDER_IP_API
+        assert get.call_count == 1
+        assert "ip-api.com" in get.call_args[0][0]
+
+    def test_rate_limit_body_opens_breaker(self, monkeypatch, isolated_provider_guard):
+        """ipapi.co's rate-limit error body opens its breaker."""
+        response = Mock(status_code=200)
+        response.json.return_value = {"error": True, "reason": "RateLimited"}
+        monkeypatch.setattr(ip_lookup.provider_client, "get", Mock(return_value=response))
+
+        assert ip_lookup._fetch_primary("8.8.8.8") == (None, None)
+        assert isolated_provider_guard.state(ip_lookup.PROVIDER_IPAPI) == OPEN
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
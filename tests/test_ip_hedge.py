@@ -0,0 +1,99 @@
+"""
+Unit tests for hedged provider requests.
+"""
+import pytest
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_guard import ProviderGuard
+from ip_hedge import Hedger
+
+
+def provider(result, delay=0.0):
+    """Build a provider callable that answers after a delay."""
+    def call():
+        time.sleep(delay)
+        return result
+    return call
+
+
+@pytest.fixture
+def hedger():
+    executor = ThreadPoolExecutor(max_workers=4)
+    yield Hedger(executor, default_delay=0.05)
+    executor.shutdown(wait=False)
+
+
+class TestHedger:
+    """Test cases for racing the fallback against a slow primary."""
+
+    def test_fast_primary_is_not_hedged(self, hedger):
+        """A primary answering before the hedge delay wins without a fallback call."""
+        calls = []
+        result = hedger.run(provider(({"ip": "a"}, "ipapi.co")),
+                            lambda: calls.append(1) or ({"ip": "b"}, "ip-api.com"))
+        assert result == ({"ip": "a"}, "ipapi.co")
+        assert calls == []
+        assert hedger.stats()["hedges"] == 0
+
+    def test_slow_primary_loses_to_fallback(self, hedger):
+        """The fallback answer is returned without waiting for a slow primary."""
+        start = time.monotonic()
+        result = hedger.run(provider(({"ip": "a"}, "ipapi.co"), delay=1.0),
+                            provider(({"ip": "b"}, "ip-api.com")))
+        assert time.monotonic() - start < 0.5
+        assert result == ({"ip": "b"}, "ip-api.com")
+        stats = hedger.stats()
+        assert stats["hedges"] == 1
+        assert stats["wins"] == {"ip-api.com": 1}
+
+    def test_failed_fallback_waits_for_primary(self, hedger):
+        """An unusable fallback answer does not beat a slower valid primary."""
+        result = hedger.run(provider(({"ip": "a"}, "ipapi.co"), delay=0.2),
+                            provider((None, None)))
+        assert result == ({"ip": "a"}, "ipapi.co")
+
+    def test_primary_failure_uses_fallback(self, hedger):
+        """A fast primary failure falls through to the fallback."""
+        result = hedger.run(provider((None, None)), provider(({"ip": "b"}, "ip-api.com")))
+        assert result == ({"ip": "b"}, "ip-api.com")
+
+    def test_delay_tracks_percentile(self, hedger):
+        """Once enough samples exist the hedge delay follows the latency percentile."""
+        for i in range(100):
+            hedger.record_latency(i / 100)
+        assert hedger.delay() == pytest.approx(0.95)
+
+
+    def test_failed_lookup_is_not_a_win(self, hedger):
+        """A lookup neither provider answered is not counted as a win."""
+        hedger.run(provider((None, None)), provider((None, None)))
+        assert hedger.stats()["wins"] == {}
+
+
+class TestRejectedPrimary:
+    """Test cases for primary calls the provider guard rejected."""
+
+    def test_rejected_calls_are_not_latency_samples(self, monkeypatch):
+        """Calls skipped by an open breaker never reach ipapi.co and leave the hedge delay alone."""
+        guard = ProviderGuard(None, limits={"ipapi.co": (1, 86400)})
+        guard.acquire("ipapi.co")
+        executor = ThreadPoolExecutor(max_workers=4)
+        hedger = Hedger(executor, default_delay=0.05, min_samples=1)
+        monkeypatch.setattr(ip_lookup, "_provider_guard", guard)
+        monkeypatch.setattr(ip_lookup, "ip_hedger", hedger)
+        for _ in range(50):
+            assert ip_lookup._fetch_primary("8.8.8.8") == (None, None)
+        assert hedger.stats()["samples"] == 0
+        assert hedger.delay() == 0.05
+        executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
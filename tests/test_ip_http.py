@@ -0,0 +1,94 @@
+"""
+Unit tests for the pooled provider HTTP client.
+"""
+import pytest
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_http import ProviderClient
+from ip_metrics import REGISTRY
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small JSON body over a persistent connection."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"ip": "203.0.113.7"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestProviderClient:
+    """Test cases for connection reuse and stats."""
+
+    def test_connections_are_reused(self, local_server):
+        """Sequential requests to one host share a single handshake."""
+        client = ProviderClient(pool_size=2)
+        for _ in range(5):
+            assert client.get(f"{local_server}/json", timeout=5).json()["ip"] == "203.0.113.7"
+        stats = client.stats()[local_server]
+        assert stats["requests"] == 5
+        assert stats["handshakes"] == 1
+        assert stats["reuse_ratio"] == pytest.approx(0.8)
+        client.close()
+
+    def test_one_session_per_host(self, local_server):
+        """Each host gets its own session and the same session is returned again."""
+        client = ProviderClient()
+        first = client._session_for(local_server)
+        assert client._session_for(local_server) is first
+        assert client._session_for("https://ipapi.co") is not first
+        client.close()
+
+    def test_thread_safe_reuse(self, local_server):
+        """Concurrent threads never open more connections than the pool allows."""
+        client = ProviderClient(pool_size=2, pool_block=True)
+        threads = [threading.Thread(target=lambda: [client.get(local_server, timeout=5) for _ in range(10)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = client.stats()[local_server]
+        assert stats["requests"] == 40
+        assert stats["handshakes"] <= 2
+        client.close()
+
+    def test_reuse_is_exported(self, local_server, monkeypatch):
+        """/metrics reports handshakes and the reuse ratio of the shared client per host."""
+        client = ProviderClient()
+        monkeypatch.setattr(ip_lookup, "provider_client", client)
+        for _ in range(4):
+            client.get(local_server, timeout=5)
+        text = REGISTRY.render()
+        assert f'ip_upstream_connections_opened_total{{host="{local_server}"}} 1' in text
+        assert f'ip_upstream_connection_reuse_ratio{{host="{local_server}"}} 0.75' in text
+        client.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -5,11 +5,22 @@ These tests validate the core functionality of the IP lookup features.
 import pytest
 import sys
 import os
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add parent directory to path to import modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from ip_info import get_ip_address, get_ip_info
+import ip_info
+import ip_lookup
+from ip_cache import StaleWhileRevalidate, TTLCache
+from ip_classify import classify
+from ip_info import app, get_ip_address, get_ip_info
+from ip_metrics import Histogram, Registry
+from ip_record import IPRecord
 
 class TestIPFunctions:
     """Test cases for IP address and information retrieval functions."""
@@ -36,8 +47,8 @@ class TestIPFunctions:
         """Test IP information retrieval for a known IP (Google DNS)."""
         # Test with Google's public DNS (8.8.8.8)
         info = get_ip_info("8.8.8.8")
-        # Should return data or None (due to rate limiting)
-        assert info is None or isinstance(info, dict)
+        # Should return data or None (due to rate limiting); answers are normalized to IPRecord
+        assert info is None or isinstance(info, IPRecord)
         if info:
             # If we get data, it should have expected keys
             assert 'ip' in info or 'city' in info or 'country' in info
@@ -46,7 +57,7 @@ class TestIPFunctions:
         """Test IP information retrieval with invalid IP."""
         info = get_ip_info("999.999.999.999")
         # Should return None for invalid IP
-        assert info is None or isinstance(info, dict)
+        assert info is None or isinstance(info, IPRecord)
     
     def test_get_ip_info_empty(self):
         """Test IP information retrieval with empty string."""
@@ -60,6 +71,247 @@ class TestIPFunctions:
         # Should return None for None input
         assert info is None
 
+class BatchStubHandler(BaseHTTPRequestHandler):
+    """Imitates ip-api.com's POST /batch endpoint."""
+    protocol_version = "HTTP/1.1"
+    calls = []
+
+    def do_POST(self):
+        queries = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.calls.append(queries)
+        answers = []
+        for ip in queries:
+            if ip.startswith("999."):
+                answers.append({"status": "fail", "message": "invalid query", "query": ip})
+            else:
+                answers.append({"status": "success", "query": ip, "city": "Stubville",
+                                "countryCode": "ZZ", "as": "AS64500 Stub Net"})
+        body = json.dumps(answers).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def batch_stub(monkeypatch):
+    BatchStubHandler.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BatchStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ip_lookup, "IP_API_BATCH_URL", f"http://127.0.0.1:{server.server_address[1]}/batch")
+    monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+    monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=1000, ttl=60))
+    yield BatchStubHandler
+    server.shutdown()
+    server.server_close()
+
+
+class TestBatchEndpoint:
+    """Test cases for /api/lookup/batch against a local ip-api.com stub."""
+
+    def test_json_list_is_deduped_and_chunked(self, batch_stub, monkeypatch):
+        """Duplicate IPs are looked up once, only routable misses are sent, in chunks."""
+        monkeypatch.setattr(ip_lookup, "BATCH_CHUNK_SIZE", 2)
+        ips = ["8.8.8.1", "8.8.8.2", "8.8.8.1", "8.8.8.3", "999.1.1.1", "10.0.0.1", "192.0.2.1"]
+        response = app.test_client().post("/api/lookup/batch", json=ips)
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        results = {row["ip"]: row["data"] for row in rows}
+        assert len(rows) == 6
+        assert results["8.8.8.1"]["city"] == "Stubville"
+        assert results["8.8.8.1"]["asn"] == "AS64500"
+        assert results["999.1.1.1"] is None
+        assert results["10.0.0.1"] is None and results["192.0.2.1"] is None
+        assert sorted(len(chunk) for chunk in batch_stub.calls) == [1, 2]
+        assert sorted(ip for chunk in batch_stub.calls for ip in chunk) == ["8.8.8.1", "8.8.8.2", "8.8.8.3"]
+
+    def test_newline_body_and_cache_hits(self, batch_stub):
+        """A newline-delimited body works and cached IPs are not sent upstream."""
+        ip_lookup.ip_info_cache.set("8.8.8.9", {"ip": "8.8.8.9", "city": "Cached"})
+        response = app.test_client().post("/api/lookup/batch", data="8.8.8.9\n8.8.8.10\n\n",
+                                          content_type="text/plain")
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert {row["ip"]: row["data"]["city"] for row in rows} == {"8.8.8.9": "Cached", "8.8.8.10": "Stubville"}
+        assert batch_stub.calls == [["8.8.8.10"]]
+
+    def test_rejects_bad_json(self, batch_stub):
+        """A JSON body that is not a list of strings is rejected."""
+        response = app.test_client().post("/api/lookup/batch", json={"ips": "8.8.8.8"})
+        assert response.status_code == 400
+
+
+class TestJSONApi:
+    """Test cases for /api/ip/<ip> and /api/me conditional GETs."""
+
+    @pytest.fixture(autouse=True)
+    def fake_upstream(self, monkeypatch):
+        self.fetches = []
+
+        def fake_fetch(ip):
+            self.fetches.append(ip)
+            if ip == "1.0.0.0":
+                return None, "ipapi.co"
+            return {"ip": ip, "city": "Mountain View", "country": "US", "version": "IPv4"}, "ipapi.co"
+
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=600))
+        monkeypatch.setattr(ip_lookup, "CACHE_TTL", 600)
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", fake_fetch)
+        self.client = app.test_client()
+
+    def test_record_with_etag_and_max_age(self):
+        """A lookup returns the normalized record with a strong ETag and the remaining TTL."""
+        response = self.client.get("/api/ip/8.8.8.8")
+        assert response.status_code == 200
+        record = response.get_json()
+        assert record["city"] == "Mountain View"
+        assert "version" not in record
+        etag, weak = response.get_etag()
+        assert etag and not weak
+        assert response.cache_control.public
+        assert 590 <= response.cache_control.max_age <= 600
+
+    def test_repeat_client_gets_304_without_upstream_call(self):
+        """A matching If-None-Match is answered with an empty 304 from the cache."""
+        first = self.client.get("/api/ip/8.8.8.8")
+        again = self.client.get("/api/ip/8.8.8.8", headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304
+        assert again.get_data() == b""
+        assert self.fetches == ["8.8.8.8"]
+        changed = self.client.get("/api/ip/8.8.8.8", headers={"If-None-Match": '"stale"'})
+        assert changed.status_code == 200
+
+    def test_invalid_and_unknown(self):
+        """Malformed addresses are rejected and addresses without data are 404s."""
+        assert self.client.get("/api/ip/not-an-ip").status_code == 400
+        assert self.fetches == []
+        assert self.client.get("/api/ip/1.0.0.0").status_code == 404
+
+    def test_non_routable_answered_locally(self):
+        """Special-purpose addresses get a typed 422 without any upstream call."""
+        response = self.client.get("/api/ip/10.0.0.1")
+        assert response.status_code == 422
+        assert response.get_json()["category"] == "private"
+        assert self.client.get("/api/ip/::1").get_json()["category"] == "loopback"
+        assert self.fetches == []
+
+    def test_me_is_cached_and_conditional(self, monkeypatch):
+        """/api/me reuses the detection result, so a repeat client gets a 304 without any lookup."""
+        detections = []
+
+        def fake_my_ip_info():
+            detections.append(1)
+            return "203.0.113.7", None, {"ip": "203.0.113.7", "city": "Home"}
+
+        monkeypatch.setattr(ip_lookup, "get_my_ip_info", fake_my_ip_info)
+        monkeypatch.setattr(ip_lookup, "my_ip_info_cache", StaleWhileRevalidate(
+            lambda: ip_lookup.get_my_ip_info(), max_age=300, accept=lambda result: result[2] is not None))
+        first = self.client.get("/api/me")
+        assert first.get_json() == {"ipv4": "203.0.113.7", "ipv6": None,
+                                    "data": dict.fromkeys(ip_lookup.RECORD_FIELDS) | {"ip": "203.0.113.7", "city": "Home"}}
+        again = self.client.get("/api/me", headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304
+        assert detections == [1]
+
+    def test_index_shows_when_my_ip_was_really_fetched(self, monkeypatch):
+        """The My IP page is served from memory and labels the data with its original fetch time."""
+        fetched_at = datetime(2024, 5, 1, 12, 30, 0).timestamp()
+        cache = StaleWhileRevalidate(lambda: ("203.0.113.7", None, {"ip": "203.0.113.7", "city": "Home"}),
+                                     max_age=10 ** 12, clock=lambda: fetched_at)
+        monkeypatch.setattr(ip_lookup, "my_ip_info_cache", cache)
+        page = self.client.get("/").get_data(as_text=True)
+        assert "2024-05-01 12:30:00" in page
+        assert "ago)" in page
+
+    def test_failed_detection_shows_could_not_detect(self, monkeypatch):
+        """A detection that raises gives /api/me a 502 and the page its auto-detect error, then backs off."""
+        detections = []
+
+        def failing_my_ip_info():
+            detections.append(1)
+            raise RuntimeError("ipify down")
+
+        monkeypatch.setattr(ip_lookup, "get_my_ip_info", failing_my_ip_info)
+        monkeypatch.setattr(ip_info, "PAGE_STREAMING", False)
+        ip_lookup.my_ip_info_cache.clear()
+        try:
+            for _ in range(2):
+                response = self.client.get("/api/me")
+                assert response.status_code == 502
+                assert response.get_json()["ipv4"] is None
+                page = self.client.get("/")
+                assert page.status_code == 200
+                assert "Unable to retrieve your IP location information" in page.get_data(as_text=True)
+            assert detections == [1]
+        finally:
+            ip_lookup.my_ip_info_cache.clear()
+
+
+
+class TestStreamedIndex:
+    """Test cases for the progressively rendered index page."""
+
+    @pytest.fixture(autouse=True)
+    def slow_lookup(self, monkeypatch):
+        self.release = threading.Event()
+
+        def slow(ip):
+            self.release.wait(5)
+            return classify(ip), {"ip": ip, "city": "Slow City", "country_name": "Nowhere"}
+
+        monkeypatch.setattr(ip_info, "get_ip_info_classified", slow)
+        self.client = app.test_client()
+        yield
+        self.release.set()
+
+    def test_shell_is_sent_before_the_lookup_finishes(self):
+        """The search form and IP badge arrive first; the location card follows the lookup."""
+        chunks = self.client.post("/", data={"ip_address": "8.8.8.8"}).iter_encoded()
+        first = next(chunks).decode()
+        assert 'name="ip_address"' in first
+        assert "IPv4: 8.8.8.8" in first
+        assert "Slow City" not in first
+        self.release.set()
+        rest = b"".join(chunks).decode()
+        assert "Slow City" in rest
+        assert rest.rstrip().endswith("</html>")
+
+    def test_render_time_excludes_time_between_chunks(self, monkeypatch):
+        """Only rendering is timed, not the wait for the client to read the next part."""
+        histogram = Histogram("test_render_seconds", "Render time.", ["template"], registry=Registry())
+        monkeypatch.setattr(ip_info, "TEMPLATE_RENDER_SECONDS", histogram)
+        chunks = self.client.post("/", data={"ip_address": "8.8.8.8"}).iter_encoded()
+        next(chunks)
+        time.sleep(0.3)
+        self.release.set()
+        b"".join(chunks)
+        samples = {(labels, suffix): value for suffix, labels, _, value in histogram.samples() if suffix != "_bucket"}
+        assert samples[(("index_shell.html",), "_count")] == samples[(("index_card.html",), "_count")] == 1
+        assert samples[(("index_shell.html",), "_sum")] + samples[(("index_card.html",), "_sum")] < 0.3
+
+    def test_timeout_renders_partial_result(self, monkeypatch):
+        """A lookup slower than PAGE_TIMEOUT yields a partial page instead of an error."""
+        monkeypatch.setattr(ip_info, "PAGE_TIMEOUT", 0.05)
+        page = self.client.post("/", data={"ip_address": "8.8.8.8"}).get_data(as_text=True)
+        assert "Location not available yet" in page
+        assert "IPv4: 8.8.8.8" in page
+        assert "Slow City" not in page
+
+    def test_streaming_can_be_disabled(self, monkeypatch):
+        """With streaming off the page is rendered in one piece."""
+        monkeypatch.setattr(ip_info, "PAGE_STREAMING", False)
+        self.release.set()
+        response = self.client.post("/", data={"ip_address": "8.8.8.8"})
+        page = response.get_data(as_text=True)
+        assert 'id="pending-card"' not in page
+        assert "Slow City" in page
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
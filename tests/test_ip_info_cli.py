@@ -0,0 +1,120 @@
+"""
+Unit tests for the streaming command-line enricher.
+"""
+import pytest
+import sys
+import os
+import io
+import json
+import threading
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_info_cli
+import ip_lookup
+
+
+class TestExtractIps:
+    """Test cases for pulling addresses out of log lines."""
+
+    def test_extracts_ipv4_and_ipv6(self):
+        """Valid addresses are found anywhere in a line; invalid ones are skipped."""
+        lines = [
+            '203.0.113.7 - - [17/Oct/2026:10:00:00 +0000] "GET / HTTP/1.1" 200\n',
+            "client=2001:db8::1 upstream=999.1.1.1 at 12:30:45\n",
+            "8.8.8.8\n",
+        ]
+        assert list(ip_info_cli.extract_ips(lines)) == ["203.0.113.7", "2001:db8::1", "8.8.8.8"]
+
+
+class TestResolve:
+    """Test cases for the bounded, order-preserving worker pool."""
+
+    def test_preserves_order(self, monkeypatch):
+        """Results come back in input order even when lookups finish out of order."""
+        def fake_info(ip):
+            time.sleep(0.05 if ip.endswith(".1") else 0)
+            return {"ip": ip}
+
+        monkeypatch.setattr(ip_lookup, "get_ip_info", fake_info)
+        ips = [f"8.8.8.{i}" for i in range(1, 20)]
+        assert [ip for ip, _ in ip_info_cli.resolve(iter(ips), workers=4)] == ips
+
+    def test_dedupes_in_flight_lookups(self, monkeypatch):
+        """Concurrent occurrences of one IP share a single lookup."""
+        calls = []
+        lock = threading.Lock()
+
+        def fake_info(ip):
+            with lock:
+                calls.append(ip)
+            time.sleep(0.02)
+            return {"ip": ip}
+
+        monkeypatch.setattr(ip_lookup, "get_ip_info", fake_info)
+        results = list(ip_info_cli.resolve(iter(["8.8.8.1"] * 10), workers=4, window=10))
+        assert len(results) == 10
+        assert calls == ["8.8.8.1"]
+
+    def test_consumes_input_lazily(self, monkeypatch):
+        """Only a bounded window of input is read ahead of the output."""
+        monkeypatch.setattr(ip_lookup, "get_ip_info", lambda ip: None)
+        consumed = []
+
+        def source():
+            for i in range(1000):
+                consumed.append(i)
+                yield f"8.8.8.{i % 250}"
+
+        results = ip_info_cli.resolve(source(), workers=2, window=8)
+        next(results)
+        assert len(consumed) <= 8
+
+    def test_non_routable_addresses_stay_local(self, monkeypatch):
+        """Private and documentation addresses are answered without a provider lookup."""
+        calls = []
+        monkeypatch.setattr(ip_lookup, "get_ip_info", lambda ip: calls.append(ip) or {"ip": ip})
+        results = dict(ip_info_cli.resolve(iter(["10.0.0.1", "192.0.2.1", "8.8.8.8"]), workers=2))
+        assert results == {"10.0.0.1": None, "192.0.2.1": None, "8.8.8.8": {"ip": "8.8.8.8"}}
+        assert calls == ["8.8.8.8"]
+
+    def test_custom_lookup(self):
+        """A lookup function other than get_ip_info can be supplied."""
+        results = list(ip_info_cli.resolve(iter(["8.8.8.1", "8.8.8.2"]), workers=2,
+                                           lookup=lambda ip: ("classified", ip)))
+        assert results == [("8.8.8.1", ("classified", "8.8.8.1")), ("8.8.8.2", ("classified", "8.8.8.2"))]
+
+
+class TestMain:
+    """Test cases for the output formats."""
+
+    def run(self, monkeypatch, capsys, argv, text):
+        monkeypatch.setattr(ip_lookup, "get_ip_info",
+                            lambda ip: {"ip": ip, "country": "ZZ"} if ip != "8.8.8.2" else None)
+        monkeypatch.setattr(sys, "stdin", io.StringIO(text))
+        assert ip_info_cli.main(argv) == 0
+        return capsys.readouterr().out
+
+    def test_ndjson(self, monkeypatch, capsys):
+        """NDJSON output has one object per address occurrence."""
+        out = self.run(monkeypatch, capsys, ["-f", "ndjson"], "x 8.8.8.1 y\n8.8.8.2\n")
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert [row["ip"] for row in rows] == ["8.8.8.1", "8.8.8.2"]
+        assert rows[0]["country"] == "ZZ"
+        assert rows[1]["country"] is None
+
+    def test_csv(self, monkeypatch, capsys):
+        """CSV output starts with a header row."""
+        out = self.run(monkeypatch, capsys, ["-f", "csv"], "8.8.8.1\n")
+        assert out.splitlines()[0] == ",".join(ip_info_cli.FIELDS)
+
+    def test_table(self, monkeypatch, capsys):
+        """Table output includes each address."""
+        out = self.run(monkeypatch, capsys, ["-f", "table"], "8.8.8.1\n8.8.8.2\n")
+        assert "8.8.8.1" in out and "N/A" in out
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
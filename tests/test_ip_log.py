@@ -0,0 +1,109 @@
+"""
+Unit tests for the structured event log.
+"""
+import sys
+import os
+import io
+import json
+import threading
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ip_log import EventLogger, parse_sample_rates
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingStream:
+    """Stream whose writes wait until released, to fill the logger's queue."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.text = []
+
+    def write(self, text):
+        self.release.wait(5)
+        self.text.append(text)
+
+    def flush(self):
+        pass
+
+
+class TestEventLogger:
+    """Test cases for EventLogger."""
+
+    def test_writes_json_lines(self):
+        """Records are written as one JSON object per line with the event and its fields."""
+        stream = io.StringIO()
+        log = EventLogger(stream=stream)
+        assert log.log("upstream_error", ip="8.8.8.8", provider="ipapi.co", latency_ms=12.5)
+        log.close()
+
+        record = json.loads(stream.getvalue())
+        assert record["event"] == "upstream_error"
+        assert record["ip"] == "8.8.8.8"
+        assert record["latency_ms"] == 12.5
+        assert "ts" in record
+        assert log.stats()["logged"] == 1
+
+    def test_sampled_out_records_are_not_written(self):
+        """An event sampled at 0 is never written; other events are unaffected."""
+        stream = io.StringIO()
+        log = EventLogger(stream=stream, sample_rates={"fallback_used": 0.0})
+        assert not log.log("fallback_used", ip="8.8.8.8")
+        assert log.log("upstream_error", ip="8.8.8.8")
+        log.close()
+
+        lines = stream.getvalue().splitlines()
+        assert [json.loads(line)["event"] for line in lines] == ["upstream_error"]
+        assert log.stats()["sampled_out"] == 1
+
+    def test_rate_cap_reports_suppressed_records(self):
+        """Records over the per-event cap are counted and reported by the next written record."""
+        stream = io.StringIO()
+        clock = FakeClock()
+        log = EventLogger(stream=stream, rate_limit=2, clock=clock)
+        results = [log.log("upstream_error", n=n) for n in range(5)]
+        assert results == [True, True, False, False, False]
+        assert log.log("fallback_used")  # Other events have their own budget
+
+        clock.now += 1.0
+        assert log.log("upstream_error", n=5)
+        log.close()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert records[-1]["n"] == 5
+        assert records[-1]["suppressed"] == 3
+        assert log.stats()["rate_limited"] == 3
+
+    def test_full_queue_drops_without_blocking(self):
+        """When the writer cannot keep up, log() drops records instead of waiting."""
+        stream = BlockingStream()
+        log = EventLogger(stream=stream, rate_limit=0, maxsize=2)
+        for n in range(20):
+            log.log("upstream_error", n=n)
+        assert log.stats()["dropped"] > 0
+
+        stream.release.set()
+        log.close()
+        written = "".join(stream.text).splitlines()
+        assert len(written) == log.stats()["logged"]
+
+
+class TestParseSampleRates:
+    """Test cases for parse_sample_rates."""
+
+    def test_parse(self):
+        assert parse_sample_rates("fallback_used=0.1, upstream_error=2") == {"fallback_used": 0.1,
+                                                                             "upstream_error": 1.0}
+
+    def test_empty(self):
+        assert parse_sample_rates("") == {}
+        assert parse_sample_rates(None) == {}
@@ -0,0 +1,71 @@
+"""
+Unit tests for the shared lookup functions in ip_lookup.
+"""
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+
+
+def fake_addresses(ipv4, ipv6, delays):
+    """Build a get_ip_address replacement returning fixed addresses after a delay."""
+    def get_ip_address(version="ipv4"):
+        time.sleep(delays.get(version, 0))
+        return ipv4 if version == "ipv4" else ipv6
+    return get_ip_address
+
+
+def fake_info(results, delays):
+    """Build a get_ip_info replacement returning fixed results after a delay."""
+    def get_ip_info(ip):
+        time.sleep(delays.get(ip, 0))
+        return results.get(ip)
+    return get_ip_info
+
+
+class TestGetMyIpInfo:
+    """Test cases for concurrent detection and geolocation of the caller's IPs."""
+
+    def test_returns_without_waiting_for_slow_ipv6(self, monkeypatch):
+        """IPv4 geolocation is returned as soon as it is in, ignoring a slow IPv6 probe."""
+        monkeypatch.setattr(ip_lookup, "get_ip_address",
+                            fake_addresses("203.0.113.7", None, {"ipv6": 2.0}))
+        monkeypatch.setattr(ip_lookup, "get_ip_info",
+                            fake_info({"203.0.113.7": {"ip": "203.0.113.7"}}, {}))
+        start = time.monotonic()
+        ipv4, ipv6, info = ip_lookup.get_my_ip_info(deadline=5)
+        assert time.monotonic() - start < 1.0
+        assert ipv4 == "203.0.113.7"
+        assert ipv6 is None
+        assert info == {"ip": "203.0.113.7"}
+
+    def test_falls_back_to_ipv6(self, monkeypatch):
+        """IPv6 geolocation is used when IPv4 cannot be geolocated."""
+        monkeypatch.setattr(ip_lookup, "get_ip_address",
+                            fake_addresses("203.0.113.7", "2001:db8::1", {}))
+        monkeypatch.setattr(ip_lookup, "get_ip_info",
+                            fake_info({"2001:db8::1": {"ip": "2001:db8::1"}}, {}))
+        ipv4, ipv6, info = ip_lookup.get_my_ip_info(deadline=5)
+        assert (ipv4, ipv6) == ("203.0.113.7", "2001:db8::1")
+        assert info == {"ip": "2001:db8::1"}
+
+    def test_deadline_returns_partial_result(self, monkeypatch):
+        """When the deadline passes the addresses found so far are returned."""
+        monkeypatch.setattr(ip_lookup, "get_ip_address",
+                            fake_addresses("203.0.113.7", None, {"ipv6": 2.0}))
+        monkeypatch.setattr(ip_lookup, "get_ip_info",
+                            fake_info({"203.0.113.7": {"ip": "203.0.113.7"}}, {"203.0.113.7": 2.0}))
+        start = time.monotonic()
+        ipv4, ipv6, info = ip_lookup.get_my_ip_info(deadline=0.3)
+        assert time.monotonic() - start < 1.0
+        assert ipv4 == "203.0.113.7"
+        assert info is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,251 @@
+"""
+Unit tests for the asyncio lookup client and the ASGI entry point.
+"""
+import pytest
+import sys
+import os
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("aiohttp")
+
+import ip_lookup
+import ip_lookup_async
+from ip_cache import StaleWhileRevalidate, TTLCache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Imitates ipify, ipapi.co and ip-api.com with a fixed delay."""
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    ipapi_rate_limited = False
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if self.path.startswith("/ipify"):
+            body = {"ip": "203.0.113.7"}
+        elif self.path.startswith("/ipapi/"):
+            ip = self.path.split("/")[2]
+            if self.ipapi_rate_limited:
+                body = {"error": True, "reason": "RateLimited"}
+            else:
+                body = {"ip": ip, "city": "Primary City", "country_name": "Stubland"}
+        else:
+            ip = self.path.split("/")[2]
+            body = {"status": "success", "query": ip, "city": "Fallback City"}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    StubHandler.delay = 0.0
+    StubHandler.ipapi_rate_limited = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(ip_lookup, "IPIFY_V4_URL", f"{base}/ipify")
+    monkeypatch.setattr(ip_lookup, "IPIFY_V6_URL", "http://127.0.0.1:9/unreachable")
+    monkeypatch.setattr(ip_lookup, "IPAPI_URL", base + "/ipapi/{ip}/json/")
+    monkeypatch.setattr(ip_lookup, "IP_API_URL", base + "/ipapi-fallback/{ip}")
+    monkeypatch.setattr(ip_lookup, "HEDGE_ENABLED", False)
+    monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+    monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=1000, ttl=60))
+    yield StubHandler
+    server.shutdown()
+    server.server_close()
+
+
+def run(coro):
+    """Run coro on a fresh loop and close that loop's HTTP session afterwards."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await ip_lookup_async.async_provider_client.close()
+    return asyncio.run(main())
+
+
+class TestAsyncLookup:
+    """Test cases for the async provider chain."""
+
+    def test_primary_lookup_and_cache(self, stub):
+        """A lookup is answered by the primary and then served from the shared cache."""
+        info = run(ip_lookup_async.get_ip_info("192.0.2.1"))
+        assert info["city"] == "Primary City"
+        assert ip_lookup.get_ip_info("192.0.2.1")["city"] == "Primary City"
+
+    def test_rate_limit_uses_fallback(self, stub):
+        """A rate-limit error body from ipapi.co falls through to ip-api.com."""
+        stub.ipapi_rate_limited = True
+        assert run(ip_lookup_async.get_ip_info("192.0.2.2"))["city"] == "Fallback City"
+
+    def test_each_lookup_logs_one_event(self, stub, monkeypatch):
+        """Sync and async upstream lookups log who answered, how fast, and whether it was the fallback."""
+        events = []
+        monkeypatch.setattr(ip_lookup, "log_event", lambda event, **fields: events.append((event, fields)))
+        ip_lookup.get_ip_info("192.0.2.4")
+        stub.ipapi_rate_limited = True
+        run(ip_lookup_async.get_ip_info("192.0.2.5"))
+        lookups = [fields for event, fields in events if event == "lookup"]
+        assert [(fields["ip"], fields["provider"], fields["fallback_used"]) for fields in lookups] == [
+            ("192.0.2.4", ip_lookup.PROVIDER_IPAPI, False), ("192.0.2.5", ip_lookup.PROVIDER_IP_API, True)]
+        assert all(fields["latency_ms"] >= 0 for fields in lookups)
+
+    def test_deadline(self, stub):
+        """A lookup slower than its deadline gives up with None."""
+        stub.delay = 1.0
+        start = time.monotonic()
+        assert run(ip_lookup_async.get_ip_info("192.0.2.3", deadline=0.2)) is None
+        assert time.monotonic() - start < 0.9
+
+    def test_many_concurrent_slow_lookups(self, stub):
+        """Concurrent slow lookups overlap instead of queueing behind each other."""
+        stub.delay = 0.3
+
+        async def lookups():
+            return await asyncio.gather(*(ip_lookup_async.get_ip_info(f"198.51.100.{i}") for i in range(50)))
+
+        start = time.monotonic()
+        results = run(lookups())
+        assert all(result["city"] == "Primary City" for result in results)
+        assert time.monotonic() - start < 2.5
+
+    def test_my_ip_without_ipv6(self, stub):
+        """My IP detection returns the IPv4 result even when IPv6 is unreachable."""
+        ipv4, ipv6, info = run(ip_lookup_async.get_my_ip_info(deadline=5))
+        assert (ipv4, ipv6) == ("203.0.113.7", None)
+        assert info["city"] == "Primary City"
+
+
+class TestASGIApp:
+    """Test cases for the ASGI entry point."""
+
+    def call(self, method, path, body=b"", headers=()):
+        status, _, text = self.call_with_headers(method, path, body, headers)
+        return status, text
+
+    def call_with_headers(self, method, path, body=b"", headers=()):
+        from ip_info_asgi import app
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": method, "path": path, "headers": list(headers)}
+        run(app(scope, receive, send))
+        response_headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+        return sent[0]["status"], response_headers, b"".join(m.get("body", b"") for m in sent[1:]).decode()
+
+    def test_lookup_form(self, stub):
+        """Posting the search form renders the looked-up location."""
+        status, html = self.call("POST", "/", b"ip_address=9.9.9.9")
+        assert status == 200
+        assert "Primary City" in html and "9.9.9.9" in html
+
+    def test_unknown_path(self, stub):
+        """Unknown paths get a 404."""
+        assert self.call("GET", "/nope")[0] == 404
+
+    def test_json_record_with_etag(self, stub):
+        """/api/ip/<ip> answers like the Flask route, including 304 for a matching ETag."""
+        status, headers, body = self.call_with_headers("GET", "/api/ip/9.9.9.9")
+        assert status == 200
+        assert json.loads(body)["city"] == "Primary City"
+        assert "public" in headers["cache-control"] and "max-age=" in headers["cache-control"]
+
+        status, _, body = self.call_with_headers("GET", "/api/ip/9.9.9.9",
+                                                 headers=[(b"if-none-match", headers["etag"].encode())])
+        assert (status, body) == (304, "")
+        assert self.call("GET", "/api/ip/not-an-ip")[0] == 400
+        assert self.call("GET", "/api/ip/192.168.1.1")[0] == 422
+
+    def test_me(self, stub, monkeypatch):
+        """/api/me serves the cached self-detection with its age."""
+        cache = StaleWhileRevalidate(lambda: ("203.0.113.7", None, {"ip": "203.0.113.7", "city": "Here"}),
+                                     max_age=300)
+        monkeypatch.setattr(ip_lookup, "my_ip_info_cache", cache)
+        status, headers, body = self.call_with_headers("GET", "/api/me")
+        assert status == 200
+        assert json.loads(body)["data"]["city"] == "Here"
+        assert headers["age"] == "0"
+
+    def test_batch_streams_ndjson(self, stub, monkeypatch):
+        """/api/lookup/batch streams one line per IP and validates the body like the Flask route."""
+        monkeypatch.setattr(ip_lookup, "get_ip_info_batch",
+                            lambda ips: ((ip, {"ip": ip, "city": "Batch City"}) for ip in ips))
+        status, headers, body = self.call_with_headers("POST", "/api/lookup/batch", b'["8.8.8.8", "1.1.1.1"]',
+                                                       [(b"content-type", b"application/json")])
+        assert status == 200
+        assert headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line)["ip"] for line in body.splitlines()] == ["8.8.8.8", "1.1.1.1"]
+
+        status, _ = self.call("POST", "/api/lookup/batch", b'{"ips": 5}', [(b"content-type", b"application/json")])
+        assert status == 400
+        assert self.call("GET", "/api/lookup/batch")[0] == 405
+
+    def test_batch_is_closed_when_the_client_disconnects(self, stub, monkeypatch):
+        """A failing send closes the batch generator, which stops its executor."""
+        from ip_info_asgi import app
+        closed = []
+
+        def batch(ips):
+            try:
+                for ip in ips:
+                    yield ip, {"ip": ip}
+            finally:
+                closed.append(True)
+
+        monkeypatch.setattr(ip_lookup, "get_ip_info_batch", batch)
+        messages = [{"type": "http.request", "body": b"8.8.8.8\n1.1.1.1\n", "more_body": False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise OSError("client went away")
+
+        scope = {"type": "http", "method": "POST", "path": "/api/lookup/batch", "query_string": b"",
+                 "headers": []}
+        with pytest.raises(OSError):
+            run(app(scope, receive, send))
+        assert closed == [True]
+
+    def test_store_is_opened_off_the_event_loop(self, stub, tmp_path, monkeypatch):
+        """The first lookup opens the SQLite store in a worker thread, not on the loop."""
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", str(tmp_path / "lookups.db"))
+        opened_in = []
+        load = ip_lookup.load_local_sources
+
+        def record_thread():
+            opened_in.append(threading.current_thread())
+            load()
+
+        monkeypatch.setattr(ip_lookup, "load_local_sources", record_thread)
+        run(ip_lookup_async.get_ip_info("9.9.9.9"))
+        run(ip_lookup_async.get_ip_info("9.9.9.9"))
+        assert len(opened_in) == 1 and opened_in[0] is not threading.main_thread()
+        ip_lookup._lookup_store.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,127 @@
+"""
+Unit tests for the Prometheus-style metrics and the /metrics endpoint.
+"""
+import pytest
+import sys
+import os
+from unittest.mock import Mock
+
+import requests
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_cache import TTLCache
+from ip_info import app
+from ip_metrics import UPSTREAM_SECONDS, CallbackMetric, Counter, Gauge, Histogram, Registry, track_upstream
+
+
+def sample(text, line_start):
+    """Return the value of the first exposition line starting with line_start."""
+    for line in text.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+class TestRegistry:
+    """Test cases for metric types and the text format."""
+
+    def test_counter_and_gauge(self):
+        """Counters and gauges render one labelled series each with HELP/TYPE headers."""
+        registry = Registry()
+        counter = Counter("requests_total", "Requests.", ("route",), registry=registry)
+        gauge = Gauge("in_flight", "In flight.", registry=registry)
+        counter.inc("/")
+        counter.inc("/", amount=2)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        text = registry.render()
+        assert "# TYPE requests_total counter" in text
+        assert sample(text, 'requests_total{route="/"}') == 3
+        assert sample(text, "in_flight") == 1
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Histogram buckets count every observation at or below their bound."""
+        registry = Registry()
+        histogram = Histogram("latency_seconds", "Latency.", ("provider",), buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, "a")
+        text = registry.render()
+        assert sample(text, 'latency_seconds_bucket{provider="a",le="0.1"}') == 2
+        assert sample(text, 'latency_seconds_bucket{provider="a",le="1"}') == 3
+        assert sample(text, 'latency_seconds_bucket{provider="a",le="+Inf"}') == 4
+        assert sample(text, 'latency_seconds_count{provider="a"}') == 4
+        assert sample(text, 'latency_seconds_sum{provider="a"}') == pytest.approx(3.65)
+
+    def test_failing_callback_skipped(self):
+        """A callback that raises is left out instead of breaking the scrape."""
+        registry = Registry()
+        CallbackMetric("broken", "Broken.", lambda: 1 / 0, registry=registry)
+        CallbackMetric("fine", "Fine.", lambda: {("x",): 2}, labelnames=("name",), registry=registry)
+        text = registry.render()
+        assert "broken" not in text
+        assert sample(text, 'fine{name="x"}') == 2
+
+    def test_duplicate_name_rejected(self):
+        """Registering two metrics under one name is an error."""
+        registry = Registry()
+        Counter("dup", "Dup.", registry=registry)
+        with pytest.raises(ValueError):
+            Counter("dup", "Dup.", registry=registry)
+
+
+class TestInstrumentation:
+    """Test cases for the instrumented lookup path and the endpoint."""
+
+    def test_track_upstream_records_outcome(self):
+        """Upstream calls are recorded under the outcome their caller sets."""
+        with track_upstream("test-provider") as call:
+            call.outcome = "timeout"
+        with pytest.raises(RuntimeError):
+            with track_upstream("test-provider"):
+                raise RuntimeError("boom")
+        series = UPSTREAM_SECONDS._values
+        assert ("test-provider", "timeout") in series
+        assert ("test-provider", "error") in series
+
+    def test_metrics_endpoint(self, monkeypatch):
+        """/metrics exposes provider outcomes, lookup outcomes and cache and render metrics."""
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", "")
+        monkeypatch.setattr(ip_lookup, "HEDGE_ENABLED", False)
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+
+        def fake_get(url, timeout):
+            response = Mock(status_code=200)
+            if "ipapi.co" in url:
+                response.status_code = 429
+                response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+            else:
+                response.json.return_value = {"status": "success", "query": "8.8.4.4", "city": "Fallback"}
+            return response
+
+        monkeypatch.setattr(ip_lookup.provider_client, "get", fake_get)
+        app.config["TESTING"] = True
+        with app.test_client() as client:
+            # The page is streamed; reading it waits for the lookup like a browser would
+            client.post("/", data={"ip_address": "8.8.4.4"}).get_data()
+            client.post("/", data={"ip_address": "8.8.4.4"}).get_data()
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        text = response.get_data(as_text=True)
+        assert 'ip_upstream_request_seconds_count{provider="ipapi.co",outcome="rate_limited"}' in text
+        assert 'ip_upstream_request_seconds_count{provider="ip-api.com",outcome="success"}' in text
+        assert 'ip_lookup_seconds_count{outcome="fallback_used"}' in text
+        assert sample(text, 'ip_upstream_requests_in_flight{provider="ipapi.co"}') == 0
+        assert sample(text, "ip_cache_hit_ratio") == 0.5
+        # A streamed page times its shell and its card under separate labels
+        assert 'ip_template_render_seconds_count{template="index_shell.html"}' in text
+        assert 'ip_template_render_seconds_count{template="index_card.html"}' in text
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
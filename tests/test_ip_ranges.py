@@ -0,0 +1,113 @@
+"""
+Unit tests for the offline IP range database.
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_ranges import MappedRangeTable, RangeTable, load_range_table
+
+SAMPLE_CSV = """start,end,city,region,country,country_name,latitude,longitude,timezone,org,asn
+8.8.8.0,8.8.8.255,Mountain View,California,US,United States,37.4056,-122.0775,America/Los_Angeles,Google LLC,AS15169
+1.1.1.0,1.1.1.255,Brisbane,Queensland,AU,Australia,-27.4766,153.0166,Australia/Brisbane,Cloudflare,AS13335
+2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,Mountain View,California,US,United States,,,America/Los_Angeles,Google LLC,AS15169
+16843264,16843519,Fuzhou,,CN,China,,,,,
+"""
+
+
+@pytest.fixture
+def sample_csv(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text(SAMPLE_CSV)
+    return str(path)
+
+
+class TestRangeTable:
+    """Test cases for loading and binary-searching the range table."""
+
+    def test_ipv4_lookup(self, sample_csv):
+        """An address inside a range resolves to that range's location."""
+        table = RangeTable.from_csv(sample_csv)
+        info = table.lookup("8.8.8.8")
+        assert info["ip"] == "8.8.8.8"
+        assert info["city"] == "Mountain View"
+        assert info["country"] == "US"
+        assert info["asn"] == "AS15169"
+        assert info["latitude"] == pytest.approx(37.4056)
+
+    def test_ipv6_lookup_and_missing_coordinates(self, sample_csv):
+        """IPv6 ranges work and empty coordinates come back as None."""
+        info = RangeTable.from_csv(sample_csv).lookup("2001:4860:4860::8888")
+        assert info["org"] == "Google LLC"
+        assert info["latitude"] is None
+
+    def test_integer_bounds(self, sample_csv):
+        """Range bounds may be given as integers."""
+        info = RangeTable.from_csv(sample_csv).lookup("1.1.2.5")
+        assert info["city"] == "Fuzhou"
+        assert info["region"] is None
+
+    def test_misses(self, sample_csv):
+        """Addresses outside every range, and invalid input, are misses."""
+        table = RangeTable.from_csv(sample_csv)
+        assert len(table) == 4
+        assert table.lookup("9.9.9.9") is None
+        assert table.lookup("0.0.0.1") is None
+        assert table.lookup("999.999.999.999") is None
+
+    def test_strings_are_interned(self, sample_csv):
+        """Repeated values are stored once in the string table."""
+        table = RangeTable.from_csv(sample_csv)
+        assert table.strings.count("Mountain View") == 1
+
+    def test_same_shape_as_fallback(self, sample_csv):
+        """Local results are the same IPRecord type ip-api.com results are mapped to."""
+        info = RangeTable.from_csv(sample_csv).lookup("1.1.1.1")
+        assert type(info) is type(ip_lookup._map_ip_api({}, "1.1.1.1"))
+
+
+class TestMappedRangeTable:
+    """Test cases for the compiled, memory-mapped range format."""
+
+    def test_compiled_matches_in_memory(self, sample_csv, tmp_path):
+        """Every lookup gives the same answer from the compiled file as from the CSV."""
+        table = RangeTable.from_csv(sample_csv)
+        compiled = str(tmp_path / "ranges.bin")
+        table.compile(compiled)
+        mapped = MappedRangeTable(compiled)
+        assert len(mapped) == len(table)
+        for ip in ("8.8.8.8", "8.8.8.0", "8.8.8.255", "8.8.9.0", "1.1.1.1", "1.1.2.5",
+                   "0.0.0.0", "255.255.255.255", "2001:4860::", "2001:4860:4860::8888", "::1", "bogus"):
+            assert mapped.lookup(ip) == table.lookup(ip)
+        mapped.close()
+
+    def test_load_range_table_detects_format(self, sample_csv, tmp_path):
+        """load_range_table memory-maps compiled files and parses CSVs."""
+        compiled = str(tmp_path / "ranges.bin")
+        RangeTable.from_csv(sample_csv).compile(compiled)
+        assert isinstance(load_range_table(compiled), MappedRangeTable)
+        assert isinstance(load_range_table(sample_csv), RangeTable)
+
+    def test_rejects_other_files(self, sample_csv):
+        """Opening a non-compiled file as a mapped table fails clearly."""
+        with pytest.raises(ValueError):
+            MappedRangeTable(sample_csv)
+
+
+class TestLocalFirstLookup:
+    """Test cases for get_ip_info consulting the local database first."""
+
+    def test_local_hit_skips_network(self, sample_csv, monkeypatch):
+        """A local hit is returned without touching caches or providers."""
+        monkeypatch.setattr(ip_lookup, "RANGES_PATH", sample_csv)
+        monkeypatch.setattr(ip_lookup, "_range_table", None)
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", lambda ip: pytest.fail("should not fetch"))
+        assert ip_lookup.get_ip_info("1.1.1.1")["city"] == "Brisbane"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,65 @@
+"""
+Unit tests for the normalized lookup record.
+"""
+import pytest
+import sys
+import os
+import json
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_record import RECORD_FIELDS, IPRecord
+
+
+class TestIPRecord:
+    """Test cases for building and reading IPRecord."""
+
+    def test_both_providers_normalize_to_the_same_record(self):
+        """ipapi.co and ip-api.com answers for one place become equal records."""
+        ipapi = {"ip": "8.8.8.8", "city": "Mountain View", "region": "California", "country": "US",
+                 "country_name": "United States", "latitude": 37.386, "longitude": -122.0838,
+                 "timezone": "America/Los_Angeles", "org": "Google LLC", "asn": "AS15169",
+                 "postal": "94035", "network": "8.8.8.0/24", "currency": "USD"}
+        ip_api = {"status": "success", "query": "8.8.8.8", "city": "Mountain View", "regionName": "California",
+                  "countryCode": "US", "country": "United States", "lat": 37.386, "lon": -122.0838,
+                  "timezone": "America/Los_Angeles", "isp": "Google LLC", "as": "AS15169 Google LLC",
+                  "zip": "94035"}
+        record, provider = ip_lookup.interpret_ipapi(ipapi, "8.8.8.8")
+        assert provider == ip_lookup.PROVIDER_IPAPI
+        assert record == ip_lookup.interpret_ip_api(ip_api, "8.8.8.8")
+        assert record._fields == RECORD_FIELDS
+
+    def test_strings_are_interned_and_coordinates_floats(self):
+        """Repeated location strings share one object and string coordinates are parsed."""
+        first = IPRecord.from_mapping({"ip": "1.1.1.1", "country_name": "".join(["Aus", "tralia"]),
+                                       "latitude": "-33.86"})
+        second = IPRecord.from_mapping({"ip": "1.1.1.2", "country_name": "".join(["Austr", "alia"])})
+        assert first.country_name is second.country_name
+        assert first.latitude == -33.86
+        assert second.latitude is None
+
+    def test_dict_style_access(self):
+        """get(), string indexing and to_dict() work like the provider dicts did."""
+        record = IPRecord.from_mapping({"ip": "1.1.1.1", "city": "Sydney", "postal": ""})
+        assert record["city"] == "Sydney"
+        assert record.get("postal", "N/A") is None
+        assert record.get("currency", "N/A") == "N/A"
+        assert record[0] == "1.1.1.1"
+        with pytest.raises(KeyError):
+            record["currency"]
+        assert json.loads(json.dumps(record.to_dict()))["city"] == "Sydney"
+
+    def test_membership_is_by_field_name(self):
+        """`in`, keys() and dict() see field names, like a provider dict."""
+        record = IPRecord.from_mapping({"ip": "1.1.1.1", "city": "Sydney"})
+        assert "city" in record
+        assert "currency" not in record
+        assert "Sydney" not in record
+        assert tuple(record.keys()) == RECORD_FIELDS
+        assert dict(record) == record.to_dict() == dict(record.items())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,124 @@
+"""
+Unit tests for the persistent SQLite lookup store.
+"""
+import pytest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_lookup
+from ip_cache import TTLCache
+from ip_record import IPRecord
+from ip_store import LookupStore
+
+
+class TestLookupStore:
+    """Test cases for durable storage, expiry and provenance."""
+
+    def test_round_trip_with_provenance(self, tmp_path):
+        """Stored records keep their data, provider and fetch time."""
+        store = LookupStore(str(tmp_path / "lookups.db"))
+        store.set("8.8.8.8", {"ip": "8.8.8.8", "city": "Mountain View"}, "ipapi.co", fetched_at=1000.0)
+        record = store.get("8.8.8.8", now=1001.0)
+        assert record["data"]["city"] == "Mountain View"
+        assert record["provider"] == "ipapi.co"
+        assert record["fetched_at"] == 1000.0
+        store.close()
+
+    def test_uses_wal_mode(self, tmp_path):
+        """The database is opened in write-ahead-log mode."""
+        store = LookupStore(str(tmp_path / "lookups.db"))
+        mode = store._connection().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode.lower() == "wal"
+        store.close()
+
+    def test_survives_reopen(self, tmp_path):
+        """A second store on the same file sees earlier records."""
+        path = str(tmp_path / "lookups.db")
+        LookupStore(path).set("1.1.1.1", {"ip": "1.1.1.1"}, "ip-api.com")
+        assert LookupStore(path).get("1.1.1.1")["provider"] == "ip-api.com"
+
+    def test_expiry_and_purge(self, tmp_path):
+        """Expired records are hidden and removed by purge_expired."""
+        store = LookupStore(str(tmp_path / "lookups.db"), ttl=10, negative_ttl=2)
+        store.set("good", {"ip": "good"}, "ipapi.co", fetched_at=0.0)
+        store.set("bad", None, "ipapi.co", fetched_at=0.0)
+        assert store.get("bad", now=1.0)["data"] is None
+        assert store.get("bad", now=2.0) is None
+        assert store.get("good", now=5.0) is not None
+        assert store.purge_expired(now=10.0) == 2
+        assert len(store) == 0
+        store.close()
+
+
+class TestRequestHistory:
+    """Test cases for the decayed request history used by cache warm-up."""
+
+    def test_ranks_by_decayed_request_count(self, tmp_path):
+        """Frequent IPs rank first, and old traffic counts for less than recent traffic."""
+        store = LookupStore(str(tmp_path / "lookups.db"), history_half_life=100)
+        for _ in range(8):
+            store.record_hit("1.1.1.1")
+        store.record_hit("8.8.8.8")
+        assert store.flush_hits(now=0.0) == 2
+        assert store.hot_ips(10) == ["1.1.1.1", "8.8.8.8"]
+
+        # Three half-lives later 1.1.1.1's 8 requests weigh 1; two fresh ones for 8.8.8.8 win
+        store.record_hit("8.8.8.8")
+        store.record_hit("8.8.8.8")
+        store.flush_hits(now=300.0)
+        assert store.hot_ips(1) == ["8.8.8.8"]
+        store.close()
+
+    def test_history_survives_reopen_and_is_bounded(self, tmp_path):
+        """Counts pending at close() are written, and purging keeps history_size IPs."""
+        path = str(tmp_path / "lookups.db")
+        store = LookupStore(path)
+        for count, ip in enumerate(("1.1.1.1", "8.8.8.8", "9.9.9.9")):
+            for _ in range(count + 1):
+                store.record_hit(ip)
+        store.close()
+
+        store = LookupStore(path, history_size=2)
+        assert store.hot_ips(10) == ["9.9.9.9", "8.8.8.8", "1.1.1.1"]
+        store.purge_expired()
+        assert store.hot_ips(10) == ["9.9.9.9", "8.8.8.8"]
+        store.close()
+
+
+class TestStoreReadThrough:
+    """Test cases for get_ip_info reading through the store."""
+
+    def test_store_hit_skips_network(self, tmp_path, monkeypatch):
+        """A record persisted by an earlier process is served without fetching."""
+        path = str(tmp_path / "lookups.db")
+        LookupStore(path).set("8.8.8.8", {"ip": "8.8.8.8"}, "ipapi.co")
+
+        def fail_fetch(ip):
+            raise AssertionError("should not fetch")
+
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", path)
+        monkeypatch.setattr(ip_lookup, "_lookup_store", None)
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", fail_fetch)
+        info = ip_lookup.get_ip_info("8.8.8.8")
+        assert isinstance(info, IPRecord)
+        assert info.ip == "8.8.8.8"
+        ip_lookup._lookup_store.close()
+
+    def test_network_failures_are_not_persisted(self, tmp_path, monkeypatch):
+        """Lookups no provider answered stay out of the durable store."""
+        path = str(tmp_path / "lookups.db")
+        monkeypatch.setattr(ip_lookup, "STORE_PATH", path)
+        monkeypatch.setattr(ip_lookup, "_lookup_store", None)
+        monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=8, ttl=60))
+        monkeypatch.setattr(ip_lookup, "fetch_ip_info", lambda ip: (None, None))
+        assert ip_lookup.get_ip_info("8.8.8.8") is None
+        assert len(ip_lookup._lookup_store) == 0
+        ip_lookup._lookup_store.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,171 @@
+"""
+Unit tests for cache warm-up from historical traffic.
+"""
+import pytest
+import sys
+import os
+import threading
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ip_info
+import ip_lookup
+import ip_warmup
+from ip_cache import TTLCache
+from ip_guard import ProviderGuard
+from ip_info import app
+from ip_warmup import FETCHED, FRESH, NO_QUOTA, PROMOTED, Warmer, hot_ips, read_history_file, warm_ip
+
+
+@pytest.fixture
+def lookup_state(tmp_path, monkeypatch):
+    """Fresh cache and store, with every upstream fetch recorded instead of sent."""
+    fetches = []
+
+    def fake_fetch(ip):
+        fetches.append(ip)
+        return {"ip": ip, "city": "Mountain View"}, "ipapi.co"
+
+    monkeypatch.setattr(ip_lookup, "STORE_PATH", str(tmp_path / "lookups.db"))
+    monkeypatch.setattr(ip_lookup, "_lookup_store", None)
+    monkeypatch.setattr(ip_lookup, "ip_info_cache", TTLCache(maxsize=64, ttl=3600))
+    monkeypatch.setattr(ip_lookup, "fetch_ip_info", fake_fetch)
+    yield fetches
+    if ip_lookup._lookup_store is not None:
+        ip_lookup._lookup_store.close()
+
+
+class TestHistory:
+    """Test cases for ranking earlier traffic."""
+
+    def test_history_file_ranked_by_count_then_recency(self, tmp_path):
+        """Access-log lines are counted by client IP; ties go to the most recent IP."""
+        path = tmp_path / "access.log"
+        path.write_text(
+            '8.8.8.8 - - [17/Oct/2026:10:00:00 +0000] "GET / HTTP/1.1" 200 512\n'
+            "1.1.1.1\n"
+            "not an address\n"
+            "8.8.8.8\n"
+            "9.9.9.9\n"
+        )
+        assert read_history_file(str(path), 10) == ["8.8.8.8", "9.9.9.9", "1.1.1.1"]
+
+    def test_requests_are_recorded_and_ranked(self, lookup_state):
+        """Lookups count towards the store's history; non-routable IPs are never candidates."""
+        for ip in ("1.1.1.1", "8.8.8.8", "8.8.8.8", "192.168.1.1"):
+            ip_lookup.get_ip_info(ip)
+        ip_lookup.get_lookup_store().flush_hits()
+        assert hot_ips(10, path="") == ["8.8.8.8", "1.1.1.1"]
+
+
+class TestWarmIP:
+    """Test cases for warming a single IP."""
+
+    def test_fresh_entry_is_left_alone(self, lookup_state):
+        ip_lookup.ip_info_cache.set("8.8.8.8", {"ip": "8.8.8.8"})
+        assert warm_ip("8.8.8.8", refresh_ahead=60) == FRESH
+        assert lookup_state == []
+
+    def test_stored_record_is_promoted_without_fetching(self, lookup_state):
+        """After a restart, records still valid in the store warm the cache for free."""
+        ip_lookup.get_lookup_store().set("8.8.8.8", {"ip": "8.8.8.8", "city": "Mountain View"}, "ipapi.co")
+        assert warm_ip("8.8.8.8", refresh_ahead=60) == PROMOTED
+        assert ip_lookup.ip_info_cache.peek("8.8.8.8").city == "Mountain View"
+        assert lookup_state == []
+
+    def test_expiring_entry_is_fetched(self, lookup_state):
+        """An entry expiring within refresh_ahead is fetched again."""
+        ip_lookup.ip_info_cache.set("8.8.8.8", {"ip": "8.8.8.8"})
+        assert warm_ip("8.8.8.8", refresh_ahead=7200) == FETCHED
+        assert lookup_state == ["8.8.8.8"]
+
+    def test_reserved_quota_is_not_spent(self, lookup_state, monkeypatch):
+        """Warm-up leaves the reserved share of a provider's quota to real users."""
+        guard = ProviderGuard(None, limits={"ipapi.co": (10, 60), "ip-api.com": (10, 60)})
+        monkeypatch.setattr(ip_lookup, "_provider_guard", guard)
+        for _ in range(5):
+            guard.acquire("ipapi.co")
+        assert warm_ip("8.8.8.8", reserve=0.5) == NO_QUOTA
+        assert warm_ip("8.8.8.8", reserve=0.2) == FETCHED
+        assert lookup_state == ["8.8.8.8"]
+
+
+class TestWarmer:
+    """Test cases for background passes and readiness."""
+
+    def test_ready_after_first_pass(self):
+        """The warmer turns ready once its first pass finished, and keeps passing on the interval."""
+        warmed = []
+        second_pass = threading.Event()
+
+        def warm(ip):
+            warmed.append(ip)
+            if len(warmed) > 2:
+                second_pass.set()
+            return FETCHED if ip == "8.8.8.8" else NO_QUOTA
+
+        warmer = Warmer(candidates=lambda: ["8.8.8.8", "1.1.1.1"], warm=warm, interval=0.01, workers=1)
+        assert not warmer.ready
+        warmer.start()
+        assert warmer.wait_ready(5)
+        assert second_pass.wait(5)
+        warmer.stop()
+
+        status = warmer.status()
+        assert status["state"] == "ready"
+        assert status["last_pass"]["candidates"] == 2
+        assert status["last_pass"][FETCHED] == 1
+        assert status["last_pass"][NO_QUOTA] == 1
+
+    def test_failing_warm_does_not_stop_the_pass(self):
+        def warm(ip):
+            if ip == "1.1.1.1":
+                raise RuntimeError("boom")
+            return FETCHED
+
+        outcomes = Warmer(candidates=lambda: ["1.1.1.1", "8.8.8.8"], warm=warm).run_pass()
+        assert outcomes == {"failed": 1, FETCHED: 1}
+
+    def test_ready_endpoint(self, monkeypatch):
+        """/api/ready answers 503 while warming and 200 once the first pass finished."""
+        warmer = Warmer(candidates=lambda: [], warm=warm_ip)
+        monkeypatch.setattr(ip_warmup, "warmer", warmer)
+        client = app.test_client()
+
+        response = client.get("/api/ready")
+        assert response.status_code == 503
+        assert response.get_json()["ready"] is False
+
+        warmer.run_pass()
+        response = client.get("/api/ready")
+        assert response.status_code == 200
+        assert response.get_json()["state"] == "ready"
+
+    def test_background_tasks_start_once_per_process(self, monkeypatch):
+        """Warm-up and the My-IP schedule start once per process, again in a forked worker."""
+        started = []
+        monkeypatch.setattr(ip_info, "BACKGROUND_TASKS", True)
+        monkeypatch.setattr(ip_info, "_background_pid", None)
+        monkeypatch.setattr(ip_warmup, "start_warmup", lambda: started.append("warmup"))
+        monkeypatch.setattr(ip_lookup, "MY_IP_REFRESH_INTERVAL", 60)
+        monkeypatch.setattr(ip_lookup.my_ip_info_cache, "start", lambda interval: started.append(interval))
+        ip_info.start_background_tasks()
+        ip_info.start_background_tasks()
+        assert started == [60, "warmup"]
+        # As seen by a child process: started by its parent, not by itself
+        monkeypatch.setattr(ip_info, "_background_pid", os.getpid() + 1)
+        ip_info._restart_background_tasks_in_child()
+        assert started == [60, "warmup", 60, "warmup"]
+
+    def test_background_tasks_can_be_disabled(self, monkeypatch):
+        started = []
+        monkeypatch.setattr(ip_info, "BACKGROUND_TASKS", False)
+        monkeypatch.setattr(ip_info, "_background_pid", None)
+        monkeypatch.setattr(ip_warmup, "start_warmup", lambda: started.append("warmup"))
+        ip_info.start_background_tasks()
+        assert started == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])